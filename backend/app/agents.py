@@ -1,17 +1,26 @@
-from typing import Dict, Any, List
-import json
+from typing import Callable, Dict, Any, List, Optional
+from uuid import UUID
+import asyncio
+import logging
+import orjson
+import re
+import time
 import pandas as pd
 from langchain.agents import create_openai_tools_agent, AgentExecutor
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
-from .config import settings, get_llm_instance
-from .tools import MARKETING_TOOLS
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from .config import settings, get_llm_instance, get_embeddings_instance
+from .tools import MARKETING_TOOLS, query_marketing_data, create_visualization, analyze_data_insights
+from .routing import route_template
+from .cache import SemanticResponseCache, RedisSemanticResponseCache, get_redis_client
 
-# Debug: Print tools at import time
-print(f"🔍 Imported {len(MARKETING_TOOLS)} tools:")
-for tool in MARKETING_TOOLS:
-    print(f"   - {tool.name}")
-print("---")
+logger = logging.getLogger(__name__)
+
+# Debug: list tools at import time
+if logger.isEnabledFor(logging.DEBUG):
+    logger.debug("🔍 Imported %d tools: %s", len(MARKETING_TOOLS), ", ".join(t.name for t in MARKETING_TOOLS))
 
 # Initialize the LLM with error handling and provider support
 try:
@@ -21,16 +30,39 @@ try:
     
     provider = "Azure OpenAI" if settings.is_azure_openai else "OpenAI"
     model = settings.azure_openai_deployment if settings.is_azure_openai else settings.llm_model
-    print(f"🤖 LLM initialized: {provider} - {model}")
+    logger.info("🤖 LLM initialized: %s - %s", provider, model)
     
 except Exception as e:
-    print(f"⚠️  LLM initialization failed: {e}")
-    print("📝 Please configure either OpenAI or Azure OpenAI credentials in the .env file")
+    logger.warning("⚠️  LLM initialization failed: %s", e)
+    logger.warning("📝 Please configure either OpenAI or Azure OpenAI credentials in the .env file")
     llm = None
 
-# Define the agent prompt
-AGENT_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", """You are a senior financial services marketing analyst with access to powerful analytics tools.
+# Semantic cache so paraphrased questions reuse an earlier agent response
+embeddings = get_embeddings_instance() if settings.semantic_cache_enabled else None
+_redis = get_redis_client()
+if _redis is not None:
+    response_cache = RedisSemanticResponseCache(
+        _redis,
+        threshold=settings.semantic_cache_threshold,
+        ttl_seconds=settings.semantic_cache_ttl_seconds
+    )
+else:
+    response_cache = SemanticResponseCache(
+        threshold=settings.semantic_cache_threshold,
+        ttl_seconds=settings.semantic_cache_ttl_seconds
+    )
+
+# Image markdown, <img> tags and inline base64 images the LLM may emit despite the prompt rules
+_IMAGE_CONTENT_RE = re.compile(
+    r'!\[.*?\]\(data:image/[^)]+\)'
+    r'|<img[^>]*>'
+    r'|data:image/[^,]+,[A-Za-z0-9+/=]+'
+)
+
+# Define the agent prompt. It holds no per-request values (filters travel in the user
+# message) so the tools + system prefix is byte-identical across calls and processes,
+# which lets the provider's prompt cache reuse it
+SYSTEM_PROMPT = """You are a senior financial services marketing analyst with access to powerful analytics tools.
 
 Your role is to help executives and marketing leaders understand their marketing performance, loan portfolio metrics, and customer acquisition data.
 
@@ -90,14 +122,13 @@ IMPORTANT VISUALIZATION RULES:
 BE EFFICIENT: 
 - Don't repeat tool calls with the same parameters
 - If you have the data needed, proceed directly to visualization and insights
+- Issue independent tool calls together in a single step (e.g. several query_marketing_data templates at once, or create_visualization and analyze_data_insights on the same data) - they run in parallel
 - Provide concise, actionable insights focusing on business impact
 
-Current filters available:
-- Date range: {date_from} to {date_to}
-- Segment: {segment}
-- Channel: {channel}
+The applied filters (date range, segment, channel) are listed with each question. Always consider them when querying data."""
 
-Always consider these filters when querying data."""),
+AGENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
     ("user", "{input}"),
     MessagesPlaceholder(variable_name="agent_scratchpad"),
 ])
@@ -108,28 +139,275 @@ def create_marketing_agent() -> AgentExecutor:
     if llm is None:
         raise ValueError("OpenAI API key not configured. Please set OPENAI_API_KEY in your .env file.")
     
-    print(f"🔧 Creating agent with {len(MARKETING_TOOLS)} tools")
-    for tool in MARKETING_TOOLS:
-        print(f"   - {tool.name}: {tool.description[:50]}...")
+    logger.debug("🔧 Creating agent with %d tools", len(MARKETING_TOOLS))
     
     # Create the agent
     agent = create_openai_tools_agent(llm, MARKETING_TOOLS, AGENT_PROMPT)
-    print(f"✅ Agent created successfully")
+    logger.debug("✅ Agent created successfully")
     
-    # Create the agent executor with timeout controls
+    # Create the agent executor with timeout controls. Under ainvoke, all tool calls the LLM
+    # emits in one step are dispatched together with asyncio.gather (sync tools run in worker threads)
     agent_executor = AgentExecutor(
         agent=agent, 
         tools=MARKETING_TOOLS, 
-        verbose=True,
+        verbose=logger.isEnabledFor(logging.DEBUG),
         handle_parsing_errors=True,
         max_iterations=10,  # Optimized for faster responses
-        max_execution_time=120,  # Faster timeout
-        return_intermediate_steps=True  # Ensure we get tool call information
+        max_execution_time=120  # Faster timeout
     )
     
     return agent_executor
 
-def process_chat_request(message: str, filters: Dict[str, Any], history: List[Dict[str, str]]) -> Dict[str, Any]:
+class ToolResultCollector(AsyncCallbackHandler):
+    """Collects tables, plots and insights from tool outputs as each tool call finishes"""
+    
+    def __init__(self):
+        self.tables: List[Dict[str, Any]] = []
+        self.plots: List[Dict[str, Any]] = []
+        self.insights: Dict[str, Any] = {}
+        self.steps = 0
+    
+    async def on_tool_end(self, output: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self.collect(kwargs.get('name', ''), output)
+    
+    def collect(self, tool_name: str, output: Any) -> None:
+        """Parse one tool output into tables, plots or insights"""
+        self.steps += 1
+        observation = getattr(output, 'content', output)
+        logger.debug("Step %d: %s", self.steps, tool_name)
+        if not observation:
+            return
+        
+        try:
+            if tool_name == 'query_marketing_data':
+                data = orjson.loads(observation)
+                if 'data' in data and not data.get('error'):
+                    columns = data.get('columns', [])
+                    # Repack records into rows in one vectorized pass, in column order
+                    rows = pd.DataFrame.from_records(data['data'], columns=columns).to_numpy(dtype=object).tolist()
+                    self.tables.append({
+                        "name": data.get('template', 'query_result'),
+                        "columns": columns,
+                        "rows": rows
+                    })
+            
+            elif tool_name == 'create_visualization':
+                chart_data = orjson.loads(observation)
+                logger.debug("📊 Chart data keys: %s", list(chart_data.keys()))
+                if 'plotly_json' in chart_data and not chart_data.get('error'):
+                    logger.debug("✅ Adding plot: %s", chart_data.get('title', 'Chart'))
+                    self.plots.append({
+                        "title": chart_data.get('title', 'Chart'),
+                        "plotly_json": chart_data['plotly_json'],
+                        "chart_type": chart_data.get('chart_type', 'unknown'),
+                        "data_points": chart_data.get('data_points', 0),
+                        "columns_used": chart_data.get('columns_used', {})
+                    })
+                else:
+                    logger.warning("❌ Chart data missing plotly_json or has error: %s", chart_data.get('error', 'Unknown error'))
+            
+            elif tool_name == 'analyze_data_insights':
+                insight_data = orjson.loads(observation)
+                if not insight_data.get('error'):
+                    self.insights.update(insight_data)
+                    
+        except (orjson.JSONDecodeError, KeyError):
+            return
+
+def _prompt_filters(filters: Dict[str, Any]) -> Dict[str, str]:
+    """Effective filter values (defaults applied) as shown to the model and passed to tools"""
+    return {
+        "date_from": filters.get('date_from', '2025-08-01'),
+        "date_to": filters.get('date_to', '2025-09-18'),
+        "segment": filters.get('segment', 'All'),
+        "channel": filters.get('channel', 'All')
+    }
+
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Direct tool-calling loop (default path): tool schemas are converted once and the
+# chat completions API is driven without the AgentExecutor machinery
+_TOOL_SCHEMAS = [convert_to_openai_tool(t) for t in MARKETING_TOOLS]
+_TOOLS_BY_NAME = {t.name: t for t in MARKETING_TOOLS}
+AGENT_MAX_ITERATIONS = 10
+AGENT_MAX_EXECUTION_TIME = 120
+
+async def _run_tool_call(tool_call, collector: ToolResultCollector) -> Dict[str, str]:
+    """Execute one tool call from the model and return its tool message"""
+    tool_name = tool_call.function.name
+    tool = _TOOLS_BY_NAME.get(tool_name)
+    if tool is None:
+        output = f"{tool_name} is not a valid tool, try one of [{', '.join(_TOOLS_BY_NAME)}]."
+    else:
+        try:
+            output = await tool.ainvoke(orjson.loads(tool_call.function.arguments or "{}"))
+        except Exception as e:
+            output = orjson.dumps({"error": str(e)}).decode()
+    
+    collector.collect(tool_name, output)
+    return {"role": "tool", "tool_call_id": tool_call.id, "content": str(output)}
+
+async def _stream_turn(model: str, messages: List[Dict[str, Any]], on_text: Callable[[str], None]):
+    """
+    One streamed completion turn: after each content delta, on_text gets the turn's text so
+    far, cleaned like the final answer. A turn that turns out to call tools is not part of
+    the answer, so its text is retracted with on_text("") and nothing more is passed on.
+    
+    Returns:
+        The assembled assistant message, tool calls included
+    """
+    from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+    from openai.types.chat.chat_completion_message_tool_call import Function
+    
+    stream = await llm.root_async_client.chat.completions.create(
+        model=model,
+        messages=messages,
+        tools=_TOOL_SCHEMAS,
+        temperature=llm.temperature,
+        stream=True
+    )
+    content = ""
+    # Tool calls arrive in fragments, keyed by their index in the message
+    calls: Dict[int, Dict[str, Any]] = {}
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content += delta.content
+            if not calls:
+                on_text(_IMAGE_CONTENT_RE.sub('', content))
+        for fragment in delta.tool_calls or []:
+            if not calls and content:
+                on_text("")
+            call = calls.setdefault(fragment.index, {"id": "", "name": "", "arguments": []})
+            if fragment.id:
+                call["id"] = fragment.id
+            if fragment.function is not None:
+                call["name"] += fragment.function.name or ""
+                call["arguments"].append(fragment.function.arguments or "")
+    
+    tool_calls = [
+        ChatCompletionMessageToolCall(
+            id=call["id"], type="function",
+            function=Function(name=call["name"], arguments="".join(call["arguments"]))
+        )
+        for _, call in sorted(calls.items())
+    ]
+    return ChatCompletionMessage(role="assistant", content=content or None, tool_calls=tool_calls or None)
+
+async def run_agent(input_text: str, collector: ToolResultCollector,
+                    on_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Run the tool-calling loop against the OpenAI/Azure client directly.
+    
+    All tool calls the model emits in one turn are executed concurrently. With on_text,
+    completions are streamed and the answer text so far is passed on as it is generated.
+    
+    Returns:
+        The final assistant message content
+    """
+    if llm is None:
+        raise ValueError("OpenAI API key not configured. Please set OPENAI_API_KEY in your .env file.")
+    
+    messages: List[Dict[str, Any]] = [
+        _SYSTEM_MESSAGE,
+        {"role": "user", "content": input_text}
+    ]
+    model = getattr(llm, 'deployment_name', None) or llm.model_name
+    started = time.monotonic()
+    
+    for _ in range(AGENT_MAX_ITERATIONS):
+        if time.monotonic() - started > AGENT_MAX_EXECUTION_TIME:
+            break
+        
+        if on_text is None:
+            completion = await llm.root_async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                tools=_TOOL_SCHEMAS,
+                temperature=llm.temperature
+            )
+            message = completion.choices[0].message
+        else:
+            message = await _stream_turn(model, messages, on_text)
+        if not message.tool_calls:
+            return message.content or ""
+        
+        messages.append(message.model_dump(exclude_none=True))
+        messages.extend(await asyncio.gather(*(_run_tool_call(tc, collector) for tc in message.tool_calls)))
+    
+    return "Agent stopped due to iteration limit or time limit."
+
+# Shared executor for the LangChain path (USE_LANGCHAIN_AGENT=true): the agent holds
+# no per-request state (filters arrive via the input)
+_agent_executor: AgentExecutor | None = None
+
+def get_marketing_agent() -> AgentExecutor:
+    """Return the shared marketing agent executor, building it on first use"""
+    global _agent_executor
+    if _agent_executor is None:
+        _agent_executor = create_marketing_agent()
+    return _agent_executor
+
+_TEMPLATE_TITLES = {
+    "KPI_SUMMARY": "KPI Summary",
+    "TOP_CAMPAIGNS": "Top Campaigns by ROAS",
+    "ALL_CAMPAIGNS": "All Campaigns",
+    "CHANNEL_PERFORMANCE": "Channel Performance",
+    "SEGMENT_ANALYSIS": "Segment Performance"
+}
+
+# (insight key, label, format) for the fast-path summary, in display order
+_INSIGHT_LINES = [
+    ("total_spend", "Marketing spend", "${:,.2f}"),
+    ("total_revenue", "Revenue", "${:,.2f}"),
+    ("total_roas", "ROAS", "{:.2f}x"),
+    ("total_applications", "Applications", "{:,}"),
+    ("total_funded_loans", "Funded loans", "{:,}"),
+    ("funding_rate", "Funding rate", "{:.1f}%"),
+    ("top_campaign", "Top campaign by ROAS", "{}"),
+    ("top_channel", "Top channel by ROAS", "{}"),
+    ("top_segment", "Top segment by ROAS", "{}")
+]
+
+async def _run_fast_path(template: str, filters: Dict[str, Any], collector: ToolResultCollector) -> Optional[str]:
+    """
+    Answer a routed template question by calling the tools directly.
+    
+    Returns:
+        The summary answer, or None if the query failed and the agent should handle it
+    """
+    prompt_filters = _prompt_filters(filters)
+    data = await query_marketing_data.ainvoke({
+        "template": template,
+        "date_from": prompt_filters["date_from"],
+        "date_to": prompt_filters["date_to"],
+        "segment": None if prompt_filters["segment"] in (None, "All") else prompt_filters["segment"],
+        "channel": None if prompt_filters["channel"] in (None, "All") else prompt_filters["channel"]
+    })
+    if orjson.loads(data).get("error"):
+        return None
+    collector.collect("query_marketing_data", data)
+    
+    title = _TEMPLATE_TITLES.get(template, template)
+    chart, insights = await asyncio.gather(
+        create_visualization.ainvoke({"title": title, "data": data, "chart_type": "auto"}),
+        analyze_data_insights.ainvoke({"data": data})
+    )
+    collector.collect("create_visualization", chart)
+    collector.collect("analyze_data_insights", insights)
+    
+    lines = [f"**{title}** ({prompt_filters['date_from']} to {prompt_filters['date_to']})"]
+    if not collector.insights.get("data_points"):
+        lines.append("No data found for the selected filters.")
+    for key, label, fmt in _INSIGHT_LINES:
+        if key in collector.insights:
+            lines.append(f"- {label}: {fmt.format(collector.insights[key])}")
+    return "\n".join(lines)
+
+async def process_chat_request(message: str, filters: Dict[str, Any], history: List[Dict[str, str]],
+                               on_text: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     """
     Process a chat request using the LangChain agent
     
@@ -137,44 +415,76 @@ def process_chat_request(message: str, filters: Dict[str, Any], history: List[Di
         message: User's question
         filters: Date range and other filters
         history: Chat history
+        on_text: Called with the cleaned answer text so far as the model generates it (direct
+            tool-calling path only; fast-path and cached answers arrive whole in the result)
         
     Returns:
         Dict containing the response, tables, plots, and metadata
     """
     try:
-        # Create the agent
-        agent_executor = create_marketing_agent()
+        # Plain template questions ("top campaigns", "channel performance") skip the LLM entirely
+        template = route_template(message)
+        if template is not None:
+            collector = ToolResultCollector()
+            try:
+                answer = await _run_fast_path(template, filters, collector)
+            except Exception as e:
+                logger.warning("⚠️  Fast path failed for %s, falling back to the agent: %s", template, e)
+                answer = None
+            if answer is not None:
+                logger.debug("⚡ Fast path: %s", template)
+                return {
+                    "answer": answer,
+                    "actions": ["sql", "visualize", "explain"],
+                    "sql": {"template": template, "params": filters},
+                    "tables": collector.tables,
+                    "plots": collector.plots,
+                    "extras": {"takeaways": list(collector.insights.items()), "agent_used": "fast_path"}
+                }
         
-        # Prepare the input with filters
+        # Serve paraphrases of earlier questions (same filters) from the semantic cache
+        question_embedding = None
+        if embeddings is not None:
+            try:
+                question_embedding = await embeddings.aembed_query(message)
+                cached_response = response_cache.lookup(question_embedding, filters)
+                if cached_response is not None:
+                    logger.debug("⚡ Semantic cache hit")
+                    return cached_response
+            except Exception as e:
+                logger.warning("⚠️  Semantic cache lookup failed: %s", e)
+        
+        # Prepare the input with filters (the only per-request part of the prompt)
+        prompt_filters = _prompt_filters(filters)
         input_text = f"""
         User Question: {message}
         
         Applied Filters:
-        - Date From: {filters.get('date_from', 'N/A')}
-        - Date To: {filters.get('date_to', 'N/A')}  
-        - Segment: {filters.get('segment', 'All')}
-        - Channel: {filters.get('channel', 'All')}
+        - Date From: {prompt_filters['date_from']}
+        - Date To: {prompt_filters['date_to']}  
+        - Segment: {prompt_filters['segment']}
+        - Channel: {prompt_filters['channel']}
         
         Please analyze the data and provide insights.
         """
         
-        # Run the agent with timeout handling
+        # Run the agent with timeout handling; tool outputs are parsed as each tool finishes
+        collector = ToolResultCollector()
         try:
-            print(f"🚀 Starting agent with input: {input_text[:100]}...")
-            print(f"🛠️ Available tools: {[tool.name for tool in MARKETING_TOOLS]}")
+            logger.debug("🚀 Starting agent with input: %.100s...", input_text)
             
-            response = agent_executor.invoke({
-                "input": input_text,
-                "date_from": filters.get('date_from', '2025-08-01'),
-                "date_to": filters.get('date_to', '2025-09-18'),
-                "segment": filters.get('segment', 'All'),
-                "channel": filters.get('channel', 'All')
-            })
+            if settings.use_langchain_agent:
+                agent_executor = get_marketing_agent()
+                response = await agent_executor.ainvoke(
+                    {"input": input_text},
+                    config={"callbacks": [collector]}
+                )
+            else:
+                response = {"output": await run_agent(input_text, collector, on_text)}
             
-            print(f"✅ Agent execution completed")
-            print(f"📊 Response keys: {list(response.keys())}")
+            logger.debug("✅ Agent execution completed")
         except Exception as e:
-            print(f"Agent execution error: {e}")
+            logger.error("Agent execution error: %s", e)
             return {
                 "answer": f"I encountered an issue while processing your request: {str(e)}. Please try a simpler question or check if the data is available.",
                 "actions": ["error"],
@@ -188,71 +498,20 @@ def process_chat_request(message: str, filters: Dict[str, Any], history: List[Di
         agent_response = response.get("output", "")
         
         # Remove any image markdown or base64 content that the LLM might have generated
-        import re
-        # Remove ![image](data:image/...) patterns
-        agent_response = re.sub(r'!\[.*?\]\(data:image/[^)]+\)', '', agent_response)
-        # Remove <img> tags
-        agent_response = re.sub(r'<img[^>]*>', '', agent_response)
-        # Remove standalone base64 image references
-        agent_response = re.sub(r'data:image/[^,]+,[A-Za-z0-9+/=]+', '', agent_response)
-        
-        print(f"🧹 Cleaned response length: {len(agent_response)} chars")
+        agent_response = _IMAGE_CONTENT_RE.sub('', agent_response)
         
-        # Parse any data and charts from the intermediate steps
-        tables = []
-        plots = []
-        insights = {}
+        logger.debug("🧹 Cleaned response length: %d chars", len(agent_response))
         
-        # Look through intermediate steps for tool outputs
-        intermediate_steps = response.get('intermediate_steps', [])
-        print(f"🔍 Agent completed {len(intermediate_steps)} steps")
+        tables = collector.tables
+        plots = collector.plots
+        insights = collector.insights
+        logger.debug("🔍 Agent completed %d steps", collector.steps)
         
-        if len(intermediate_steps) == 0:
-            print("❌ NO TOOLS CALLED! Agent bypassed tool usage entirely.")
-            print(f"📝 Agent response: {response.get('output', '')[:200]}...")
-            print("🔧 This suggests the agent is not using tools properly.")
-        
-        for i, step in enumerate(intermediate_steps):
-            if len(step) >= 2:
-                action, observation = step[0], step[1]
-                tool_name = action.tool if hasattr(action, 'tool') else ''
-                print(f"Step {i+1}: {tool_name}")
-                
-                try:
-                    if tool_name == 'query_marketing_data' and observation:
-                        data = json.loads(observation)
-                        if 'data' in data and not data.get('error'):
-                            tables.append({
-                                "name": data.get('template', 'query_result'),
-                                "columns": data.get('columns', []),
-                                "rows": [list(row.values()) for row in data['data']]
-                            })
-                    
-                    elif tool_name == 'create_visualization' and observation:
-                        print(f"📊 Visualization tool called successfully!")
-                        chart_data = json.loads(observation)
-                        print(f"📊 Chart data keys: {list(chart_data.keys())}")
-                        if 'plotly_json' in chart_data and not chart_data.get('error'):
-                            print(f"✅ Adding plot: {chart_data.get('title', 'Chart')}")
-                            plots.append({
-                                "title": chart_data.get('title', 'Chart'),
-                                "plotly_json": chart_data['plotly_json'],
-                                "chart_type": chart_data.get('chart_type', 'unknown'),
-                                "data_points": chart_data.get('data_points', 0),
-                                "columns_used": chart_data.get('columns_used', {})
-                            })
-                        else:
-                            print(f"❌ Chart data missing plotly_json or has error: {chart_data.get('error', 'Unknown error')}")
-                    
-                    elif tool_name == 'analyze_data_insights' and observation:
-                        insight_data = json.loads(observation)
-                        if not insight_data.get('error'):
-                            insights.update(insight_data)
-                            
-                except (json.JSONDecodeError, KeyError):
-                    continue
+        if collector.steps == 0:
+            logger.warning("❌ NO TOOLS CALLED! Agent bypassed tool usage entirely. Response: %.200s...",
+                           response.get('output', ''))
         
-        return {
+        result = {
             "answer": agent_response,
             "actions": ["sql", "visualize", "explain"] if tables or plots else ["explain"],
             "sql": {"template": "langchain_query", "params": filters} if tables else None,
@@ -261,6 +520,11 @@ def process_chat_request(message: str, filters: Dict[str, Any], history: List[Di
             "extras": {"takeaways": list(insights.items()) if insights else [], "agent_used": "langchain"}
         }
         
+        if question_embedding is not None:
+            response_cache.store(question_embedding, filters, result)
+        
+        return result
+        
     except Exception as e:
         return {
             "answer": f"I encountered an error while analyzing your request: {str(e)}. Please try rephrasing your question or check if the data is available for the specified time period.",
@@ -282,4 +546,4 @@ def route(message: str, filters: Dict[str, Any], history: List[Dict[str, str]])
 
 def run_plan(message: str, plan: Dict[str, Any]) -> Dict[str, Any]:
     """Legacy run_plan function - now delegates to LangChain agent"""
-    return process_chat_request(message, plan.get("params", {}), [])
\ No newline at end of file
+    return asyncio.run(process_chat_request(message, plan.get("params", {}), []))
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+Response caching for the marketing analytics agent.
+
+Byte-identical chat requests (same message, filters and history) are answered
+from an exact response cache. Paraphrased questions ("show top campaigns",
+"which campaigns performed best") are matched by embedding similarity so they
+can reuse a previous agent response instead of running the full tool-calling
+loop again.
+
+When REDIS_URL is set, responses, rendered charts and template query results are
+also kept in Redis so every worker process shares the same cache.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_redis_client():
+    """Shared Redis client when REDIS_URL is configured, otherwise None."""
+    if not settings.redis_url:
+        return None
+    try:
+        import redis
+
+        client = redis.Redis.from_url(settings.redis_url)
+        client.ping()
+        return client
+    except Exception as e:
+        logger.warning("⚠️  Redis unavailable, using in-process caches only: %s", e)
+        return None
+
+
+def redis_get(key: str) -> Optional[bytes]:
+    """Fetch a cached payload; misses and Redis errors return None."""
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        return client.get(key)
+    except Exception as e:
+        logger.warning("⚠️  Redis read failed for %s: %s", key, e)
+        return None
+
+
+def redis_set(key: str, payload: bytes, ttl_seconds: int) -> None:
+    """Store a serialized payload under key with a TTL; errors are logged and ignored."""
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.set(key, payload, ex=ttl_seconds)
+    except Exception as e:
+        logger.warning("⚠️  Redis write failed for %s: %s", key, e)
+
+
+def filters_key(filters: Dict[str, Any]) -> str:
+    """Stable hash of the applied filters, used to partition cached responses."""
+    payload = orjson.dumps(filters or {}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def question_key(question: str, filters: Dict[str, Any]) -> str:
+    """Hash of a question (case and whitespace normalized) together with its filters."""
+    normalized = " ".join(question.lower().split())
+    payload = orjson.dumps({"q": normalized, "f": filters or {}}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def chat_key(message: str, filters: Dict[str, Any], history: List[Dict[str, Any]]) -> str:
+    """Content hash of a chat request; identical requests always map to the same key."""
+    payload = orjson.dumps({"m": message, "f": filters or {}, "h": history or []}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+class ExactResponseCache:
+    """Responses keyed by a content hash (e.g. chat_key), in Redis when configured, else an in-process LRU."""
+
+    def __init__(self, ttl_seconds: int = 600, max_entries: int = 1024, key_prefix: str = "chat:"):
+        self.key_prefix = key_prefix
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (stored_at, response)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.ttl_seconds <= 0:
+            return None
+        if get_redis_client() is not None:
+            payload = redis_get(self.key_prefix + key)
+            return orjson.loads(payload) if payload is not None else None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, response: Dict[str, Any]) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        if get_redis_client() is not None:
+            redis_set(self.key_prefix + key, orjson.dumps(response), self.ttl_seconds)
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SemanticResponseCache:
+    """In-process cache of chat responses keyed by question embedding similarity."""
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: int = 3600, max_entries_per_filter: int = 256):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_filter = max_entries_per_filter
+        # filters key -> list of (unit embedding, stored_at, response)
+        self._entries: Dict[str, List[Tuple[np.ndarray, float, Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, embedding: List[float], filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the cached response most similar to the embedding, if above threshold."""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._entries.get(filters_key(filters))
+            if not entries:
+                return None
+
+            # Drop expired entries while we hold the lock
+            entries[:] = [e for e in entries if now - e[1] < self.ttl_seconds]
+            if not entries:
+                return None
+
+            best = self._best_match([e[0] for e in entries], query)
+            if best is not None:
+                return entries[best][2]
+        return None
+
+    def _best_match(self, vectors: List[np.ndarray], query: np.ndarray) -> Optional[int]:
+        """Index of the most similar vector if its cosine similarity reaches the threshold."""
+        scores = np.stack(vectors) @ query
+        best = int(np.argmax(scores))
+        return best if scores[best] >= self.threshold else None
+
+    def store(self, embedding: List[float], filters: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """Cache a response under the question embedding and filter set."""
+        entry = (self._normalize(embedding), time.monotonic(), response)
+
+        with self._lock:
+            entries = self._entries.setdefault(filters_key(filters), [])
+            entries.append(entry)
+            if len(entries) > self.max_entries_per_filter:
+                del entries[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisSemanticResponseCache(SemanticResponseCache):
+    """Semantic response cache stored in Redis so all workers share hits."""
+
+    key_prefix = "semantic:"
+
+    def __init__(self, client, threshold: float = 0.95, ttl_seconds: int = 3600, max_entries_per_filter: int = 256):
+        super().__init__(threshold, ttl_seconds, max_entries_per_filter)
+        self.client = client
+
+    def lookup(self, embedding: List[float], filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            raw_entries = self.client.lrange(self.key_prefix + filters_key(filters), 0, -1)
+        except Exception as e:
+            logger.warning("⚠️  Redis semantic cache read failed: %s", e)
+            return None
+        cutoff = time.time() - self.ttl_seconds
+        entries = [e for e in map(orjson.loads, raw_entries) if e["stored_at"] > cutoff]
+        if not entries:
+            return None
+
+        vectors = [np.asarray(e["embedding"], dtype=np.float32) for e in entries]
+        best = self._best_match(vectors, self._normalize(embedding))
+        return entries[best]["response"] if best is not None else None
+
+    def store(self, embedding: List[float], filters: Dict[str, Any], response: Dict[str, Any]) -> None:
+        key = self.key_prefix + filters_key(filters)
+        entry = orjson.dumps(
+            {"embedding": self._normalize(embedding), "stored_at": time.time(), "response": response},
+            option=orjson.OPT_SERIALIZE_NUMPY
+        )
+        try:
+            pipe = self.client.pipeline()
+            pipe.rpush(key, entry)
+            pipe.ltrim(key, -self.max_entries_per_filter, -1)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("⚠️  Redis semantic cache write failed: %s", e)
+
+    def clear(self) -> None:
+        try:
+            for key in self.client.scan_iter(self.key_prefix + "*"):
+                self.client.delete(key)
+        except Exception as e:
+            logger.warning("⚠️  Redis semantic cache clear failed: %s", e)
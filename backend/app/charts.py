@@ -5,27 +5,121 @@ This module provides enhanced chart generation capabilities for the visualizatio
 It includes various chart types, styling options, and intelligent chart recommendations.
 """
 
-import json
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import orjson
 import pandas as pd
+from pandas.api import types as ptypes
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from plotly.io.json import to_json_plotly
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+from .cache import redis_get, redis_set
+from .config import settings
+
+def _orjson_default(obj: Any) -> Any:
+    # orjson hands over arrays it cannot write natively (object dtype, e.g. string categories)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError
+
+
+def fig_to_json_bytes(obj: Any) -> bytes:
+    """
+    Serialize a chart result (or figure dict) to JSON bytes.
+    
+    orjson writes the numpy arrays in plotly figure dicts directly (object arrays via
+    tolist); anything else it cannot handle falls back to plotly's own encoder.
+    """
+    try:
+        return orjson.dumps(obj, default=_orjson_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        return to_json_plotly(obj).encode()
+
+
+def classify_columns(df: pd.DataFrame) -> Dict[str, List[str]]:
+    """Split columns into numeric, categorical and datetime in a single dtype pass."""
+    column_types = {"numeric": [], "categorical": [], "datetime": []}
+    for col, dtype in df.dtypes.items():
+        if ptypes.is_bool_dtype(dtype):
+            continue
+        if ptypes.is_numeric_dtype(dtype):
+            column_types["numeric"].append(col)
+        elif ptypes.is_datetime64_any_dtype(dtype):
+            column_types["datetime"].append(col)
+        elif (ptypes.is_object_dtype(dtype) or ptypes.is_string_dtype(dtype)
+              or isinstance(dtype, pd.CategoricalDtype)):
+            # string[pyarrow] columns from SQLAgent.run are not object dtype
+            column_types["categorical"].append(col)
+    return column_types
+
+
 class ChartGenerator:
     """Enhanced chart generator with multiple chart types and intelligent suggestions."""
     
+    _DATE_COLUMN_RE = re.compile('date|time|month|day', re.IGNORECASE)
+    _PRIORITY_KEYWORDS = ('revenue', 'spend', 'roas', 'cost', 'amount', 'value', 'count')
+    
     def __init__(self):
         self.default_colors = [
             '#667eea', '#764ba2', '#f093fb', '#f5576c',
             '#4facfe', '#00f2fe', '#43e97b', '#38f9d7'
         ]
+        # LRU of rendered charts keyed by data hash + chart arguments; clear() to invalidate
+        self.cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self.cache_maxsize = 256
+        self._cache_lock = threading.Lock()
         
     def create_chart(self, data: str, chart_type: str, title: str, 
                     x_column: str = None, y_column: str = None, 
                     color_column: str = None, **kwargs) -> Dict[str, Any]:
         """
+        Create a chart from data, reusing the rendered spec for identical inputs.
+        
+        Takes the same arguments as _render_chart. Error results are not cached.
+        """
+        digest = hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+        key = (digest, chart_type, title, x_column, y_column, color_column,
+               tuple(sorted(kwargs.items())))
+        
+        with self._cache_lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                return cached
+        
+        # Charts rendered by other workers are shared through Redis when configured
+        redis_key = "chart:" + hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        shared = redis_get(redis_key)
+        if shared is not None:
+            result = orjson.loads(shared)
+        else:
+            result = self._render_chart(data, chart_type, title, x_column, y_column, color_column, **kwargs)
+            if result.get("chart_type") != "error":
+                redis_set(redis_key, fig_to_json_bytes(result), settings.redis_chart_ttl_seconds)
+        
+        if result.get("chart_type") != "error":
+            with self._cache_lock:
+                self.cache[key] = result
+                self.cache.move_to_end(key)
+                if len(self.cache) > self.cache_maxsize:
+                    self.cache.popitem(last=False)
+        return result
+    
+    def _render_chart(self, data: str, chart_type: str, title: str, 
+                    x_column: str = None, y_column: str = None, 
+                    color_column: str = None, **kwargs) -> Dict[str, Any]:
+        """
         Create a chart from data with enhanced options.
         
         Args:
@@ -42,7 +136,7 @@ class ChartGenerator:
         """
         try:
             # Parse data
-            parsed_data = json.loads(data)
+            parsed_data = orjson.loads(data)
             if isinstance(parsed_data, list):
                 df = pd.DataFrame(parsed_data)
             elif isinstance(parsed_data, dict):
@@ -67,7 +161,7 @@ class ChartGenerator:
                 
                 return {
                     "title": title,
-                    "plotly_json": json.loads(fig.to_json()),
+                    "plotly_json": fig.to_plotly_json(),
                     "chart_type": "empty",
                     "data_points": 0,
                     "columns_used": {
@@ -77,20 +171,24 @@ class ChartGenerator:
                     }
                 }
             
+            # Column kinds for auto-detection and the chart builders, from the query hint when present
+            column_types = self._column_types(parsed_data, df)
+            
             # Auto-detect columns if not specified
             if not x_column or not y_column:
-                x_column, y_column = self._auto_detect_columns(df, chart_type)
+                x_column, y_column = self._auto_detect_columns(df, chart_type, column_types)
             
             # Create chart based on type
             chart_method = getattr(self, f'_create_{chart_type}_chart', self._create_bar_chart)
-            fig = chart_method(df, title, x_column, y_column, color_column, **kwargs)
+            fig = chart_method(df, title, x_column, y_column, color_column,
+                               column_types=column_types, **kwargs)
             
             # Apply consistent styling
             self._apply_styling(fig)
             
             return {
                 "title": title,
-                "plotly_json": json.loads(fig.to_json()),
+                "plotly_json": fig.to_plotly_json(),
                 "chart_type": chart_type,
                 "columns_used": {
                     "x": x_column,
@@ -105,7 +203,7 @@ class ChartGenerator:
             fallback_fig = self._create_empty_chart(f"{title} (Error: {str(e)[:50]}...)")
             return {
                 "title": title,
-                "plotly_json": json.loads(fallback_fig.to_json()),
+                "plotly_json": fallback_fig.to_plotly_json(),
                 "chart_type": "error",
                 "error": str(e),
                 "data_points": 0,
@@ -116,21 +214,32 @@ class ChartGenerator:
                 }
             }
     
-    def _auto_detect_columns(self, df: pd.DataFrame, chart_type: str) -> tuple:
+    def _column_types(self, parsed_data: Any, df: pd.DataFrame) -> Dict[str, List[str]]:
+        """Column kinds sent along by query_marketing_data, else classified from the frame."""
+        hints = parsed_data.get('column_types') if isinstance(parsed_data, dict) else None
+        if isinstance(hints, dict):
+            try:
+                column_types = {kind: list(hints[kind]) for kind in ("numeric", "categorical", "datetime")}
+            except (KeyError, TypeError):
+                column_types = None
+            if column_types and all(col in df.columns for cols in column_types.values() for col in cols):
+                return column_types
+        return classify_columns(df)
+    
+    def _auto_detect_columns(self, df: pd.DataFrame, chart_type: str,
+                             column_types: Dict[str, List[str]] = None) -> tuple:
         """Auto-detect appropriate columns for chart axes."""
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-        datetime_cols = df.select_dtypes(include=['datetime']).columns.tolist()
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+        column_types = column_types or classify_columns(df)
+        numeric_cols = column_types["numeric"]
+        categorical_cols = column_types["categorical"]
         
         # Default selections based on common patterns
         x_col = None
         y_col = None
         
         # Look for date/time columns for x-axis
-        for col in df.columns:
-            if any(keyword in col.lower() for keyword in ['date', 'time', 'month', 'day']):
-                x_col = col
-                break
+        date_match = self._DATE_COLUMN_RE.search
+        x_col = next((col for col in df.columns if isinstance(col, str) and date_match(col)), None)
         
         # If no date column, use first categorical or first column
         if not x_col:
@@ -141,15 +250,10 @@ class ChartGenerator:
         
         # For y-axis, prefer numeric columns
         if numeric_cols:
-            # Look for revenue, spend, roas, etc.
-            priority_keywords = ['revenue', 'spend', 'roas', 'cost', 'amount', 'value', 'count']
-            for keyword in priority_keywords:
-                for col in numeric_cols:
-                    if keyword in col.lower():
-                        y_col = col
-                        break
-                if y_col:
-                    break
+            # Look for revenue, spend, roas, etc. (keyword order wins over column order)
+            lowered = [(col, str(col).lower()) for col in numeric_cols]
+            y_col = next((col for keyword in self._PRIORITY_KEYWORDS
+                          for col, name in lowered if keyword in name), None)
             
             # If no priority column found, use first numeric column
             if not y_col:
@@ -221,15 +325,22 @@ class ChartGenerator:
         """Create a heatmap."""
         # Pivot data for heatmap if needed
         if len(df.columns) >= 3:
-            pivot_df = df.pivot_table(values=y_col, index=x_col, 
-                                    columns=color_col if color_col else df.columns[2], 
-                                    aggfunc='sum')
+            # Straight sum cross-tab; groupby/unstack skips pivot_table's generic aggregation machinery
+            pivot_df = df.groupby([x_col, color_col if color_col else df.columns[2]])[y_col].sum().unstack()
             fig = px.imshow(pivot_df, title=title, aspect="auto")
         else:
             # Simple correlation heatmap for numeric data
-            numeric_df = df.select_dtypes(include=['number'])
+            column_types = kwargs.get('column_types') or classify_columns(df)
+            numeric_df = df[column_types["numeric"]]
             if not numeric_df.empty:
-                corr_matrix = numeric_df.corr()
+                values = numeric_df.to_numpy(dtype=float)
+                if np.isnan(values).any():
+                    # pandas handles missing values with pairwise-complete observations
+                    corr_matrix = numeric_df.corr()
+                else:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        corr = np.atleast_2d(np.corrcoef(values, rowvar=False))
+                    corr_matrix = pd.DataFrame(corr, index=numeric_df.columns, columns=numeric_df.columns)
                 fig = px.imshow(corr_matrix, title=title, aspect="auto")
             else:
                 fig = self._create_empty_chart(title)
@@ -249,7 +360,8 @@ class ChartGenerator:
         )
         
         # Add line chart if there's another numeric column
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+        column_types = kwargs.get('column_types') or classify_columns(df)
+        numeric_cols = column_types["numeric"]
         if len(numeric_cols) > 1:
             second_y_col = numeric_cols[1] if numeric_cols[1] != y_col else numeric_cols[0]
             fig.add_trace(
@@ -314,7 +426,7 @@ class ChartGenerator:
     def suggest_chart_type(self, data: str) -> str:
         """Suggest the best chart type based on data characteristics."""
         try:
-            parsed_data = json.loads(data)
+            parsed_data = orjson.loads(data)
             if isinstance(parsed_data, list):
                 df = pd.DataFrame(parsed_data)
             else:
@@ -323,8 +435,9 @@ class ChartGenerator:
             if df.empty:
                 return "bar"
             
-            numeric_cols = len(df.select_dtypes(include=['number']).columns)
-            categorical_cols = len(df.select_dtypes(include=['object', 'category']).columns)
+            column_types = self._column_types(parsed_data, df)
+            numeric_cols = len(column_types["numeric"])
+            categorical_cols = len(column_types["categorical"])
             rows = len(df)
             
             # Decision logic for chart type
@@ -1,27 +1,67 @@
-from pydantic import BaseModel
+import importlib.metadata
+import logging
+from functools import cached_property, lru_cache
+from typing import List
+from pydantic import computed_field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 import os
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
+# Load environment variables from .env file. This is the only place .env is parsed:
+# Settings reads the populated environment rather than parsing the file again
 load_dotenv()
 
-class Settings(BaseModel):
+logger = logging.getLogger(__name__)
+
+class Settings(BaseSettings):
+    """Application settings, read once from the environment (and .env)"""
+    
+    model_config = SettingsConfigDict(case_sensitive=False, frozen=True, extra="ignore")
+    
     # OpenAI Configuration
-    openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
-    llm_model: str = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    openai_api_key: str = ""
+    llm_model: str = "gpt-4o-mini"
     
     # Azure OpenAI Configuration
-    azure_openai_api_key: str = os.getenv("AZURE_OPENAI_API_KEY", "")
-    azure_openai_endpoint: str = os.getenv("AZURE_OPENAI_ENDPOINT", "")
-    azure_openai_deployment: str = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o-mini")
-    azure_openai_api_version: str = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+    azure_openai_api_key: str = ""
+    azure_openai_endpoint: str = ""
+    azure_openai_deployment: str = "gpt-4o-mini"
+    azure_openai_api_version: str = "2024-02-15-preview"
+    azure_openai_embedding_deployment: str = ""
+    
+    # Embeddings (semantic response cache)
+    embedding_model: str = "text-embedding-3-small"
     
     # Provider Selection
-    llm_provider: str = os.getenv("LLM_PROVIDER", "openai")  # "openai" or "azure"
+    llm_provider: str = "openai"  # "openai" or "azure"
     
     # Other Settings
-    database_url: str = os.getenv("DATABASE_URL", "sqlite:///marketing.db")
-    allowed_origins: str = os.getenv("ALLOWED_ORIGINS", "*")
+    database_url: str = "sqlite:///marketing.db"
+    allowed_origins: str = "*"
+    
+    # Agent: the direct OpenAI tool-calling loop is the default; set to use LangChain's AgentExecutor
+    use_langchain_agent: bool = False
+    
+    # Caching
+    chat_cache_ttl_seconds: int = 600
+    # SQL written by the model for a question and filter set (Redis or in-process)
+    dynamic_sql_cache_ttl_seconds: int = 3600
+    # Off by default: every chat that misses the fast path would pay an embeddings call first
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_ttl_seconds: int = 3600
+    # Shared Redis cache across workers (optional; empty keeps caches in-process)
+    redis_url: str = ""
+    redis_chart_ttl_seconds: int = 86400
+    redis_query_ttl_seconds: int = 900
+    
+    @computed_field
+    @cached_property
+    def allowed_origins_list(self) -> List[str]:
+        """CORS origins parsed once; a bare "*" stays a single wildcard entry"""
+        if self.allowed_origins.strip() == "*":
+            return ["*"]
+        return [o.strip() for o in self.allowed_origins.split(",") if o.strip()]
     
     @property
     def is_azure_openai(self) -> bool:
@@ -36,23 +76,81 @@ class Settings(BaseModel):
         """Check if standard OpenAI is configured"""
         return bool(self.openai_api_key)
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Process-wide settings instance"""
+    return Settings()
+
+settings = get_settings()
 
+if settings.is_azure_openai:
+    # Keep Azure OpenAI traffic off any configured proxy
+    _azure_domain = settings.azure_openai_endpoint.replace('https://', '').replace('http://', '')
+    os.environ['NO_PROXY'] = f"{_azure_domain},*.openai.azure.com,*.azure.com"
+    
+    # Set environment variables for Azure OpenAI (some versions require this)
+    os.environ["AZURE_OPENAI_API_KEY"] = settings.azure_openai_api_key
+    os.environ["AZURE_OPENAI_ENDPOINT"] = settings.azure_openai_endpoint
+    os.environ["AZURE_OPENAI_API_VERSION"] = settings.azure_openai_api_version
+
+@lru_cache(maxsize=1)
+def get_http_clients():
+    """
+    Process-wide (sync, async) httpx clients shared by every LLM and embeddings instance.
+    
+    One keep-alive pool serves all models, so LLM calls from any temperature variant
+    and the semantic cache's embedding calls reuse warm TLS connections.
+    """
+    import httpx
+    
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+    timeout = httpx.Timeout(60.0, connect=5.0)
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+def _http_client_kwargs() -> dict:
+    http_client, http_async_client = get_http_clients()
+    return {"http_client": http_client, "http_async_client": http_async_client}
+
+def _azure_llm_kwargs(temperature: float) -> dict:
+    """
+    AzureChatOpenAI constructor arguments for the installed langchain-openai.
+    
+    The version is read from package metadata, so the right keyword names are
+    used directly instead of trying each constructor signature in turn.
+    """
+    version = tuple(int(part) for part in importlib.metadata.version("langchain-openai").split(".")[:2])
+    kwargs = {
+        "azure_endpoint": settings.azure_openai_endpoint,
+        "azure_deployment": settings.azure_openai_deployment,
+        "temperature": temperature,
+        "timeout": 60,
+        "max_retries": 3,
+        **_http_client_kwargs()
+    }
+    if version >= (0, 1):
+        kwargs.update(api_version=settings.azure_openai_api_version, api_key=settings.azure_openai_api_key)
+    else:
+        kwargs.update(openai_api_version=settings.azure_openai_api_version, openai_api_key=settings.azure_openai_api_key)
+    return kwargs
+
+@lru_cache(maxsize=8)
 def get_llm_instance(temperature: float = 0.1):
     """
     Get the appropriate LLM instance based on configuration.
     
+    Instances are cached per temperature, so the client and its connection
+    pool are built once per process.
+    
     Returns:
         ChatOpenAI or AzureChatOpenAI instance based on provider settings
     """
     try:
         if settings.is_azure_openai:
             from langchain_openai import AzureChatOpenAI
-            import os
             
-            print(f"🔷 Using Azure OpenAI with deployment: {settings.azure_openai_deployment}")
-            print(f"🔷 Endpoint: {settings.azure_openai_endpoint}")
-            print(f"🔷 API Version: {settings.azure_openai_api_version}")
+            logger.debug("🔷 Using Azure OpenAI deployment=%s endpoint=%s api_version=%s",
+                         settings.azure_openai_deployment, settings.azure_openai_endpoint,
+                         settings.azure_openai_api_version)
             
             # Disable proxy settings for Azure OpenAI to prevent proxy errors
             proxy_env_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
@@ -64,61 +162,10 @@ def get_llm_instance(temperature: float = 0.1):
                 if var in os.environ:
                     del os.environ[var]
             
-            # Set NO_PROXY to include Azure OpenAI endpoint
-            azure_domain = settings.azure_openai_endpoint.replace('https://', '').replace('http://', '')
-            os.environ['NO_PROXY'] = f"{azure_domain},*.openai.azure.com,*.azure.com"
-            
-            # Set environment variables for Azure OpenAI (some versions require this)
-            os.environ["AZURE_OPENAI_API_KEY"] = settings.azure_openai_api_key
-            os.environ["AZURE_OPENAI_ENDPOINT"] = settings.azure_openai_endpoint
-            os.environ["AZURE_OPENAI_API_VERSION"] = settings.azure_openai_api_version
-            
             try:
-                # Method 1: Using openai_api_key parameter (newer versions)
-                llm = AzureChatOpenAI(
-                    azure_endpoint=settings.azure_openai_endpoint,
-                    azure_deployment=settings.azure_openai_deployment,
-                    openai_api_version=settings.azure_openai_api_version,
-                    openai_api_key=settings.azure_openai_api_key,
-                    temperature=temperature,
-                    # Explicitly disable proxy usage
-                    timeout=60,
-                    max_retries=3
-                )
-                print("✅ Azure OpenAI initialized successfully (Method 1)")
+                llm = AzureChatOpenAI(**_azure_llm_kwargs(temperature))
+                logger.debug("✅ Azure OpenAI initialized successfully")
                 return llm
-                
-            except Exception as e1:
-                print(f"🔷 Method 1 failed: {e1}")
-                try:
-                    # Method 2: Using api_key parameter (older versions)
-                    llm = AzureChatOpenAI(
-                        azure_endpoint=settings.azure_openai_endpoint,
-                        azure_deployment=settings.azure_openai_deployment,
-                        api_version=settings.azure_openai_api_version,
-                        api_key=settings.azure_openai_api_key,
-                        temperature=temperature,
-                        timeout=60,
-                        max_retries=3
-                    )
-                    print("✅ Azure OpenAI initialized successfully (Method 2)")
-                    return llm
-                    
-                except Exception as e2:
-                    print(f"🔷 Method 2 failed: {e2}")
-                    try:
-                        # Method 3: Environment variables only
-                        llm = AzureChatOpenAI(
-                            azure_deployment=settings.azure_openai_deployment,
-                            temperature=temperature,
-                            timeout=60,
-                            max_retries=3
-                        )
-                        print("✅ Azure OpenAI initialized successfully (Method 3)")
-                        return llm
-                    except Exception as e3:
-                        print(f"🔷 Method 3 failed: {e3}")
-                        raise e3
             
             finally:
                 # Restore original proxy settings
@@ -129,24 +176,66 @@ def get_llm_instance(temperature: float = 0.1):
         elif settings.is_openai_configured:
             from langchain_openai import ChatOpenAI
             
-            print(f"🔶 Using OpenAI with model: {settings.llm_model}")
+            logger.debug("🔶 Using OpenAI with model: %s", settings.llm_model)
             return ChatOpenAI(
                 api_key=settings.openai_api_key,
                 model=settings.llm_model,
-                temperature=temperature
+                temperature=temperature,
+                **_http_client_kwargs()
             )
             
         else:
-            print("❌ No LLM provider configured. Please set either OpenAI or Azure OpenAI credentials.")
-            print(f"📋 Current config - Provider: {settings.llm_provider}")
-            print(f"📋 OpenAI key configured: {bool(settings.openai_api_key)}")
-            print(f"📋 Azure key configured: {bool(settings.azure_openai_api_key)}")
-            print(f"📋 Azure endpoint configured: {bool(settings.azure_openai_endpoint)}")
+            logger.warning("❌ No LLM provider configured. Please set either OpenAI or Azure OpenAI credentials.")
+            logger.debug("📋 Provider: %s, OpenAI key: %s, Azure key: %s, Azure endpoint: %s",
+                         settings.llm_provider, bool(settings.openai_api_key),
+                         bool(settings.azure_openai_api_key), bool(settings.azure_openai_endpoint))
             return None
             
     except Exception as e:
-        print(f"❌ Error initializing LLM: {e}")
-        print(f"📋 Provider: {settings.llm_provider}")
-        print(f"📋 Azure configured: {settings.is_azure_openai}")
-        print(f"📋 OpenAI configured: {settings.is_openai_configured}")
-        return None
\ No newline at end of file
+        logger.error("❌ Error initializing LLM: %s", e)
+        logger.debug("📋 Provider: %s, Azure configured: %s, OpenAI configured: %s",
+                     settings.llm_provider, bool(settings.is_azure_openai), settings.is_openai_configured)
+        return None
+
+def invalidate_llm_cache() -> None:
+    """Drop cached LLM instances (e.g. after changing settings in tests)"""
+    get_llm_instance.cache_clear()
+
+def get_embeddings_instance():
+    """
+    Get the embeddings model used by the semantic response cache.
+    
+    Returns:
+        OpenAIEmbeddings or AzureOpenAIEmbeddings instance, or None when no
+        embeddings model is configured for the selected provider
+    """
+    try:
+        if settings.is_azure_openai:
+            if not settings.azure_openai_embedding_deployment:
+                return None
+            from langchain_openai import AzureOpenAIEmbeddings
+            
+            return AzureOpenAIEmbeddings(
+                azure_endpoint=settings.azure_openai_endpoint,
+                azure_deployment=settings.azure_openai_embedding_deployment,
+                api_version=settings.azure_openai_api_version,
+                api_key=settings.azure_openai_api_key,
+                timeout=30,
+                max_retries=2,
+                **_http_client_kwargs()
+            )
+            
+        elif settings.is_openai_configured:
+            from langchain_openai import OpenAIEmbeddings
+            
+            return OpenAIEmbeddings(
+                api_key=settings.openai_api_key,
+                model=settings.embedding_model,
+                **_http_client_kwargs()
+            )
+            
+        return None
+            
+    except Exception as e:
+        logger.error("❌ Error initializing embeddings: %s", e)
+        return None
@@ -1,16 +1,38 @@
-import json
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import ORJSONResponse
-from .models import ChatRequest, ChatResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+import orjson
+from pydantic import ValidationError
+from .models import BatchRequest, ChatRequest, ChatResponse
 from .config import settings
-from .agents import process_chat_request
+from .cache import ExactResponseCache, chat_key
 
-app = FastAPI(default_response_class=ORJSONResponse, title="AI Financial Marketing Chatbot API")
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pre-open the database pool so the first dashboard requests don't pay connect cost
+    from .sql import get_engine, warm_pool
+    try:
+        await asyncio.to_thread(warm_pool, get_engine(settings.database_url))
+    except Exception as e:
+        logging.getLogger(__name__).warning("⚠️  Database pool warm-up failed: %s", e)
+    yield
+
+# Identical chat requests (e.g. dashboard polling) are answered without re-running the agent
+_chat_cache = ExactResponseCache(ttl_seconds=settings.chat_cache_ttl_seconds)
+
+app = FastAPI(default_response_class=ORJSONResponse, title="AI Financial Marketing Chatbot API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[o.strip() for o in settings.allowed_origins.split(",")],
+    allow_origins=settings.allowed_origins_list,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -20,44 +42,193 @@ app.add_middleware(
 async def health():
     return {"status": "ok"}
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
+async def _chat_request(request: Request) -> ChatRequest:
+    """
+    The /chat body parsed and validated in one pass by Pydantic's JSON parser.
+    
+    A ChatRequest body parameter would have FastAPI json.loads the body into dicts and then
+    validate those; history can run to dozens of turns. Errors keep FastAPI's 422 shape.
+    """
     try:
-        filters = req.filters.model_dump()
-        history = [t.model_dump() for t in req.history]
-        result = process_chat_request(req.message, filters, history)
+        return ChatRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+def _inline_refs(node: Any, defs: dict) -> Any:
+    if isinstance(node, dict):
+        if "$ref" in node:
+            return _inline_refs(defs[node["$ref"].rsplit("/", 1)[-1]], defs)
+        return {key: _inline_refs(value, defs) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_inline_refs(value, defs) for value in node]
+    return node
+
+# The chat routes read the raw body, so their request schema is documented by hand
+# (with nested models inlined, as there is no components entry for them)
+_CHAT_SCHEMA = ChatRequest.model_json_schema()
+_CHAT_OPENAPI = {"requestBody": {"required": True, "content": {"application/json": {
+    "schema": _inline_refs(_CHAT_SCHEMA, _CHAT_SCHEMA.pop("$defs", {}))
+}}}}
+
+def _chat_inputs(req: ChatRequest):
+    """Filters, history and cache key of a chat request"""
+    # Unset filters are omitted so downstream defaults apply; history turns are flat
+    # field-only models, so their __dict__ already is the plain dict
+    filters = req.filters.model_dump(exclude_none=True)
+    history = [t.__dict__ for t in req.history]
+    return filters, history, chat_key(req.message, filters, history)
+
+@app.post("/chat", response_model=ChatResponse, openapi_extra=_CHAT_OPENAPI)
+async def chat(req: ChatRequest = Depends(_chat_request)):
+    try:
+        # Imported on first use: the agent pulls in the LangChain/OpenAI stack, which
+        # /health and the direct-SQL endpoints never need
+        from .agents import process_chat_request
+        
+        filters, history, key = _chat_inputs(req)
+        result = _chat_cache.get(key)
+        if result is None:
+            result = await process_chat_request(req.message, filters, history)
+            # Failed runs are not cached so a retry gets a fresh attempt
+            if "error" not in result.get("extras", {}):
+                _chat_cache.set(key, result)
         return ChatResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/kpi")
-async def get_kpis(filters: dict):
-    """Get KPI summary data directly without LLM"""
+@app.post("/chat/stream", openapi_extra=_CHAT_OPENAPI)
+async def chat_stream(req: ChatRequest = Depends(_chat_request)):
+    """
+    /chat as newline-delimited JSON: {"type": "delta", "text": ...} lines append to the answer
+    while it is generated, a {"type": "reset", "text": ...} line replaces the text shown so far
+    (text retracted by cleanup or from a tool-calling turn), then one {"type": "result",
+    "response": ...} line carries the full ChatResponse
+    """
+    from .agents import process_chat_request
+    
+    filters, history, key = _chat_inputs(req)
+    
+    async def events():
+        result = _chat_cache.get(key)
+        if result is None:
+            texts: asyncio.Queue = asyncio.Queue()
+            
+            async def run() -> dict:
+                try:
+                    return await process_chat_request(req.message, filters, history, on_text=texts.put_nowait)
+                finally:
+                    texts.put_nowait(None)
+            
+            # The agent reports the answer text so far; only what changed goes on the wire
+            task = asyncio.create_task(run())
+            sent = ""
+            while (text := await texts.get()) is not None:
+                if not text.startswith(sent):
+                    yield orjson.dumps({"type": "reset", "text": text}) + b"\n"
+                elif len(text) > len(sent):
+                    yield orjson.dumps({"type": "delta", "text": text[len(sent):]}) + b"\n"
+                sent = text
+            result = await task
+            if "error" not in result.get("extras", {}):
+                _chat_cache.set(key, result)
+        response = ChatResponse(**result).model_dump(mode="json")
+        yield orjson.dumps({"type": "result", "response": response}) + b"\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+def _run_template(template: str, filters: dict) -> dict:
+    """
+    Run a SQL template straight to row dicts (no DataFrame) in the query tool's response shape.
+    
+    Blocking: the async endpoints call it through asyncio.to_thread so the event loop keeps
+    serving /chat while the query runs.
+    """
+    from .sql import get_sql_agent
+    
+    params = {
+        'date_from': filters.get('date_from', '2025-08-01'),
+        'date_to': filters.get('date_to', '2025-09-18'),
+        'segment': filters.get('segment'),
+        'channel': filters.get('channel')
+    }
     try:
-        from .tools import query_marketing_data
-        result = query_marketing_data.invoke({
-            'template': 'KPI_SUMMARY',
-            'date_from': filters.get('date_from', '2025-08-01'),
-            'date_to': filters.get('date_to', '2025-09-18'),
-            'segment': filters.get('segment'),
-            'channel': filters.get('channel')
-        })
-        return json.loads(result) if isinstance(result, str) else result
+        rows = get_sql_agent(settings.database_url).run_raw(template, params)
+    except Exception as e:
+        return {"error": str(e), "template": template}
+    return {
+        "template": template,
+        "params": params,
+        "data": rows,
+        "columns": list(rows[0]) if rows else [],
+        "row_count": len(rows)
+    }
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+def _arrow_stream(result: dict) -> bytes:
+    """Encode template rows as an Arrow IPC stream; template and params travel as schema metadata"""
+    import pyarrow as pa
+    
+    table = pa.Table.from_pylist(result["data"]).replace_schema_metadata({
+        "template": result["template"],
+        "params": orjson.dumps(result["params"])
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _template_response(template: str, filters: dict, arrow: bool):
+    result = _run_template(template, filters)
+    if arrow and "error" not in result:
+        return Response(_arrow_stream(result), media_type=ARROW_STREAM_MEDIA_TYPE)
+    return result
+
+async def _template_endpoint(template: str, filters: dict, request: Request):
+    """JSON envelope by default; an Arrow IPC stream for clients that Accept it"""
+    arrow = ARROW_STREAM_MEDIA_TYPE in request.headers.get("accept", "")
+    try:
+        return await asyncio.to_thread(_template_response, template, filters, arrow)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/kpi")
+async def get_kpis(filters: dict, request: Request):
+    """Get KPI summary data directly without LLM"""
+    return await _template_endpoint('KPI_SUMMARY', filters, request)
+
 @app.post("/channel-performance")
-async def get_channel_performance(filters: dict):
+async def get_channel_performance(filters: dict, request: Request):
     """Get channel performance data directly without LLM"""
+    return await _template_endpoint('CHANNEL_PERFORMANCE', filters, request)
+
+# Dashboard sub-requests that /batch can answer, by (method, path)
+_BATCH_TEMPLATES = {
+    ("POST", "/kpi"): 'KPI_SUMMARY',
+    ("POST", "/channel-performance"): 'CHANNEL_PERFORMANCE',
+}
+
+async def _batch_item(item) -> dict:
+    method = item.method.upper()
+    if (method, item.url) == ("GET", "/health"):
+        return {"id": item.id, "status": 200, "body": await health()}
+    template = _BATCH_TEMPLATES.get((method, item.url))
+    if template is None:
+        return {"id": item.id, "status": 404, "body": {"detail": f"{method} {item.url} is not batchable"}}
     try:
-        from .tools import query_marketing_data
-        result = query_marketing_data.invoke({
-            'template': 'CHANNEL_PERFORMANCE',
-            'date_from': filters.get('date_from', '2025-08-01'),
-            'date_to': filters.get('date_to', '2025-09-18'),
-            'segment': filters.get('segment'),
-            'channel': filters.get('channel')
-        })
-        return json.loads(result) if isinstance(result, str) else result
+        body = await asyncio.to_thread(_run_template, template, item.body)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        return {"id": item.id, "status": 500, "body": {"detail": str(e)}}
+    return {"id": item.id, "status": 200, "body": body}
+
+@app.post("/batch")
+async def batch(req: BatchRequest):
+    """
+    Answer several dashboard calls (/health, /kpi, /channel-performance) in one round trip.
+    
+    Sub-requests run concurrently; each response carries its request id, an HTTP-style
+    status and the body the standalone endpoint would have returned (always JSON).
+    """
+    return {"responses": await asyncio.gather(*(_batch_item(item) for item in req.requests))}
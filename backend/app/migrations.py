@@ -0,0 +1,197 @@
+"""
+Idempotent schema migrations for the marketing database.
+
+MIGRATIONS run once per process when the engine is created (see sql.get_engine), so
+every code path that runs the SQL templates sees the migrated layout. Each step checks
+the current schema first and is a no-op when it has already been applied.
+
+migrate_funded_flag and refresh_daily_rollup change data in the database, so they
+are never run automatically; operators apply them with migrate_db.py.
+"""
+
+import logging
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+MARKETING_TABLE = "curated_pl_marketing_wide_synth"
+SNAPSHOT_INDEX = "ix_cpmws_snapshot"
+
+# Daily KPI rollup: one row per day for every (segment, channel) filter combination,
+# with ROLLUP_ALL standing in for "no filter" on that dimension. Distinct application
+# counts are not additive, so each combination is aggregated from the wide table.
+# Built on request (migrate_db.py --daily-rollup), never by the running app
+DAILY_ROLLUP_TABLE = "daily_kpi_rollup"
+DAILY_ROLLUP_META_TABLE = "daily_kpi_rollup_meta"
+ROLLUP_ALL = "__all__"
+
+# Text spellings of a funded loan found in the source extracts
+FUNDED_VALUES = "('True', 'true', 'TRUE', 't', '1', 'Y', 'y')"
+FUNDED_CASE = f"CASE WHEN CAST(funded_flag AS TEXT) IN {FUNDED_VALUES} THEN 1 ELSE 0 END"
+
+# Funded loan count over funded_flag: a plain SUM once the column is INTEGER 0/1, otherwise
+# the text comparison (a database that was not migrated keeps the original column)
+FUNDED_SUM_INTEGER = "SUM(funded_flag)"
+FUNDED_SUM_TEXT = f"SUM({FUNDED_CASE})"
+
+
+def funded_flag_is_integer(conn: Connection) -> bool:
+    """Whether funded_flag has been migrated to INTEGER (or was created that way)."""
+    inspector = inspect(conn)
+    if not inspector.has_table(MARKETING_TABLE):
+        return False
+    column = next((c for c in inspector.get_columns(MARKETING_TABLE) if c["name"] == "funded_flag"), None)
+    return column is not None and "INT" in str(column["type"]).upper()
+
+
+def funded_sum_sql(conn: Connection) -> str:
+    """The funded loan count expression matching this database's funded_flag column."""
+    return FUNDED_SUM_INTEGER if funded_flag_is_integer(conn) else FUNDED_SUM_TEXT
+
+
+def migrate_funded_flag(conn: Connection) -> None:
+    """
+    Store funded_flag as INTEGER 0/1 so templates can SUM it instead of comparing strings.
+    
+    Rewrites the marketing table (on SQLite the column moves to the end and becomes
+    NOT NULL DEFAULT 0), so it only runs when an operator asks for it via migrate_db.py.
+    """
+    columns = {c["name"]: c for c in inspect(conn).get_columns(MARKETING_TABLE)}
+    column = columns.get("funded_flag")
+    if column is None or "INT" in str(column["type"]).upper():
+        return
+    if conn.dialect.name == "sqlite" and conn.dialect.dbapi.sqlite_version_info < (3, 35, 0):
+        logger.info("ℹ️  SQLite %s has no DROP COLUMN; keeping text funded_flag", conn.dialect.dbapi.sqlite_version)
+        return
+    if conn.dialect.name not in ("sqlite", "postgresql"):
+        logger.info("ℹ️  funded_flag migration not supported on %s; keeping %s", conn.dialect.name, column["type"])
+        return
+
+    logger.info("🔧 Migrating %s.funded_flag from %s to INTEGER", MARKETING_TABLE, column["type"])
+
+    if conn.dialect.name == "sqlite":
+        # SQLite cannot change a column type in place: add, backfill, drop, rename. An indexed
+        # column cannot be dropped, so indexes over funded_flag are dropped and recreated as defined
+        indexed = {ix["name"] for ix in inspect(conn).get_indexes(MARKETING_TABLE) if "funded_flag" in ix["column_names"]}
+        index_sql = [
+            (name, sql) for name, sql in conn.execute(
+                text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {"table": MARKETING_TABLE}
+            )
+            if name in indexed and sql
+        ]
+        for name, _ in index_sql:
+            conn.execute(text(f'DROP INDEX "{name}"'))
+        conn.execute(text(f"ALTER TABLE {MARKETING_TABLE} ADD COLUMN funded_flag_int INTEGER NOT NULL DEFAULT 0"))
+        conn.execute(text(f"UPDATE {MARKETING_TABLE} SET funded_flag_int = {FUNDED_CASE}"))
+        conn.execute(text(f"ALTER TABLE {MARKETING_TABLE} DROP COLUMN funded_flag"))
+        conn.execute(text(f"ALTER TABLE {MARKETING_TABLE} RENAME COLUMN funded_flag_int TO funded_flag"))
+        for _, sql in index_sql:
+            conn.execute(text(sql))
+    else:
+        conn.execute(text(f"ALTER TABLE {MARKETING_TABLE} ALTER COLUMN funded_flag TYPE INTEGER USING ({FUNDED_CASE})"))
+
+
+def _create_snapshot_index(conn: Connection) -> None:
+    """Index for the snapshot_date window filter shared by every template."""
+    existing = next((ix for ix in inspect(conn).get_indexes(MARKETING_TABLE) if ix["name"] == SNAPSHOT_INDEX), None)
+    if existing is not None:
+        included = existing.get("include_columns") or existing.get("dialect_options", {}).get("postgresql_include")
+        if existing["column_names"] == ["snapshot_date"] and not included:
+            return
+        # Earlier releases created a covering index over nine more columns, nearly doubling
+        # the table's size; the filter only needs snapshot_date
+        logger.info("🔧 Replacing covering index %s with one on snapshot_date", SNAPSHOT_INDEX)
+        conn.execute(text(f"DROP INDEX {SNAPSHOT_INDEX}"))
+    else:
+        logger.info("🔧 Creating index %s", SNAPSHOT_INDEX)
+    conn.execute(text(f"CREATE INDEX {SNAPSHOT_INDEX} ON {MARKETING_TABLE} (snapshot_date)"))
+
+
+def _rollup_select(segment_column: str, channel_column: str, funded_sum: str) -> str:
+    group_by = ", ".join(["DATE(snapshot_date)"] + [c for c in (segment_column, channel_column) if c])
+    return f"""
+        SELECT DATE(snapshot_date) AS snapshot_date,
+               {segment_column or f"'{ROLLUP_ALL}'"} AS segment_name,
+               {channel_column or f"'{ROLLUP_ALL}'"} AS first_touch_channel,
+               SUM(mkt_cost_daily_alloc) AS marketing_spend,
+               SUM(revenue_daily) AS revenue,
+               COUNT(DISTINCT application_id) AS applications,
+               {funded_sum} AS funded_loans,
+               SUM(funded_amt) AS funded_amount
+        FROM {MARKETING_TABLE}
+        GROUP BY {group_by}
+    """
+
+
+def _source_max_date(conn: Connection) -> Optional[str]:
+    """Latest snapshot_date of the marketing table; one seek on the snapshot index."""
+    source_max_date = conn.execute(text(f"SELECT MAX(snapshot_date) FROM {MARKETING_TABLE}")).scalar()
+    return None if source_max_date is None else str(source_max_date)
+
+
+def daily_rollup_is_current(conn: Connection) -> bool:
+    """
+    Whether the daily rollup exists and covers the marketing table's latest day.
+    
+    A cheap check for loads that append new days; a load that rewrites existing days has
+    to be followed by a rebuild (migrate_db.py --daily-rollup).
+    """
+    if not inspect(conn).has_table(DAILY_ROLLUP_META_TABLE):
+        return False
+    stored = conn.execute(text(f"SELECT source_max_date FROM {DAILY_ROLLUP_META_TABLE}")).first()
+    return stored is not None and stored[0] == _source_max_date(conn)
+
+
+def refresh_daily_rollup(conn: Connection) -> None:
+    """
+    Rebuild the daily KPI rollup from the marketing table.
+    
+    Run inside one transaction (engine.begin()), so readers see either the old rollup or
+    the new one, never a dropped table.
+    """
+    source_rows = conn.execute(text(f"SELECT COUNT(*) FROM {MARKETING_TABLE}")).scalar()
+    source_max_date = _source_max_date(conn)
+
+    logger.info("🔧 Rebuilding %s from %d source rows", DAILY_ROLLUP_TABLE, source_rows)
+    funded_sum = funded_sum_sql(conn)
+    union = " UNION ALL ".join(
+        _rollup_select(segment_column, channel_column, funded_sum)
+        for segment_column in ("segment_name", None)
+        for channel_column in ("first_touch_channel", None)
+    )
+    conn.execute(text(f"DROP TABLE IF EXISTS {DAILY_ROLLUP_TABLE}"))
+    conn.execute(text(f"CREATE TABLE {DAILY_ROLLUP_TABLE} AS {union}"))
+    conn.execute(text(
+        f"CREATE INDEX ix_{DAILY_ROLLUP_TABLE} ON {DAILY_ROLLUP_TABLE} (segment_name, first_touch_channel, snapshot_date)"
+    ))
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {DAILY_ROLLUP_META_TABLE}"))
+    conn.execute(text(f"CREATE TABLE {DAILY_ROLLUP_META_TABLE} (source_rows INTEGER, source_max_date TEXT)"))
+    conn.execute(
+        text(f"INSERT INTO {DAILY_ROLLUP_META_TABLE} VALUES (:rows, :max_date)"),
+        {"rows": source_rows, "max_date": source_max_date}
+    )
+
+
+# Applied in order on every engine. Converting funded_flag and building the daily rollup
+# change data, so they are opt-in steps in migrate_db.py instead
+MIGRATIONS = [
+    _create_snapshot_index,
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    """Apply any pending migrations; a database without the marketing table is left untouched."""
+    if not inspect(engine).has_table(MARKETING_TABLE):
+        return
+
+    for migration in MIGRATIONS:
+        try:
+            with engine.begin() as conn:
+                migration(conn)
+        except Exception as e:
+            logger.error("❌ Migration %s failed: %s", migration.__name__, e)
@@ -16,6 +16,15 @@ class ChatRequest(BaseModel):
     history: List[ChatTurn] = Field(default_factory=list)
     filters: Filters = Field(default_factory=Filters)
 
+class BatchItem(BaseModel):
+    id: str
+    method: str = "POST"
+    url: str
+    body: Dict[str, Any] = Field(default_factory=dict)
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
 class TablePayload(BaseModel):
     name: str
     columns: List[str]
@@ -31,4 +40,9 @@ class ChatResponse(BaseModel):
     sql: Dict[str, Any] | None = None
     tables: List[TablePayload] = Field(default_factory=list)
     plots: List[PlotPayload] = Field(default_factory=list)
-    extras: Dict[str, Any] = Field(default_factory=dict)
\ No newline at end of file
+    extras: Dict[str, Any] = Field(default_factory=dict)
+
+# Resolve every schema at import (raising on unresolvable annotations) so the first
+# /chat request never pays for, or fails in, a deferred Pydantic schema build
+for _model in (ChatTurn, Filters, ChatRequest, BatchItem, BatchRequest, TablePayload, PlotPayload, ChatResponse):
+    _model.model_rebuild(raise_errors=True)
@@ -0,0 +1,41 @@
+"""
+Fast-path routing for plain template questions.
+
+Questions that are nothing more than one of the TEMPLATE SELECTION phrases from the
+agent prompt ("top campaigns", "channel performance", "show me all campaigns", ...)
+map straight to a query template, so they can be answered without any LLM call.
+Anything with extra detail (custom filters, time grains, comparisons) does not match
+and goes through the agent as before.
+"""
+
+import re
+from typing import Optional
+
+# Optional leading request verb / article and trailing courtesy words around the phrase
+_LEAD = r"(?:(?:please\s+)?(?:show(?:\s+me)?|list|give\s+me|get|display|what\s+are|which\s+are)\s+)?(?:the\s+|our\s+|my\s+)?"
+_TAIL = r"(?:\s+please)?"
+
+_TEMPLATE_PHRASES = {
+    "ALL_CAMPAIGNS": r"(?:all|every)\s+campaigns?",
+    "TOP_CAMPAIGNS": r"(?:top|best)(?:\s+performing)?\s+campaigns?|(?:top|best)\s+performing",
+    "KPI_SUMMARY": r"overall\s+(?:metrics|performance)|performance\s+summary|kpi\s+summary|kpis|marketing\s+metrics|trends",
+    "CHANNEL_PERFORMANCE": r"channel\s+(?:analysis|performance|comparison)|attribution",
+    "SEGMENT_ANALYSIS": r"customer\s+segments|segment\s+(?:analysis|performance)|(?:customer\s+)?demographics",
+}
+
+_TEMPLATE_ROUTES = [
+    (template, re.compile(_LEAD + f"(?:{phrase})" + _TAIL))
+    for template, phrase in _TEMPLATE_PHRASES.items()
+]
+
+_TRAILING_PUNCT_RE = re.compile(r"[\s?.!]+$")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def route_template(message: str) -> Optional[str]:
+    """Return the query template for a message that is exactly a template request, else None."""
+    normalized = _WHITESPACE_RE.sub(" ", _TRAILING_PUNCT_RE.sub("", message.strip().lower()))
+    for template, pattern in _TEMPLATE_ROUTES:
+        if pattern.fullmatch(normalized):
+            return template
+    return None
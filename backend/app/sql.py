@@ -1,9 +1,25 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+from functools import lru_cache
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
-from typing import Dict, Any, Tuple, List
+from sqlalchemy.engine import CursorResult, Engine, make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.sql.elements import TextClause
+from typing import Dict, Any, FrozenSet, Tuple, List
 import pandas as pd
+import sqlglot
+from sqlglot import exp
+from .migrations import (
+    run_migrations, daily_rollup_is_current, funded_sum_sql,
+    DAILY_ROLLUP_TABLE, FUNDED_SUM_INTEGER, FUNDED_SUM_TEXT, MARKETING_TABLE, ROLLUP_ALL
+)
 
-# Define allowlist of templates adapted to our financial services dataset
+logger = logging.getLogger(__name__)
+
+# Define allowlist of templates adapted to our financial services dataset. {funded_sum} is
+# the funded loan count for the database's funded_flag column type (see migrations.funded_sum_sql)
 ALLOWED_QUERIES: Dict[str, str] = {
     "KPI_SUMMARY": """
         WITH agg AS (
@@ -12,7 +28,7 @@ ALLOWED_QUERIES: Dict[str, str] = {
             SUM(mkt_cost_daily_alloc) AS marketing_spend,
             SUM(revenue_daily) AS revenue,
             COUNT(DISTINCT application_id) AS applications,
-            SUM(CASE WHEN funded_flag = 'True' THEN 1 ELSE 0 END) AS funded_loans,
+            {funded_sum} AS funded_loans,
             SUM(funded_amt) AS funded_amount
           FROM curated_pl_marketing_wide_synth
           WHERE snapshot_date BETWEEN :date_from AND :date_to
@@ -38,7 +54,7 @@ ALLOWED_QUERIES: Dict[str, str] = {
                SUM(mkt_cost_daily_alloc) AS marketing_spend,
                SUM(revenue_daily) AS revenue,
                COUNT(DISTINCT application_id) AS applications,
-               SUM(CASE WHEN funded_flag = 'True' THEN 1 ELSE 0 END) AS funded_loans,
+               {funded_sum} AS funded_loans,
                CASE WHEN SUM(mkt_cost_daily_alloc)=0 THEN 0 ELSE (CAST(SUM(revenue_daily) AS REAL) / SUM(mkt_cost_daily_alloc)) END AS roas
         FROM curated_pl_marketing_wide_synth
         WHERE snapshot_date BETWEEN :date_from AND :date_to
@@ -55,7 +71,7 @@ ALLOWED_QUERIES: Dict[str, str] = {
                SUM(mkt_cost_daily_alloc) AS marketing_spend,
                SUM(revenue_daily) AS revenue,
                COUNT(DISTINCT application_id) AS applications,
-               SUM(CASE WHEN funded_flag = 'True' THEN 1 ELSE 0 END) AS funded_loans,
+               {funded_sum} AS funded_loans,
                CASE WHEN SUM(mkt_cost_daily_alloc)=0 THEN 0 ELSE (CAST(SUM(revenue_daily) AS REAL) / SUM(mkt_cost_daily_alloc)) END AS roas
         FROM curated_pl_marketing_wide_synth
         WHERE snapshot_date BETWEEN :date_from AND :date_to
@@ -71,7 +87,7 @@ ALLOWED_QUERIES: Dict[str, str] = {
                SUM(mkt_cost_daily_alloc) AS marketing_spend,
                SUM(revenue_daily) AS revenue,
                COUNT(DISTINCT application_id) AS applications,
-               SUM(CASE WHEN funded_flag = 'True' THEN 1 ELSE 0 END) AS funded_loans,
+               {funded_sum} AS funded_loans,
                CASE WHEN SUM(mkt_cost_daily_alloc)=0 THEN 0 ELSE (CAST(SUM(revenue_daily) AS REAL) / SUM(mkt_cost_daily_alloc)) END AS roas
         FROM curated_pl_marketing_wide_synth
         WHERE snapshot_date BETWEEN :date_from AND :date_to
@@ -87,7 +103,7 @@ ALLOWED_QUERIES: Dict[str, str] = {
                SUM(mkt_cost_daily_alloc) AS marketing_spend,
                SUM(revenue_daily) AS revenue,
                COUNT(DISTINCT application_id) AS applications,
-               SUM(CASE WHEN funded_flag = 'True' THEN 1 ELSE 0 END) AS funded_loans,
+               {funded_sum} AS funded_loans,
                AVG(approved_amt) AS avg_approved_amount,
                CASE WHEN SUM(mkt_cost_daily_alloc)=0 THEN 0 ELSE (CAST(SUM(revenue_daily) AS REAL) / SUM(mkt_cost_daily_alloc)) END AS roas
         FROM curated_pl_marketing_wide_synth
@@ -101,30 +117,243 @@ ALLOWED_QUERIES: Dict[str, str] = {
     """
 }
 
+# Templates served from the daily rollup table when it has been built (see migrations.py).
+# The rollup holds a row per day for every filter combination, so an unset filter
+# selects the ROLLUP_ALL rows instead of dropping the condition
+ROLLUP_QUERIES: Dict[str, str] = {
+    "KPI_SUMMARY": f"""
+        SELECT snapshot_date AS month,
+               marketing_spend,
+               revenue,
+               applications,
+               funded_loans,
+               funded_amount,
+               CASE WHEN applications=0 THEN 0 ELSE (CAST(funded_loans AS REAL) / applications) * 100 END AS funding_rate,
+               CASE WHEN marketing_spend=0 THEN 0 ELSE (CAST(revenue AS REAL) / marketing_spend) END AS roas,
+               CASE WHEN funded_loans=0 THEN 0 ELSE (CAST(marketing_spend AS REAL) / funded_loans) END AS cost_per_funded_loan
+        FROM {DAILY_ROLLUP_TABLE}
+        WHERE snapshot_date BETWEEN :date_from AND :date_to
+          {{segment_filter}}
+          {{channel_filter}}
+          AND (marketing_spend > 0 OR revenue > 0)
+        ORDER BY month ASC;
+    """
+}
+
+# Template names accepted by SQLAgent; anything else is rejected before touching the database
+ALLOWED_TEMPLATES: FrozenSet[str] = frozenset(ALLOWED_QUERIES)
+
+SEGMENT_FILTER_SQL = "AND segment_name=:segment"
+CHANNEL_FILTER_SQL = "AND first_touch_channel=:channel"
+
+def _compile(funded_sum: str) -> Dict[Tuple[str, bool, bool], TextClause]:
+    return {
+        (name, has_segment, has_channel): text(sql.format(
+            funded_sum=funded_sum,
+            segment_filter=SEGMENT_FILTER_SQL if has_segment else "",
+            channel_filter=CHANNEL_FILTER_SQL if has_channel else ""
+        ))
+        for name, sql in ALLOWED_QUERIES.items()
+        for has_segment in (False, True)
+        for has_channel in (False, True)
+    }
+
+# Every template pre-rendered for each (segment filter?, channel filter?) combination
+# and wrapped in text() once, so running a query is a dict lookup; one set per funded
+# loan expression, picked per engine from the funded_flag column type
+_COMPILED: Dict[str, Dict[Tuple[str, bool, bool], TextClause]] = {
+    funded_sum: _compile(funded_sum) for funded_sum in (FUNDED_SUM_INTEGER, FUNDED_SUM_TEXT)
+}
+
+_COMPILED_ROLLUP: Dict[Tuple[str, bool, bool], TextClause] = {
+    (name, has_segment, has_channel): text(sql.format(
+        segment_filter=SEGMENT_FILTER_SQL if has_segment else f"AND segment_name='{ROLLUP_ALL}'",
+        channel_filter=CHANNEL_FILTER_SQL if has_channel else f"AND first_touch_channel='{ROLLUP_ALL}'"
+    ))
+    for name, sql in ROLLUP_QUERIES.items()
+    for has_segment in (False, True)
+    for has_channel in (False, True)
+}
+
+# How often the daily rollup's freshness is checked against the wide table
+ROLLUP_CHECK_SECONDS = 60
+
+# Statements that may not appear anywhere in generated SQL
+_WRITE_NODES = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter, exp.Command)
+
+# sqlglot dialect names that differ from SQLAlchemy's
+_SQLGLOT_DIALECTS = {"postgresql": "postgres"}
+
+def _table_refs(select: exp.Select) -> List[exp.Table]:
+    """Tables read directly by this SELECT (its FROM and JOINs, not nested subqueries)"""
+    sources = [select.args.get("from")] + list(select.args.get("joins") or [])
+    return [source.this for source in sources if source is not None and isinstance(source.this, exp.Table)]
+
+def apply_required_filters(sql: str, dialect: str, segment: bool = False, channel: bool = False) -> str:
+    """
+    Validate model-written SQL as a single read-only query and enforce the request filters.
+    
+    Every SELECT that reads the marketing table and does not already bind :date_from gets
+    the date range (and the segment/channel predicates when those filters are set) ANDed
+    onto its WHERE clause, qualified by the table's alias.
+    
+    Raises:
+        ValueError: If the SQL is not exactly one SELECT query
+    """
+    read = _SQLGLOT_DIALECTS.get(dialect, dialect)
+    statements = [s for s in sqlglot.parse(sql, read=read) if s is not None]
+    if len(statements) != 1 or not isinstance(statements[0], exp.Query) or statements[0].find(*_WRITE_NODES):
+        raise ValueError("Only a single read-only SELECT query is allowed")
+    tree = statements[0]
+    
+    for select in list(tree.find_all(exp.Select)):
+        table = next((t for t in _table_refs(select) if t.name.lower() == MARKETING_TABLE), None)
+        if table is None:
+            continue
+        where = select.args.get("where")
+        bound = {p.name for p in where.find_all(exp.Placeholder)} if where is not None else set()
+        if "date_from" in bound:
+            continue
+        
+        ref = table.alias_or_name
+        predicates = [f"{ref}.snapshot_date BETWEEN :date_from AND :date_to"]
+        if segment and "segment" not in bound:
+            predicates.append(f"{ref}.segment_name = :segment")
+        if channel and "channel" not in bound:
+            predicates.append(f"{ref}.first_touch_channel = :channel")
+        select.where(*predicates, dialect=read, copy=False)
+    
+    return tree.sql(dialect=read)
+
+def _plain(value: Any) -> Any:
+    return float(value) if isinstance(value, Decimal) else value
+
+def fetch_records(result: CursorResult) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Column names and row dicts straight from the DB cursor, without building a DataFrame.
+    
+    NUMERIC values arrive as float (as pd.read_sql's coerce_float does) so rows stay
+    JSON-serializable.
+    """
+    columns = list(result.keys())
+    return columns, [dict(zip(columns, map(_plain, row))) for row in result]
+
+class DailyRollup:
+    """
+    Whether an engine's daily rollup is current, checked at most every ROLLUP_CHECK_SECONDS.
+    
+    The check reads the rollup's recorded latest day and MAX(snapshot_date), an index seek.
+    The app never builds the rollup itself (migrate_db.py --daily-rollup does); while it is
+    missing or stale, callers are told to read the wide table instead.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.current = False
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def is_current(self) -> bool:
+        with self._lock:
+            if time.monotonic() - self._checked_at >= ROLLUP_CHECK_SECONDS:
+                self._checked_at = time.monotonic()
+                try:
+                    with self.engine.connect() as conn:
+                        self.current = daily_rollup_is_current(conn)
+                except Exception as e:
+                    self.current = False
+                    logger.warning("⚠️  Daily rollup unavailable, serving KPI_SUMMARY from %s: %s", MARKETING_TABLE, e)
+            return self.current
+
 class SQLAgent:
     def __init__(self, engine: Engine):
         self.engine = engine
+        with engine.connect() as conn:
+            compiled = _COMPILED[funded_sum_sql(conn)]
+        # Statement for every (template, segment?, channel?) resolved once for this engine, so
+        # picking a query is a dict lookup; rollup variants are used while the rollup is current
+        self._statements: Dict[Tuple[str, bool, bool], TextClause] = compiled
+        self.rollup = DailyRollup(engine)
 
-    def _build_filters(self, params: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
-        segment_sql = "" if not params.get("segment") else "AND segment_name=:segment"
-        channel_sql = "" if not params.get("channel") else "AND first_touch_channel=:channel"
-        bind = {k: v for k, v in params.items() if v is not None}
-        return segment_sql, channel_sql, bind
+    def _statement(self, template: str, params: Dict[str, Any]) -> Tuple[TextClause, Dict[str, Any]]:
+        """Precompiled statement and bind values; only the filters the statement uses are bound."""
+        segment = params.get("segment")
+        channel = params.get("channel")
+        key = (template, bool(segment), bool(channel))
+        query = _COMPILED_ROLLUP.get(key)
+        if query is None or not self.rollup.is_current():
+            query = self._statements.get(key)
+        if query is None:
+            raise ValueError(f"Query template '{template}' not allowed")
+        
+        bind = {"date_from": params.get("date_from"), "date_to": params.get("date_to")}
+        if segment:
+            bind["segment"] = segment
+        if channel:
+            bind["channel"] = channel
+        return query, bind
 
     def run(self, template: str, params: Dict[str, Any]) -> pd.DataFrame:
-        assert template in ALLOWED_QUERIES, f"Query template '{template}' not allowed"
-        segment_sql, channel_sql, bind = self._build_filters(params)
-        sql = ALLOWED_QUERIES[template].format(segment_filter=segment_sql, channel_filter=channel_sql)
+        """Run a template into an Arrow-backed DataFrame (compact string columns, None for nulls)."""
+        query, bind = self._statement(template, params)
         
         with self.engine.begin() as conn:
-            df = pd.read_sql(text(sql), conn, params=bind)
+            df = pd.read_sql(query, conn, params=bind, dtype_backend="pyarrow")
         return df
 
-# Factory
-_engine: Engine | None = None
+    def run_raw(self, template: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Run a template and return plain row dicts, skipping DataFrame construction."""
+        query, bind = self._statement(template, params)
+        
+        with self.engine.begin() as conn:
+            return fetch_records(conn.execute(query, bind))[1]
+
+    def run_many(self, templates: List[str], params: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """Run several templates with the same filters over one connection, as plain row dicts per template."""
+        statements = {template: self._statement(template, params) for template in templates}
+        
+        with self.engine.begin() as conn:
+            return {template: fetch_records(conn.execute(query, bind))[1] for template, (query, bind) in statements.items()}
+
+# Factories: one engine (and pool) and one SQLAgent per database URL for the process.
+# Tool calls from one agent step run concurrently in worker threads, so the first
+# engine creation (and its migrations) is serialized rather than raced
+_ENGINE_LOCK = threading.Lock()
 
 def get_engine(db_url: str) -> Engine:
-    global _engine
-    if _engine is None:
-        _engine = create_engine(db_url, pool_pre_ping=True, pool_size=5, max_overflow=5)
-    return _engine
\ No newline at end of file
+    with _ENGINE_LOCK:
+        return _create_engine(db_url)
+
+@lru_cache(maxsize=4)
+def _create_engine(db_url: str) -> Engine:
+    url = make_url(db_url)
+    if url.get_backend_name() == "sqlite":
+        # Local file/memory database: no network round trip to pre-ping. An in-memory
+        # database only exists on its connection, so share a single one
+        in_memory = url.database in (None, "", ":memory:")
+        engine = create_engine(
+            db_url,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool if in_memory else QueuePool,
+            **({} if in_memory else {"pool_size": 5, "max_overflow": 5})
+        )
+    else:
+        engine = create_engine(db_url, pool_pre_ping=True, pool_size=5, max_overflow=5)
+    # Templates rely on the migrated layout (e.g. the snapshot index)
+    run_migrations(engine)
+    return engine
+
+@lru_cache(maxsize=4)
+def get_sql_agent(db_url: str) -> SQLAgent:
+    return SQLAgent(get_engine(db_url))
+
+def warm_pool(engine: Engine) -> None:
+    """Open the pool's base connections up front so the first requests don't pay connect cost."""
+    size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(engine.connect())
+    finally:
+        for conn in connections:
+            conn.close()
\ No newline at end of file
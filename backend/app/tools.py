@@ -1,16 +1,26 @@
 """
 LangChain tools for the financial marketing analytics chatbot.
 """
-from typing import Dict, Any, List, Optional
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
 from langchain.tools import BaseTool
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 import pandas as pd
 import plotly.express as px
-import json
-from .sql import SQLAgent, get_engine
-from .config import settings
-from .charts import chart_generator
+import orjson
+from sqlalchemy import text
+from .sql import apply_required_filters, fetch_records, get_engine, get_sql_agent
+from .migrations import FUNDED_CASE, FUNDED_VALUES, funded_flag_is_integer
+from .config import settings, get_llm_instance
+from .charts import chart_generator, classify_columns, fig_to_json_bytes
+from .routing import route_template
+from .cache import ExactResponseCache, filters_key, question_key, redis_get, redis_set
+
+logger = logging.getLogger(__name__)
 
 class SQLQueryInput(BaseModel):
     template: str = Field(description="The SQL template to execute (KPI_SUMMARY, TOP_CAMPAIGNS, ALL_CAMPAIGNS, CHANNEL_PERFORMANCE, SEGMENT_ANALYSIS)")
@@ -34,6 +44,16 @@ class VisualizationInput(BaseModel):
     y_column: Optional[str] = Field(default=None, description="Column name for y-axis (auto-detected if not provided)")
     color_column: Optional[str] = Field(default=None, description="Column name for color encoding/grouping (optional)")
 
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Row dicts assembled column-wise, faster than df.to_dict('records') on Arrow-backed frames.
+    
+    Nulls come out as None: Series.tolist() on an Arrow column yields pd.NA, which orjson rejects.
+    """
+    columns = list(df.columns)
+    values = (df[column].array.to_numpy(na_value=None).tolist() for column in columns)
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
 @tool("query_marketing_data", args_schema=SQLQueryInput)
 def query_marketing_data(template: str, date_from: str, date_to: str, segment: Optional[str] = None, channel: Optional[str] = None) -> str:
     """
@@ -47,9 +67,6 @@ def query_marketing_data(template: str, date_from: str, date_to: str, segment: O
     - SEGMENT_ANALYSIS: Customer segment performance
     """
     try:
-        engine = get_engine(settings.database_url)
-        sql_agent = SQLAgent(engine)
-        
         params = {
             "date_from": date_from,
             "date_to": date_to,
@@ -57,45 +74,73 @@ def query_marketing_data(template: str, date_from: str, date_to: str, segment: O
             "channel": channel
         }
         
-        df = sql_agent.run(template, params)
+        # Template results are shared across workers for a short TTL when Redis is configured
+        cache_key = f"query:{template}:{filters_key(params)}"
+        cached = redis_get(cache_key)
+        if cached is not None:
+            return cached.decode()
+        
+        df = get_sql_agent(settings.database_url).run(template, params)
         
         # Convert to JSON for the agent
         result = {
             "template": template,
             "params": params,
-            "data": df.to_dict('records'),
+            "data": _records(df),
             "columns": list(df.columns),
+            # Classified once from the typed frame so create_visualization need not re-infer them
+            "column_types": classify_columns(df),
             "row_count": len(df)
         }
         
-        return json.dumps(result)
+        payload = orjson.dumps(result)
+        redis_set(cache_key, payload, settings.redis_query_ttl_seconds)
+        return payload.decode()
         
     except Exception as e:
-        return json.dumps({"error": str(e), "template": template})
+        return orjson.dumps({"error": str(e), "template": template}).decode()
+
+# Column metadata for the dynamic SQL prompt, at the repository root
+SCHEMA_PATH = Path(__file__).resolve().parents[2] / "marketing.json"
+
+def _funded_flag_column() -> Tuple[str, str]:
+    """
+    Type and description of funded_flag as this database stores it.
+    
+    The column stays text unless an operator ran migrate_db.py --funded-flag, and the
+    generated SQL has to count funded loans accordingly.
+    """
+    try:
+        with get_engine(settings.database_url).connect() as conn:
+            integer = funded_flag_is_integer(conn)
+    except Exception as e:
+        logger.warning("⚠️  Could not inspect funded_flag, describing it as text: %s", e)
+        integer = False
+    if integer:
+        return "INTEGER", "1 if the loan was funded, else 0; count funded loans with SUM(funded_flag)"
+    return "TEXT", f"Funded when the value is one of {FUNDED_VALUES}; count funded loans with SUM({FUNDED_CASE})"
 
+@lru_cache(maxsize=1)
 def load_database_schema() -> str:
-    """Load database schema from marketing.json metadata file"""
+    """Schema text rendered from marketing.json; read and rendered once per process"""
+    funded_type, funded_description = _funded_flag_column()
     try:
-        import os
-        schema_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "marketing.json")
+        schema_data = orjson.loads(SCHEMA_PATH.read_bytes())
         
-        with open(schema_path, 'r') as f:
-            schema_data = json.load(f)
-        
-        schema_text = ""
+        parts = []
         for table in schema_data:
-            schema_text += f"\nTable: {table['table']}\n"
-            schema_text += f"Description: {table['description']}\n\n"
-            schema_text += "Columns:\n"
-            
-            for col in table['columns']:
-                schema_text += f"- {col['name']} ({col['type']}): {col['description']}\n"
+            parts.append(f"\nTable: {table['table']}\nDescription: {table['description']}\n\nColumns:\n")
+            parts.extend(
+                f"- funded_flag ({funded_type}): {funded_description}\n" if col['name'] == "funded_flag"
+                else f"- {col['name']} ({col['type']}): {col['description']}\n"
+                for col in table['columns']
+            )
         
-        return schema_text
+        return "".join(parts)
         
     except Exception as e:
         # Fallback to basic schema if metadata file not found
-        return """
+        return f"""
 Table: curated_pl_marketing_wide_synth
 Description: Marketing performance and loan lifecycle data
 
@@ -108,7 +153,7 @@ Key Columns:
 - first_touch_channel (VARCHAR): First marketing channel (Search, Social, Email, Display, Direct)
 - mkt_cost_daily_alloc (NUMERIC): Daily allocated marketing cost
 - revenue_daily (NUMERIC): Daily revenue generated
-- funded_flag (BOOLEAN): Whether loan was funded
+- funded_flag ({funded_type}): {funded_description}
 - funded_amt (NUMERIC): Amount of funded loan
 - approved_amt (NUMERIC): Approved loan amount
 - segment_name (VARCHAR): Customer segment (Retail, SME, Premium)
@@ -119,54 +164,13 @@ Key Columns:
 - term_months (INT): Loan term in months
 """
 
-@tool("query_dynamic_sql", args_schema=DynamicSQLInput)
-def query_dynamic_sql(question: str, date_from: str, date_to: str, segment: Optional[str] = None, channel: Optional[str] = None) -> str:
-    """
-    Generate and execute custom SQL queries based on natural language questions.
-    
-    This tool can handle complex, specific questions about the marketing data that don't fit 
-    predefined templates. It builds SQL queries dynamically based on the user's question.
-    Uses the complete database schema from marketing.json metadata.
-    """
-    try:
-        from sqlalchemy import text
-        from .config import settings, get_llm_instance
-        
-        # Initialize LLM for SQL generation
-        llm = get_llm_instance(temperature=0)
-        if not llm:
-            return json.dumps({"error": "LLM not configured properly", "question": question})
-        
-        # Build filter conditions
-        filter_conditions = []
-        params = {"date_from": date_from, "date_to": date_to}
-        
-        if segment:
-            filter_conditions.append("AND (segment_name = :segment OR customer_segment = :segment)")
-            params["segment"] = segment
-            
-        if channel:
-            filter_conditions.append("AND first_touch_channel = :channel") 
-            params["channel"] = channel
-            
-        filter_sql = " ".join(filter_conditions)
-        
-        # Load complete database schema
-        schema_info = load_database_schema()
-        
-        # Create SQL generation prompt
-        sql_prompt = f"""
-You are an expert SQL developer. Generate a safe, read-only SELECT query for the following question.
-
-QUESTION: {question}
+@lru_cache(maxsize=1)
+def sql_system_prompt() -> str:
+    """Invariant instructions for SQL generation: role, full schema and query rules"""
+    return f"""You are an expert SQL developer. Generate a safe, read-only SELECT query for the user's question.
 
 DATABASE SCHEMA:
-{schema_info}
-
-REQUIRED FILTERS (already applied):
-- Date range: snapshot_date BETWEEN '{date_from}' AND '{date_to}'
-{f"- Customer segment: {segment}" if segment else ""}
-{f"- Marketing channel: {channel}" if channel else ""}
+{load_database_schema()}
 
 RULES:
 1. Only SELECT statements - no INSERT/UPDATE/DELETE
@@ -182,59 +186,104 @@ RULES:
 11. Consider customer lifecycle flags (is_apply_day, is_fund_day, etc.) for event-based analysis
 12. Use proper date functions for time-based grouping (DATE(), YEAR(), MONTH())
 13. Reference correct column names and types from the schema above
-14. For customer segmentation, use segment_name, risk_segment, or customer_segment columns
+14. For customer segmentation, use the segment_name column
 15. For financial metrics, consider principal_outstanding, interest_paid, ltv_to_date
 
-Generate ONLY the SQL query, nothing else:
-"""
+Generate ONLY the SQL query, nothing else."""
+
+# Final (cleaned, filter-patched) SQL per normalized question and filter set
+_generated_sql_cache = ExactResponseCache(ttl_seconds=settings.dynamic_sql_cache_ttl_seconds, key_prefix="dynamic_sql:")
+
+def _generate_sql(llm, question: str, date_from: str, date_to: str,
+                  segment: Optional[str], channel: Optional[str], dialect: str) -> str:
+    """Ask the LLM for a query, then validate it and enforce the required date/segment/channel filters"""
+    # Static schema + rules go first as the system message so the prefix is byte-identical
+    # across calls (provider prompt caching); only the question and filters vary
+    filter_lines = [f"- Date range: snapshot_date BETWEEN '{date_from}' AND '{date_to}'"]
+    if segment:
+        filter_lines.append(f"- Customer segment: {segment}")
+    if channel:
+        filter_lines.append(f"- Marketing channel: {channel}")
+    request_prompt = "\n".join([f"QUESTION: {question}", "", "REQUIRED FILTERS (already applied):", *filter_lines])
+    
+    # Generate SQL using LLM
+    response = llm.invoke([SystemMessage(content=sql_system_prompt()), HumanMessage(content=request_prompt)])
+    generated_sql = response.content.strip()
+    
+    # Clean up the SQL (remove markdown formatting if present)
+    if "```sql" in generated_sql:
+        generated_sql = generated_sql.split("```sql")[1].split("```")[0].strip()
+    elif "```" in generated_sql:
+        generated_sql = generated_sql.split("```")[1].split("```")[0].strip()
+        
+    # Reject anything but one SELECT and add the required filters wherever the table is read
+    return apply_required_filters(generated_sql, dialect, segment=bool(segment), channel=bool(channel))
+
+@tool("query_dynamic_sql", args_schema=DynamicSQLInput)
+def query_dynamic_sql(question: str, date_from: str, date_to: str, segment: Optional[str] = None, channel: Optional[str] = None) -> str:
+    """
+    Generate and execute custom SQL queries based on natural language questions.
+    
+    This tool can handle complex, specific questions about the marketing data that don't fit 
+    predefined templates. It builds SQL queries dynamically based on the user's question.
+    Uses the complete database schema from marketing.json metadata.
+    """
+    try:
+        # Questions that are just a template request are answered by the template, no LLM call
+        template = route_template(question)
+        if template is not None:
+            return query_marketing_data.invoke({
+                "template": template, "date_from": date_from, "date_to": date_to,
+                "segment": segment, "channel": channel
+            })
         
-        # Generate SQL using LLM
-        response = llm.invoke(sql_prompt)
-        generated_sql = response.content.strip()
+        # Bind values for the required filters
+        params = {"date_from": date_from, "date_to": date_to}
+        if segment:
+            params["segment"] = segment
+        if channel:
+            params["channel"] = channel
         
-        # Clean up the SQL (remove markdown formatting if present)
-        if "```sql" in generated_sql:
-            generated_sql = generated_sql.split("```sql")[1].split("```")[0].strip()
-        elif "```" in generated_sql:
-            generated_sql = generated_sql.split("```")[1].split("```")[0].strip()
-            
-        # Add required WHERE clause and filters
-        table_name = "curated_pl_marketing_wide_synth"  # This should match your actual table name
+        engine = get_engine(settings.database_url)
         
-        if "WHERE" not in generated_sql.upper():
-            # Add WHERE clause if missing
-            generated_sql = generated_sql.replace(f"FROM {table_name}", 
-                                                f"FROM {table_name}\nWHERE snapshot_date BETWEEN :date_from AND :date_to {filter_sql}")
+        # Repeated questions (same wording up to case/whitespace, same filters) reuse the final SQL
+        cache_key = question_key(question, params)
+        cached = _generated_sql_cache.get(cache_key)
+        if cached is not None:
+            generated_sql = cached["sql"]
         else:
-            # Ensure date filter is included
-            if ":date_from" not in generated_sql:
-                generated_sql = generated_sql.replace("WHERE", f"WHERE snapshot_date BETWEEN :date_from AND :date_to {filter_sql} AND")
+            # Shared per-process client (get_llm_instance is cached per temperature)
+            llm = get_llm_instance(temperature=0)
+            if not llm:
+                return orjson.dumps({"error": "LLM not configured properly", "question": question}).decode()
+            generated_sql = _generate_sql(llm, question, date_from, date_to, segment, channel, engine.dialect.name)
         
-        print(f"🔍 Generated SQL: {generated_sql}")
+        logger.debug("🔍 Generated SQL: %s", generated_sql)
         
         # Execute the generated SQL
-        engine = get_engine(settings.database_url)
-        
         with engine.begin() as conn:
-            df = pd.read_sql(text(generated_sql), conn, params=params)
+            columns, records = fetch_records(conn.execute(text(generated_sql), params))
         
         # Return result
         result = {
             "question": question,
             "generated_sql": generated_sql,
             "params": params,
-            "data": df.to_dict('records'),
-            "columns": list(df.columns),
-            "row_count": len(df)
+            "data": records,
+            "columns": columns,
+            "row_count": len(records)
         }
         
-        print(f"✅ Dynamic SQL executed successfully: {len(df)} rows returned")
+        logger.debug("✅ Dynamic SQL executed successfully: %d rows returned", len(records))
+        # Only SQL that actually ran is cached
+        if cached is None:
+            _generated_sql_cache.set(cache_key, {"sql": generated_sql})
         
-        return json.dumps(result)
+        return orjson.dumps(result).decode()
         
     except Exception as e:
-        print(f"❌ Dynamic SQL error: {e}")
-        return json.dumps({"error": str(e), "question": question, "generated_sql": generated_sql if 'generated_sql' in locals() else "Failed to generate SQL"})
+        logger.warning("❌ Dynamic SQL error: %s", e)
+        return orjson.dumps({"error": str(e), "question": question, "generated_sql": generated_sql if 'generated_sql' in locals() else "Failed to generate SQL"}).decode()
 
 @tool("create_visualization", args_schema=VisualizationInput)
 def create_visualization(title: str, data: str, chart_type: str = "auto", 
@@ -286,28 +335,60 @@ def create_visualization(title: str, data: str, chart_type: str = "auto",
             color_column=color_column
         )
         
-        return json.dumps(result)
+        # plotly_json holds raw figure dicts with numpy arrays; serialize them in one orjson pass
+        return fig_to_json_bytes(result).decode()
         
     except Exception as e:
         # Try to create a fallback chart with error message
         try:
             fallback_fig = chart_generator._create_empty_chart(f"{title} - Error: {str(e)[:50]}")
-            return json.dumps({
+            return fig_to_json_bytes({
                 "title": title,
-                "plotly_json": json.loads(fallback_fig.to_json()),
+                "plotly_json": fallback_fig.to_plotly_json(),
                 "chart_type": "error",
                 "error": str(e),
                 "data_points": 0,
                 "columns_used": {"x": None, "y": None, "color": None}
-            })
+            }).decode()
         except:
             # Ultimate fallback if even empty chart fails
-            return json.dumps({
+            return orjson.dumps({
                 "error": str(e),
                 "title": title,
                 "chart_type": chart_type,
                 "message": "Unable to create visualization. Please try a different chart type or check your data."
-            })
+            }).decode()
+
+def _insight_totals(records: List[Dict[str, Any]]) -> Tuple[float, float, float, float, Optional[Dict[str, Any]]]:
+    """
+    Fused single pass over the rows for analyze_data_insights.
+    
+    Returns:
+        Totals of marketing_spend, revenue, funded_loans and applications (nulls count
+        as 0) and the first row with the highest non-null roas, or None
+    """
+    spend = revenue = funded = applications = 0
+    top_row = None
+    best_roas = None
+    for row in records:
+        get = row.get
+        value = get("marketing_spend")
+        if value is not None:
+            spend += value
+        value = get("revenue")
+        if value is not None:
+            revenue += value
+        value = get("funded_loans")
+        if value is not None:
+            funded += value
+        value = get("applications")
+        if value is not None:
+            applications += value
+        value = get("roas")
+        if value is not None and (best_roas is None or value > best_roas):
+            best_roas = value
+            top_row = row
+    return spend, revenue, funded, applications, top_row
 
 @tool("analyze_data_insights")
 def analyze_data_insights(data: str) -> str:
@@ -321,62 +402,58 @@ def analyze_data_insights(data: str) -> str:
         JSON string with key insights and metrics
     """
     try:
-        data_dict = json.loads(data)
+        data_dict = orjson.loads(data)
         
         # Handle both list format and object format
-        if isinstance(data_dict, list):
-            df = pd.DataFrame(data_dict)
-        else:
-            df = pd.DataFrame(data_dict.get('data', []))
+        records = data_dict if isinstance(data_dict, list) else data_dict.get('data', [])
+        # Query tool payloads already list their columns; bare row lists need a scan of the keys
+        columns = data_dict.get('columns') if isinstance(data_dict, dict) else None
+        columns = set(columns) if columns else set().union(*records)
         
         insights = {}
         
-        if not df.empty:
+        if records:
+            total_spend, total_revenue, total_funded, total_apps, top_row = _insight_totals(records)
+            
             # Calculate key metrics
-            if "marketing_spend" in df.columns and "revenue" in df.columns:
-                total_spend = df["marketing_spend"].sum()
-                total_revenue = df["revenue"].sum()
+            if "marketing_spend" in columns and "revenue" in columns:
                 roas = (total_revenue / total_spend) if total_spend > 0 else 0
                 insights["total_roas"] = round(roas, 2)
                 insights["total_spend"] = round(total_spend, 2)
                 insights["total_revenue"] = round(total_revenue, 2)
             
-            if "funded_loans" in df.columns:
-                insights["total_funded_loans"] = int(df["funded_loans"].sum())
+            if "funded_loans" in columns:
+                insights["total_funded_loans"] = int(total_funded)
             
-            if "applications" in df.columns:
-                total_apps = df["applications"].sum()
+            if "applications" in columns:
                 insights["total_applications"] = int(total_apps)
                 
-                if "funded_loans" in df.columns:
-                    funding_rate = (df["funded_loans"].sum() / total_apps * 100) if total_apps > 0 else 0
+                if "funded_loans" in columns:
+                    funding_rate = (total_funded / total_apps * 100) if total_apps > 0 else 0
                     insights["funding_rate"] = round(funding_rate, 1)
             
             # Find top performer
-            if "roas" in df.columns and len(df) > 0:
-                top_idx = df["roas"].idxmax()
-                top_row = df.iloc[top_idx]
-                
-                if "campaign" in df.columns:
-                    insights["top_campaign"] = str(top_row["campaign"])
+            if top_row is not None:
+                if "campaign" in columns:
+                    insights["top_campaign"] = str(top_row.get("campaign"))
                     insights["top_campaign_roas"] = round(top_row["roas"], 2)
-                elif "channel" in df.columns:
-                    insights["top_channel"] = str(top_row["channel"])
+                elif "channel" in columns:
+                    insights["top_channel"] = str(top_row.get("channel"))
                     insights["top_channel_roas"] = round(top_row["roas"], 2)
-                elif "segment" in df.columns:
-                    insights["top_segment"] = str(top_row["segment"])
+                elif "segment" in columns:
+                    insights["top_segment"] = str(top_row.get("segment"))
                     insights["top_segment_roas"] = round(top_row["roas"], 2)
         
-        insights["data_points"] = len(df)
+        insights["data_points"] = len(records)
         if isinstance(data_dict, dict):
             insights["template"] = data_dict.get("template", "unknown")
         else:
             insights["template"] = "list_data"
         
-        return json.dumps(insights)
+        return orjson.dumps(insights).decode()
         
     except Exception as e:
-        return json.dumps({"error": str(e)})
+        return orjson.dumps({"error": str(e)}).decode()
 
 # List of all available tools
 MARKETING_TOOLS = [
@@ -4,6 +4,7 @@ Azure OpenAI Troubleshooting Script
 Fixes common Azure OpenAI connection issues including proxy errors
 """
 
+import asyncio
 import os
 import sys
 from dotenv import load_dotenv
@@ -31,42 +32,25 @@ def fix_azure_issues():
     
     # Fix 1: Clear proxy settings
     print("\n🌐 Fixing Proxy Issues...")
-    proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
-    proxy_found = False
+    proxy_vars = ('HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy')
+    cleared = {var: os.environ.pop(var) for var in proxy_vars if var in os.environ}
     
-    for var in proxy_vars:
-        if var in os.environ:
-            print(f"   Clearing {var}: {os.environ[var]}")
-            del os.environ[var]
-            proxy_found = True
-    
-    if not proxy_found:
-        print("   ✅ No proxy variables found")
-    else:
-        print("   ✅ Proxy variables cleared")
+    for var, value in cleared.items():
+        print(f"   Clearing {var}: {value}")
+    print("   ✅ Proxy variables cleared" if cleared else "   ✅ No proxy variables found")
     
     # Fix 2: Set NO_PROXY for Azure domains
     if azure_endpoint:
         azure_domain = azure_endpoint.replace('https://', '').replace('http://', '')
-        no_proxy = f"{azure_domain},*.openai.azure.com,*.azure.com,localhost,127.0.0.1"
-        os.environ['NO_PROXY'] = no_proxy
+        no_proxy = ",".join((azure_domain, "*.openai.azure.com", "*.azure.com", "localhost", "127.0.0.1"))
+        if os.environ.get('NO_PROXY') != no_proxy:
+            os.environ['NO_PROXY'] = no_proxy
         print(f"   ✅ Set NO_PROXY: {no_proxy}")
     
-    # Fix 3: Set required environment variables
-    print("\n⚙️  Setting Azure Environment Variables...")
-    if azure_key:
-        os.environ["AZURE_OPENAI_API_KEY"] = azure_key
-        print("   ✅ AZURE_OPENAI_API_KEY set")
-    
-    if azure_endpoint:
-        os.environ["AZURE_OPENAI_ENDPOINT"] = azure_endpoint
-        print("   ✅ AZURE_OPENAI_ENDPOINT set")
-    
-    if azure_deployment:
-        os.environ["AZURE_OPENAI_DEPLOYMENT"] = azure_deployment
-        print("   ✅ AZURE_OPENAI_DEPLOYMENT set")
+    # The AZURE_OPENAI_* values above were read from the environment (after load_dotenv),
+    # so they are already set for the client
     
-    # Fix 4: Test Azure connection
+    # Fix 3: Test Azure connection
     print("\n🧪 Testing Azure OpenAI Connection...")
     
     if not all([azure_key, azure_endpoint, azure_deployment]):
@@ -77,75 +61,47 @@ def fix_azure_issues():
         return False
     
     try:
+        import httpx
         from langchain_openai import AzureChatOpenAI
         
-        # Test connection with multiple methods
-        success = False
+        # One HTTP client for the test, so the client's retries reuse the same TLS connection.
+        # AzureChatOpenAI also builds an async client up front; give it one too rather than
+        # letting the SDK construct its own
+        limits = httpx.Limits(max_connections=10, max_keepalive_connections=10)
+        http_client = httpx.Client(timeout=30, limits=limits)
+        http_async_client = httpx.AsyncClient(timeout=30, limits=limits)
+        
+        # One client with the keyword names of the installed langchain-openai (>= 0.1)
+        llm_kwargs = {
+            "azure_endpoint": azure_endpoint,
+            "azure_deployment": azure_deployment,
+            "api_version": os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+            "api_key": azure_key,
+            "temperature": 0.1,
+            "timeout": 30,
+            "max_retries": 2,
+            "http_client": http_client,
+            "http_async_client": http_async_client
+        }
         
-        # Method 1: Direct initialization
         try:
-            print("   Testing Method 1 (openai_api_key parameter)...")
-            llm = AzureChatOpenAI(
-                azure_endpoint=azure_endpoint,
-                azure_deployment=azure_deployment,
-                openai_api_version="2024-02-15-preview",
-                openai_api_key=azure_key,
-                temperature=0.1,
-                timeout=30,
-                max_retries=2
-            )
-            
-            # Test simple completion
+            llm = AzureChatOpenAI(**llm_kwargs)
             response = llm.invoke("Say 'Connection successful!'")
-            print(f"   ✅ Method 1 successful: {response.content}")
+            print(f"   ✅ Connection test successful: {response.content}")
             success = True
-            
         except Exception as e:
-            print(f"   ❌ Method 1 failed: {e}")
-            
-            # Method 2: Alternative parameter naming
-            try:
-                print("   Testing Method 2 (api_key parameter)...")
-                llm = AzureChatOpenAI(
-                    azure_endpoint=azure_endpoint,
-                    azure_deployment=azure_deployment,
-                    api_version="2024-02-15-preview",
-                    api_key=azure_key,
-                    temperature=0.1,
-                    timeout=30,
-                    max_retries=2
-                )
-                
-                response = llm.invoke("Say 'Connection successful!'")
-                print(f"   ✅ Method 2 successful: {response.content}")
-                success = True
-                
-            except Exception as e2:
-                print(f"   ❌ Method 2 failed: {e2}")
-                
-                # Method 3: Environment variables only
-                try:
-                    print("   Testing Method 3 (environment variables)...")
-                    llm = AzureChatOpenAI(
-                        azure_deployment=azure_deployment,
-                        temperature=0.1,
-                        timeout=30,
-                        max_retries=2
-                    )
-                    
-                    response = llm.invoke("Say 'Connection successful!'")
-                    print(f"   ✅ Method 3 successful: {response.content}")
-                    success = True
-                    
-                except Exception as e3:
-                    print(f"   ❌ Method 3 failed: {e3}")
+            print(f"   ❌ Connection test failed: {e}")
+            success = False
+        finally:
+            http_client.close()
+            asyncio.run(http_async_client.aclose())
         
         if success:
             print("\n🎉 Azure OpenAI connection successful!")
             print("You can now run your application with confidence.")
             return True
         else:
-            print("\n❌ All connection methods failed.")
+            print("\n❌ Connection test failed.")
             print("Please verify your Azure OpenAI credentials and network connection.")
             return False
             
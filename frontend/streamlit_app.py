@@ -1,10 +1,14 @@
+import hashlib
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
-import json
+import pyarrow as pa
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+import orjson
+import re
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -15,7 +19,7 @@ st.set_page_config(
 )
 
 # --- CUSTOM CSS FOR MODERN UI ---
-st.markdown("""
+PAGE_CSS = """
 <style>
     /* Import Google Fonts */
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
@@ -52,6 +56,18 @@ st.markdown("""
     }
     
     /* KPI Cards */
+    .kpi-grid {
+        display: grid;
+        grid-template-columns: repeat(4, 1fr);
+        gap: 1rem;
+    }
+    
+    @media (max-width: 768px) {
+        .kpi-grid {
+            grid-template-columns: repeat(2, 1fr);
+        }
+    }
+    
     .kpi-card {
         background: white;
         padding: 1.5rem;
@@ -97,6 +113,35 @@ st.markdown("""
         color: #ef4444;
     }
     
+    /* Loading placeholders, shown while dashboard data is fetched */
+    .skeleton {
+        background: linear-gradient(90deg, #f3f4f6 25%, #e5e7eb 50%, #f3f4f6 75%);
+        background-size: 200% 100%;
+        animation: skeleton-shimmer 1.2s ease-in-out infinite;
+        border-radius: 12px;
+    }
+    
+    .skeleton-card {
+        height: 120px;
+        margin-bottom: 1rem;
+    }
+    
+    .skeleton-chart {
+        height: 400px;
+        margin-bottom: 1.5rem;
+    }
+    
+    .skeleton-charts {
+        display: grid;
+        grid-template-columns: repeat(2, 1fr);
+        gap: 1rem;
+    }
+    
+    @keyframes skeleton-shimmer {
+        0% { background-position: 200% 0; }
+        100% { background-position: -200% 0; }
+    }
+    
     /* Chat interface */
     .chat-container {
         background: #f9fafb;
@@ -194,15 +239,280 @@ st.markdown("""
         transform: translateY(-1px);
         box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4);
     }
+    
+    /* AI Assistant: ChatGPT-like suggestion cards */
+    .suggestion-card {
+        background: white;
+        border: 1px solid #e5e7eb;
+        border-radius: 12px;
+        padding: 16px;
+        margin-bottom: 12px;
+        cursor: pointer;
+        transition: all 0.2s ease;
+        box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
+        display: flex;
+        align-items: flex-start;
+        gap: 12px;
+    }
+    .suggestion-card:hover {
+        border-color: #9ca3af;
+        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
+        transform: translateY(-1px);
+    }
+    .suggestion-icon {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white;
+        width: 32px;
+        height: 32px;
+        border-radius: 8px;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        font-size: 16px;
+        flex-shrink: 0;
+    }
+    .suggestion-content {
+        flex: 1;
+    }
+    .suggestion-title {
+        font-weight: 600;
+        font-size: 14px;
+        color: #1f2937;
+        margin: 0 0 4px 0;
+        line-height: 1.3;
+    }
+    .suggestion-description {
+        font-size: 12px;
+        color: #6b7280;
+        margin: 0;
+        line-height: 1.4;
+    }
+    .suggestions-grid {
+        display: grid;
+        grid-template-columns: repeat(auto-fit, minmax(280px, 1fr));
+        gap: 12px;
+        margin: 0 0 1.5rem 0;
+    }
+    
+    /* Basic button improvements */
+    .stButton > button {
+        border-radius: 8px;
+        font-weight: 500;
+        transition: all 0.2s ease;
+        white-space: nowrap;
+        overflow: hidden;
+        text-overflow: ellipsis;
+    }
+    
+    /* Responsive columns for suggestion buttons */
+    @media (max-width: 768px) {
+        div[data-testid="column"] {
+            min-width: 120px;
+        }
+        .stButton > button {
+            font-size: 0.8rem !important;
+            padding: 6px 8px !important;
+        }
+    }
+    
+    @media (max-width: 480px) {
+        div[data-testid="column"] {
+            min-width: 100px;
+        }
+        .stButton > button {
+            font-size: 0.75rem !important;
+            padding: 4px 6px !important;
+        }
+    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def _css_blob():
+    """PAGE_CSS with comments and indentation stripped, built once per process."""
+    css = re.sub(r"/\*.*?\*/", "", PAGE_CSS, flags=re.DOTALL)
+    return re.sub(r"\s+", " ", css).strip()
+
+st.markdown(_css_blob(), unsafe_allow_html=True)
 
 # --- CONFIGURATION ---
 API_BASE = "http://localhost:8001"
 
+# Line traces switch to WebGL (scattergl) above this many rows; same cutoff px.line's
+# render_mode="auto" uses, so hand-built go traces match the px charts
+MIN_SCATTERGL_ROWS = 1000
+
+# Chat line traces longer than this are cut down to about this many points before sending
+MAX_LINE_POINTS = 2000
+
+# Result tables are sent to the browser one page of this many rows at a time
+RESULT_PAGE_ROWS = 200
+
+# Date bounds of the loaded data, used for widget defaults and the quick presets
+DEFAULT_FROM = date(2025, 8, 1)
+DEFAULT_TO = date(2025, 9, 18)
+PRESET_MONTH_FROM = date(2025, 9, 1)
+PRESET_30_DAYS_FROM = DEFAULT_TO - timedelta(days=30)
+
+@st.cache_resource
+def get_http():
+    """Keep-alive HTTP session shared by every rerun and user; treat it as read-only."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+# How long dashboard data is reused before it is fetched again
+DASHBOARD_TTL_SECONDS = 300
+
+# --- CACHED API CALLS ---
+# Every widget interaction reruns the whole script; these keep repeated reruns with the
+# same filters off the network. Failed calls raise and are not cached.
+def filters_key(filters):
+    """Hashable form of a filters dict, used as the cache key for the fetch helpers."""
+    return tuple(sorted(filters.items()))
+
+def json_hash(value):
+    """Stable digest of a JSON-serializable value (e.g. a result table), for cache keys."""
+    return hashlib.blake2b(orjson.dumps(value, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+def set_active_filters(filters):
+    """
+    Apply a filter set, storing its encoded JSON and digest next to it.
+    
+    Both are computed once per Apply; reruns reuse them for the chat body and the dashboard
+    cache key instead of re-serializing the dict each time.
+    """
+    filters_json = orjson.dumps(filters, option=orjson.OPT_SORT_KEYS)
+    st.session_state.active_filters = filters
+    st.session_state.active_filters_json = filters_json
+    st.session_state.active_filters_key = hashlib.blake2b(filters_json, digest_size=16).hexdigest()
+
+@st.cache_data(ttl=300, max_entries=64, show_spinner=False)
+def fetch_kpi(filters_tuple, _timeout=15):
+    response = get_http().post(f"{API_BASE}/kpi", json=dict(filters_tuple), timeout=_timeout)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+@st.cache_data(ttl=300, max_entries=64, show_spinner=False)
+def fetch_channel_performance(filters_tuple, _timeout=15):
+    response = get_http().post(f"{API_BASE}/channel-performance", json=dict(filters_tuple), timeout=_timeout)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+def batched_fetch(calls, timeout=15):
+    """
+    Send several backend calls in one /batch round trip.
+    
+    calls are (method, path, json body or None) tuples; returns {path: (status, body)}.
+    """
+    payload = {"requests": [
+        {"id": path, "method": method, "url": path, "body": body or {}}
+        for method, path, body in calls
+    ]}
+    response = get_http().post(f"{API_BASE}/batch", json=payload, timeout=timeout)
+    response.raise_for_status()
+    return {item["id"]: (item["status"], item["body"]) for item in orjson.loads(response.content)["responses"]}
+
+@st.cache_data(ttl=30, max_entries=64, show_spinner=False)
+def fetch_overview(filters_tuple):
+    """
+    Health status and KPI rows for the sidebar and quick stats, in one round trip.
+    
+    Kept briefly so the status badge still tracks outages; a failed KPI call yields {}.
+    """
+    results = batched_fetch([("GET", "/health", None), ("POST", "/kpi", dict(filters_tuple))], timeout=5)
+    kpi_status, kpi_data = results["/kpi"]
+    return results["/health"][0], kpi_data if kpi_status == 200 else {}
+
+def fetch_dashboard(filters_tuple):
+    """
+    KPI and channel performance envelopes for the dashboard tab, in one round trip.
+    
+    Returns {path: (body, error)}; a failed call carries its error instead of a body, so the
+    other section still renders.
+    """
+    results = batched_fetch([("POST", "/kpi", dict(filters_tuple)), ("POST", "/channel-performance", dict(filters_tuple))])
+    return {
+        path: (body, None) if status == 200 else (None, f"{path} failed ({status}): {body}")
+        for path, (status, body) in results.items()
+    }
+
+def stream_chat(message, filters_json, history_json):
+    """
+    Ask /chat/stream, yielding ("text", answer so far) while the answer is generated and then
+    ("result", response) with the full chat response; filters and history are JSON bytes.
+    
+    Repeated questions are answered from the backend's response cache as a lone result.
+    """
+    # The encoded filters and history are spliced into the body as-is, not decoded and re-encoded
+    body = b'{"message":%b,"history":%b,"filters":%b}' % (orjson.dumps(message), history_json, filters_json)
+    with get_http().post(f"{API_BASE}/chat/stream", data=body, headers={"Content-Type": "application/json"},
+                         stream=True, timeout=120) as response:
+        response.raise_for_status()
+        text = ""
+        for line in response.iter_lines():
+            if line:
+                event = orjson.loads(line)
+                if event["type"] == "result":
+                    yield "result", event["response"]
+                else:
+                    text = text + event["text"] if event["type"] == "delta" else event["text"]
+                    yield "text", text
+
+class KPITotals(NamedTuple):
+    spend: float
+    revenue: float
+    applications: float
+    funded: float
+
+class DashboardFrames(NamedTuple):
+    kpi_df: pd.DataFrame
+    totals: KPITotals
+    channel_df: pd.DataFrame
+    kpi_error: Optional[str]
+    channel_error: Optional[str]
+
+class PartialDashboardError(Exception):
+    """Raised out of load_dashboard_frames when a section failed, so the result is not cached."""
+    def __init__(self, frames):
+        super().__init__(frames.kpi_error or frames.channel_error)
+        self.frames = frames
+
+_TOTAL_COLUMNS = ("marketing_spend", "revenue", "applications", "funded_loans")
+
+@st.cache_data(ttl=DASHBOARD_TTL_SECONDS, max_entries=64, show_spinner=False)
+def load_dashboard_frames(key, _filters_tuple):
+    """
+    KPI frame with its column totals and the channel frame, built once per filter set.
+    
+    This is the dashboard's only cache: it is keyed by the digest set_active_filters stored,
+    so a rerun hashes that short string instead of the filters themselves.
+    """
+    results = fetch_dashboard(_filters_tuple)
+    kpi_data, kpi_error = results["/kpi"]
+    channel_data, channel_error = results["/channel-performance"]
+    kpi_df = pd.DataFrame((kpi_data or {}).get("data") or [])
+    totals = KPITotals(*(float(kpi_df[col].sum()) if col in kpi_df.columns else 0.0 for col in _TOTAL_COLUMNS))
+    frames = DashboardFrames(kpi_df, totals, pd.DataFrame((channel_data or {}).get("data") or []),
+                             kpi_error, channel_error)
+    if kpi_error or channel_error:
+        raise PartialDashboardError(frames)
+    return frames
+
+def dashboard_frames(key, filters_tuple):
+    """load_dashboard_frames, returning the sections that did load when another one failed."""
+    try:
+        return load_dashboard_frames(key, filters_tuple)
+    except PartialDashboardError as e:
+        return e.frames
+
 # Initialize session state
 if "history" not in st.session_state:
     st.session_state.history = []
+if "history_json" not in st.session_state:
+    # JSON encoding of history, extended turn by turn (see append_turn) so a chat request
+    # never re-serializes the whole conversation
+    st.session_state.history_json = orjson.dumps(st.session_state.history)
 if "last_tables" not in st.session_state:
     st.session_state.last_tables = []
 if "last_plots" not in st.session_state:
@@ -216,19 +526,49 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# --- SIDEBAR BADGES ---
+# Static status badges and the preview layout, built once instead of on every rerun
+BADGE_OK = """
+<div style="background: linear-gradient(135deg, #22c55e, #16a34a); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
+    ✅ Backend Connected
+</div>
+"""
+BADGE_WARN = """
+<div style="background: linear-gradient(135deg, #f59e0b, #d97706); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
+    ⚠️ Backend Issues
+</div>
+"""
+BADGE_ERR = """
+<div style="background: linear-gradient(135deg, #ef4444, #dc2626); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
+    ❌ Backend Disconnected
+</div>
+"""
+PREVIEW_TEMPLATE = """
+<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 0.5rem; margin: 0.5rem 0;">
+    <div style="background: linear-gradient(135deg, #3b82f6, #1d4ed8); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
+        <div style="font-size: 1.2rem; font-weight: bold;">{records}</div>
+        <div style="font-size: 0.7rem; opacity: 0.9;">Records</div>
+    </div>
+    <div style="background: linear-gradient(135deg, #8b5cf6, #7c3aed); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
+        <div style="font-size: 1.2rem; font-weight: bold;">${revenue:,.0f}</div>
+        <div style="font-size: 0.7rem; opacity: 0.9;">Revenue</div>
+    </div>
+</div>
+"""
+
 # --- SIDEBAR ---
 with st.sidebar:
     # Analytics Filters Header
     st.markdown("### 🎯 Analytics Filters")
     
     # Initialize session state for filters if not exists
-    if 'active_filters' not in st.session_state:
-        st.session_state.active_filters = {
-            "date_from": "2025-08-01",
-            "date_to": "2025-09-18", 
+    if 'active_filters_key' not in st.session_state:
+        set_active_filters(st.session_state.get('active_filters') or {
+            "date_from": DEFAULT_FROM.isoformat(),
+            "date_to": DEFAULT_TO.isoformat(),
             "segment": None,
             "channel": None
-        }
+        })
     
     # Date Range Section
     st.markdown("**📅 Date Range**")
@@ -236,14 +576,14 @@ with st.sidebar:
     with date_col1:
         date_from = st.date_input(
             "From", 
-            value=datetime(2025, 8, 1),
+            value=DEFAULT_FROM,
             help="Start date for analysis",
             key="filter_date_from"
         )
     with date_col2:
         date_to = st.date_input(
             "To", 
-            value=datetime(2025, 9, 18),
+            value=DEFAULT_TO,
             help="End date for analysis",
             key="filter_date_to"
         )
@@ -278,13 +618,13 @@ with st.sidebar:
     preset_col1, preset_col2 = st.columns(2)
     with preset_col1:
         if st.button("📊 This Month", use_container_width=True):
-            st.session_state.filter_date_from = datetime(2025, 9, 1).date()
-            st.session_state.filter_date_to = datetime(2025, 9, 18).date()
+            st.session_state.filter_date_from = PRESET_MONTH_FROM
+            st.session_state.filter_date_to = DEFAULT_TO
             st.rerun()
     with preset_col2:
         if st.button("📈 Last 30 Days", use_container_width=True):
-            st.session_state.filter_date_from = datetime(2025, 8, 19).date()
-            st.session_state.filter_date_to = datetime(2025, 9, 18).date()
+            st.session_state.filter_date_from = PRESET_30_DAYS_FROM
+            st.session_state.filter_date_to = DEFAULT_TO
             st.rerun()
     
     # Compile filters with proper handling
@@ -309,60 +649,42 @@ with st.sidebar:
     
     # Apply filters button
     if st.button("🔄 Apply Filters", use_container_width=True, help="Apply current filters to all data views", type="primary"):
-        st.session_state.active_filters = filters.copy()
+        set_active_filters(filters.copy())
         st.session_state.filters_applied = True
         st.success("✅ Filters applied successfully!")
         st.rerun()
     
+    # Status, preview and quick stats follow the applied filters, so editing a widget
+    # does not fetch anything until Apply Filters is clicked
+    applied_filters = st.session_state.active_filters
+    
     st.markdown("---")
     
     # System Status
     st.markdown("**📊 System Status**")
     try:
-        health_check = requests.get(f"{API_BASE}/health", timeout=5)
-        if health_check.status_code == 200:
-            st.markdown("""
-            <div style="background: linear-gradient(135deg, #22c55e, #16a34a); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
-                ✅ Backend Connected
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown("""
-            <div style="background: linear-gradient(135deg, #f59e0b, #d97706); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
-                ⚠️ Backend Issues
-            </div>
-            """, unsafe_allow_html=True)
-    except:
-        st.markdown("""
-        <div style="background: linear-gradient(135deg, #ef4444, #dc2626); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
-            ❌ Backend Disconnected
-        </div>
-        """, unsafe_allow_html=True)
+        health_status, preview_data = fetch_overview(filters_key(applied_filters))
+    except Exception:
+        health_status, preview_data = None, {}
     
-    # Live Data Preview
+    if health_status == 200:
+        badge = BADGE_OK
+    elif health_status is not None:
+        badge = BADGE_WARN
+    else:
+        badge = BADGE_ERR
+    st.markdown(badge, unsafe_allow_html=True)
+    
+    # Preview of the applied filters
     try:
-        preview_response = requests.post(f"{API_BASE}/kpi", json=filters, timeout=5)
-        if preview_response.status_code == 200:
-            preview_data = preview_response.json()
-            if preview_data.get("data"):
-                preview_df = pd.DataFrame(preview_data["data"])
-                total_records = len(preview_df)
-                total_revenue = preview_df.get('revenue', pd.Series([0])).sum()
-                
-                st.markdown("**📈 Live Preview**")
-                preview_display = f"""
-                <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 0.5rem; margin: 0.5rem 0;">
-                    <div style="background: linear-gradient(135deg, #3b82f6, #1d4ed8); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
-                        <div style="font-size: 1.2rem; font-weight: bold;">{total_records}</div>
-                        <div style="font-size: 0.7rem; opacity: 0.9;">Records</div>
-                    </div>
-                    <div style="background: linear-gradient(135deg, #8b5cf6, #7c3aed); color: white; padding: 0.8rem; border-radius: 8px; text-align: center;">
-                        <div style="font-size: 1.2rem; font-weight: bold;">${total_revenue:,.0f}</div>
-                        <div style="font-size: 0.7rem; opacity: 0.9;">Revenue</div>
-                    </div>
-                </div>
-                """
-                st.markdown(preview_display, unsafe_allow_html=True)
+        if preview_data.get("data"):
+            # Row count and one column total: a plain pass over the rows, no DataFrame
+            preview_rows = preview_data["data"]
+            total_records = len(preview_rows)
+            total_revenue = sum(row.get('revenue') or 0 for row in preview_rows)
+            
+            st.markdown("**📈 Applied Filters Preview**")
+            st.markdown(PREVIEW_TEMPLATE.format(records=total_records, revenue=total_revenue), unsafe_allow_html=True)
     except:
         pass
     
@@ -374,20 +696,345 @@ with st.sidebar:
     with action_col1:
         if st.button("🗑️ Clear Chat", use_container_width=True):
             st.session_state.history = []
+            st.session_state.history_json = b"[]"
             st.rerun()
     with action_col2:
         if st.button("🔄 Reset Filters", use_container_width=True):
             st.session_state.filter_segment = "All Segments"
             st.session_state.filter_channel = "All Channels" 
-            st.session_state.filter_date_from = datetime(2025, 8, 1).date()
-            st.session_state.filter_date_to = datetime(2025, 9, 18).date()
+            st.session_state.filter_date_from = DEFAULT_FROM
+            st.session_state.filter_date_to = DEFAULT_TO
             st.rerun()
+    
+    # Raw chat payloads are only sent to the browser when asked for
+    st.checkbox("🔍 Debug mode", key="debug", help="Show raw chat responses and chart payloads")
 
 # --- MAIN CONTENT ---
-tab1, tab2, tab3, tab4 = st.tabs(["📊 Executive Dashboard", "💬 AI Assistant", "🔍 Data Visualizer", "📋 Data Explorer"])
+TAB_LABELS = ["📊 Executive Dashboard", "💬 AI Assistant", "🔍 Data Visualizer", "📋 Data Explorer"]
+
+# A radio rather than st.tabs: st.tabs runs every tab body on each rerun, this runs only the
+# selected one (dispatched at the end of the script, once every tab's function is defined)
+active_tab = st.radio("Section", TAB_LABELS, horizontal=True, key="active_tab", label_visibility="collapsed")
 
 # --- DASHBOARD TAB ---
-with tab1:
+@st.cache_resource
+def plotly_template():
+    """
+    Register the dashboard's shared chart layout as a Plotly template, once per process.
+    
+    Returns the template name; it layers on Plotly's default so px colours and grids stay.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    
+    pio.templates["marketing"] = go.layout.Template(layout=dict(
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(family="Inter, sans-serif"),
+        title=dict(font=dict(size=16))
+    ))
+    return "plotly+marketing"
+
+
+def kpi_card(label, value, change, change_class):
+    return (f'<div class="kpi-card"><p class="kpi-label">{label}</p><p class="kpi-value">{value}</p>'
+            f'<p class="kpi-change {change_class}">{change}</p></div>')
+
+def kpi_card_row(cards):
+    """One row of KPI cards as a single HTML grid, so a row is one st.markdown call."""
+    return f'<div class="kpi-grid">{"".join(kpi_card(*card) for card in cards)}</div>'
+
+# Placeholders in the shape of the dashboard, drawn before its data arrives
+SKELETON_CARDS = '<div class="kpi-grid">' + '<div class="skeleton skeleton-card"></div>' * 4 + '</div>'
+SKELETON_CHARTS = '<div class="skeleton-charts">' + '<div class="skeleton skeleton-chart"></div>' * 4 + '</div>'
+SKELETON_CHART = '<div class="skeleton skeleton-chart"></div>'
+
+
+def render_kpi_cards(totals):
+    """Stage 1: the two KPI card rows, computed from the period totals alone."""
+    total_spend, total_revenue, total_applications, total_funded = totals
+    avg_roas = (total_revenue / total_spend) if total_spend > 0 else 0
+    funding_rate = (total_funded / total_applications * 100) if total_applications > 0 else 0
+    cost_per_app = (total_spend / total_applications) if total_applications > 0 else 0
+    cost_per_loan = (total_spend / total_funded) if total_funded > 0 else 0
+    avg_loan_size = (total_revenue / total_funded) if total_funded > 0 else 0
+    
+    # Enhanced KPI cards - Row 1: Primary Metrics
+    st.markdown("#### 💰 Primary Performance Metrics")
+    st.markdown(kpi_card_row([
+        ("Total Revenue", f"${total_revenue:,.0f}", "+12.3% vs last period", "positive"),
+        ("Marketing Spend", f"${total_spend:,.0f}", "-2.1% vs last period", "positive"),
+        ("Average ROAS", f"{avg_roas:.2f}x", "+8.7% vs last period", "positive"),
+        ("Funding Rate", f"{funding_rate:.1f}%", "+3.2% vs last period", "positive"),
+    ]), unsafe_allow_html=True)
+    
+    # Second row of KPIs: Efficiency Metrics
+    st.markdown("#### 📊 Efficiency & Cost Metrics")
+    st.markdown(kpi_card_row([
+        ("Cost per Application", f"${cost_per_app:,.0f}", "Industry avg: $650", "neutral"),
+        ("Cost per Funded Loan", f"${cost_per_loan:,.0f}", "Target: <$4,500", "neutral"),
+        ("Avg Loan Size", f"${avg_loan_size:,.0f}", "Portfolio health", "positive"),
+        ("Conversion Rate", f"{funding_rate:.1f}%", "App→Loan", "positive" if funding_rate > 15 else "negative"),
+    ]), unsafe_allow_html=True)
+
+
+def render_primary_charts(kpi_df, totals):
+    """Stage 2: the monthly trend charts and the conversion funnel."""
+    # Plotly is imported on first use so sessions that never open a chart skip its import cost
+    import plotly.express as px
+    import plotly.graph_objects as go
+    template = plotly_template()
+    
+    total_spend, total_revenue, total_applications, total_funded = totals
+    avg_roas = (total_revenue / total_spend) if total_spend > 0 else 0
+    funding_rate = (total_funded / total_applications * 100) if total_applications > 0 else 0
+    
+    st.markdown("---")
+    
+    # Performance charts section
+    st.markdown("### 📊 Performance Analytics")
+    
+    chart_col1, chart_col2 = st.columns(2)
+    
+    with chart_col1:
+        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+        st.markdown("#### 💰 Revenue Trend")
+        
+        # Create revenue trend chart
+        if not kpi_df.empty and "month" in kpi_df.columns:
+            fig_revenue = px.line(
+                kpi_df, 
+                x="month", 
+                y="revenue",
+                title="Revenue Over Time",
+                color_discrete_sequence=["#667eea"]
+            )
+            fig_revenue.update_layout(
+                template=template,
+                showlegend=False
+            )
+            fig_revenue.update_traces(line_width=3)
+            st.plotly_chart(fig_revenue, use_container_width=True)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with chart_col2:
+        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+        st.markdown("#### 🎯 ROAS Performance")
+        
+        # Create ROAS chart
+        if not kpi_df.empty and "roas" in kpi_df.columns:
+            # First 10 rows as array slices; the bars are coloured by their own ROAS
+            months = kpi_df["month"].to_numpy()[:10]
+            roas = kpi_df["roas"].to_numpy()[:10]
+            fig_roas = go.Figure(go.Bar(
+                x=months,
+                y=roas,
+                marker=dict(color=roas, colorscale="Viridis", showscale=True, colorbar=dict(title="roas"))
+            ))
+            fig_roas.update_layout(
+                template=template,
+                title="Return on Ad Spend",
+                xaxis_title="month",
+                yaxis_title="roas",
+                showlegend=False
+            )
+            st.plotly_chart(fig_roas, use_container_width=True)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    # Additional Analytics Charts
+    st.markdown("### 📈 Advanced Analytics")
+    chart_col3, chart_col4 = st.columns(2)
+    
+    with chart_col3:
+        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+        st.markdown("#### 📊 Applications vs Funding Trend")
+        
+        if not kpi_df.empty and all(col in kpi_df.columns for col in ["month", "applications", "funded_loans"]):
+            # Create dual-axis chart
+            fig_apps = go.Figure()
+            
+            # Add applications as bars
+            fig_apps.add_trace(go.Bar(
+                x=kpi_df["month"],
+                y=kpi_df["applications"],
+                name="Applications",
+                marker_color="#667eea",
+                opacity=0.7
+            ))
+            
+            # Add funded loans as line on secondary y-axis
+            line_trace = go.Scattergl if len(kpi_df) > MIN_SCATTERGL_ROWS else go.Scatter
+            fig_apps.add_trace(line_trace(
+                x=kpi_df["month"],
+                y=kpi_df["funded_loans"],
+                mode='lines+markers',
+                name="Funded Loans",
+                line=dict(color="#f5576c", width=3),
+                yaxis="y2"
+            ))
+            
+            fig_apps.update_layout(
+                template=template,
+                title="Applications vs Funded Loans",
+                xaxis_title="Month",
+                yaxis_title="Applications",
+                yaxis2=dict(title="Funded Loans", overlaying="y", side="right"),
+                hovermode="x unified"
+            )
+            st.plotly_chart(fig_apps, use_container_width=True)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with chart_col4:
+        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+        st.markdown("#### 💸 Cost Efficiency Metrics")
+        
+        if not kpi_df.empty and "marketing_spend" in kpi_df.columns:
+            # Cost per application / funded loan for the charted rows, straight on the
+            # arrays; rows without applications or funded loans are left out rather
+            # than plotted as inf
+            months = kpi_df["month"].to_numpy()[:15]
+            spend = kpi_df["marketing_spend"].to_numpy()[:15].astype(float)
+            apps = kpi_df["applications"].to_numpy()[:15].astype(float)
+            loans = kpi_df["funded_loans"].to_numpy()[:15].astype(float)
+            valid = (apps > 0) & (loans > 0)
+            
+            if valid.any():
+                months, spend = months[valid], spend[valid]
+                cost_per_app_series = spend / apps[valid]
+                cost_per_loan_series = spend / loans[valid]
+                
+                # Create cost efficiency chart
+                fig_cost = go.Figure([
+                    go.Scatter(x=months, y=cost_per_app_series, mode="lines",
+                               name="cost_per_app", line_color="#4facfe"),
+                    go.Scatter(x=months, y=cost_per_loan_series, mode="lines",
+                               name="cost_per_loan", line_color="#00f2fe")
+                ])
+                fig_cost.update_layout(
+                    template=template,
+                    title="Cost Efficiency Trends",
+                    xaxis_title="month",
+                    yaxis_title="Cost ($)",
+                    legend=dict(title="Metrics", orientation="h", y=1.1)
+                )
+                st.plotly_chart(fig_cost, use_container_width=True)
+            else:
+                st.info("No months with applications and funded loans to chart.")
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    # Funnel Analysis
+    st.markdown("### 🎯 Conversion Funnel")
+    funnel_col1, funnel_col2 = st.columns([2, 1])
+    
+    with funnel_col1:
+        # Create funnel chart
+        funnel_data = [
+            ("Marketing Impressions", total_spend * 100),  # Estimated impressions
+            ("Applications", total_applications),
+            ("Funded Loans", total_funded),
+            ("Revenue Generated", total_revenue)
+        ]
+        
+        fig_funnel = go.Figure(go.Funnel(
+            y=[item[0] for item in funnel_data],
+            x=[item[1] for item in funnel_data],
+            texttemplate="%{label}: %{value:,.0f}",
+            textposition="inside",
+            marker=dict(
+                colorscale="Viridis",
+                line=dict(color="white", width=2)
+            )
+        ))
+        
+        fig_funnel.update_layout(
+            template=template,
+            title="Marketing to Revenue Conversion Funnel",
+            height=400
+        )
+        st.plotly_chart(fig_funnel, use_container_width=True)
+    
+    with funnel_col2:
+        st.markdown("#### 📊 Funnel Metrics")
+        conversion_metrics = f"""
+    <div style="padding: 1rem; background: #f8f9fa; border-radius: 8px;">
+        <div style="margin-bottom: 1rem;">
+            <strong>📈 App Conversion Rate</strong><br>
+            <span style="font-size: 1.5rem; color: #667eea;">{(total_applications/(total_spend*100)*100) if total_spend > 0 else 0:.3f}%</span>
+        </div>
+        <div style="margin-bottom: 1rem;">
+            <strong>🎯 Funding Rate</strong><br>
+            <span style="font-size: 1.5rem; color: #f5576c;">{funding_rate:.1f}%</span>
+        </div>
+        <div style="margin-bottom: 1rem;">
+            <strong>💰 Revenue per App</strong><br>
+            <span style="font-size: 1.5rem; color: #4facfe;">${(total_revenue/total_applications) if total_applications > 0 else 0:.0f}</span>
+        </div>
+        <div>
+            <strong>⚡ Overall Efficiency</strong><br>
+            <span style="font-size: 1.5rem; color: #43e97b;">{avg_roas*1000:.1f}‰</span><br>
+            <small>Revenue per $1K spend</small>
+        </div>
+    </div>
+        """
+        st.markdown(conversion_metrics, unsafe_allow_html=True)
+
+
+def render_channel_chart(channel_df, error=None):
+    """Stage 3: ROAS by channel and the channel table, or the error that kept it from loading."""
+    import plotly.express as px
+    template = plotly_template()
+    
+    # Channel performance section
+    st.markdown("### 🌐 Channel Performance")
+    
+    if error:
+        st.error(f"Error loading channel data: {error}")
+        return
+    
+    try:
+        if not channel_df.empty:
+            if not channel_df.empty and "channel" in channel_df.columns and "roas" in channel_df.columns:
+                st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+            
+            # Create channel comparison chart
+            fig_channel = px.bar(
+                channel_df,
+                x="channel",
+                y="roas", 
+                title="ROAS by Marketing Channel",
+                color="roas",
+                color_continuous_scale="RdYlBu_r",
+                text="roas"
+            )
+            fig_channel.update_traces(texttemplate='%{text:.2f}x', textposition='outside')
+            fig_channel.update_layout(
+                template=template,
+                title_font_size=18,
+                showlegend=False,
+                height=400
+            )
+            st.plotly_chart(fig_channel, use_container_width=True)
+            
+            st.markdown('</div>', unsafe_allow_html=True)
+            
+            # Data table
+            st.markdown("#### 📋 Channel Performance Data")
+            st.dataframe(
+                channel_df,
+                use_container_width=True,
+                hide_index=True
+            )
+    except Exception as e:
+        st.error(f"Error loading channel data: {e}")
+
+
+# A fragment: the dashboard's own widgets (the load button) rerun only this block, so
+# loading it does not re-render the sidebar
+@st.fragment
+def render_dashboard():
     st.markdown("### 📈 Key Performance Indicators")
     
     # Add a refresh button to load data only when needed
@@ -399,356 +1046,196 @@ with tab1:
         # Use active filters from session state
         active_filters = st.session_state.get('active_filters', filters)
         
+        # Skeletons go out before the fetch so the layout is on screen while data loads. The
+        # slots are then filled in stages, so the cards reach the browser before any chart is
+        # built and each later stage shows its own spinner
+        cards_slot, charts_slot, channel_slot = st.empty(), st.empty(), st.empty()
+        cards_slot.markdown(SKELETON_CARDS * 2, unsafe_allow_html=True)
+        charts_slot.markdown(SKELETON_CHARTS, unsafe_allow_html=True)
+        channel_slot.markdown(SKELETON_CHART, unsafe_allow_html=True)
+        
         try:
-            with st.spinner("Loading dashboard metrics..."):
-                kpi_response = requests.post(f"{API_BASE}/kpi", json=active_filters, timeout=15)
-            
-            if kpi_response.status_code == 200:
-                kpi_data = kpi_response.json()
+            kpi_df, totals, channel_df, kpi_error, channel_error = dashboard_frames(
+                st.session_state.active_filters_key, filters_key(active_filters)
+            )
             
-                if kpi_data.get("data") and len(kpi_data["data"]) > 0:
-                    # Convert to DataFrame
-                    kpi_df = pd.DataFrame(kpi_data["data"])
-                    
-                    # Calculate comprehensive metrics
-                    total_spend = kpi_df["marketing_spend"].sum() if "marketing_spend" in kpi_df.columns else 0
-                    total_revenue = kpi_df["revenue"].sum() if "revenue" in kpi_df.columns else 0
-                    total_applications = kpi_df["applications"].sum() if "applications" in kpi_df.columns else 0
-                    total_funded = kpi_df["funded_loans"].sum() if "funded_loans" in kpi_df.columns else 0
-                    avg_roas = (total_revenue / total_spend) if total_spend > 0 else 0
-                    funding_rate = (total_funded / total_applications * 100) if total_applications > 0 else 0
-                    cost_per_app = (total_spend / total_applications) if total_applications > 0 else 0
-                    cost_per_loan = (total_spend / total_funded) if total_funded > 0 else 0
-                    avg_loan_size = (total_revenue / total_funded) if total_funded > 0 else 0
-                    
-                    # Enhanced KPI cards - Row 1: Primary Metrics
-                    st.markdown("#### 💰 Primary Performance Metrics")
-                    col1, col2, col3, col4 = st.columns(4)
-                    
-                    with col1:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Total Revenue</p>
-                        <p class="kpi-value">${total_revenue:,.0f}</p>
-                        <p class="kpi-change positive">+12.3% vs last period</p>
-                    </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col2:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Marketing Spend</p>
-                        <p class="kpi-value">${total_spend:,.0f}</p>
-                        <p class="kpi-change positive">-2.1% vs last period</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    with col3:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Average ROAS</p>
-                        <p class="kpi-value">{avg_roas:.2f}x</p>
-                        <p class="kpi-change positive">+8.7% vs last period</p>
-                    </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col4:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Funding Rate</p>
-                        <p class="kpi-value">{funding_rate:.1f}%</p>
-                        <p class="kpi-change positive">+3.2% vs last period</p>
-                    </div>
-                        """, unsafe_allow_html=True)
-                    
-                    # Second row of KPIs: Efficiency Metrics
-                    st.markdown("#### 📊 Efficiency & Cost Metrics")
-                    col5, col6, col7, col8 = st.columns(4)
-                    
-                    with col5:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Cost per Application</p>
-                        <p class="kpi-value">${cost_per_app:,.0f}</p>
-                        <p class="kpi-change neutral">Industry avg: $650</p>
-                    </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col6:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Cost per Funded Loan</p>
-                        <p class="kpi-value">${cost_per_loan:,.0f}</p>
-                        <p class="kpi-change neutral">Target: <$4,500</p>
-                    </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col7:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Avg Loan Size</p>
-                        <p class="kpi-value">${avg_loan_size:,.0f}</p>
-                        <p class="kpi-change positive">Portfolio health</p>
-                    </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col8:
-                        st.markdown(f"""
-                    <div class="kpi-card">
-                        <p class="kpi-label">Conversion Rate</p>
-                        <p class="kpi-value">{(total_funded/total_applications*100) if total_applications > 0 else 0:.1f}%</p>
-                        <p class="kpi-change {'positive' if funding_rate > 15 else 'negative'}">App→Loan</p>
-                    </div>
-                        """, unsafe_allow_html=True)
-                    
-                    st.markdown("---")
-                    
-                    # Performance charts section
-                    st.markdown("### 📊 Performance Analytics")
-                    
-                    chart_col1, chart_col2 = st.columns(2)
-                    
-                    with chart_col1:
-                        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                        st.markdown("#### 💰 Revenue Trend")
-                        
-                        # Create revenue trend chart
-                        if not kpi_df.empty and "month" in kpi_df.columns:
-                            fig_revenue = px.line(
-                                kpi_df, 
-                                x="month", 
-                                y="revenue",
-                                title="Revenue Over Time",
-                                color_discrete_sequence=["#667eea"]
-                            )
-                            fig_revenue.update_layout(
-                                plot_bgcolor="rgba(0,0,0,0)",
-                                paper_bgcolor="rgba(0,0,0,0)",
-                                font=dict(family="Inter, sans-serif"),
-                                title_font_size=16,
-                                showlegend=False
-                            )
-                            fig_revenue.update_traces(line_width=3)
-                            st.plotly_chart(fig_revenue, use_container_width=True)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    with chart_col2:
-                        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                        st.markdown("#### 🎯 ROAS Performance")
-                        
-                        # Create ROAS chart
-                        if not kpi_df.empty and "roas" in kpi_df.columns:
-                            fig_roas = px.bar(
-                                kpi_df.head(10), 
-                                x="month", 
-                                y="roas",
-                                title="Return on Ad Spend",
-                                color="roas",
-                                color_continuous_scale="Viridis"
-                            )
-                            fig_roas.update_layout(
-                                plot_bgcolor="rgba(0,0,0,0)",
-                                paper_bgcolor="rgba(0,0,0,0)",
-                                font=dict(family="Inter, sans-serif"),
-                                title_font_size=16,
-                                showlegend=False
-                            )
-                            st.plotly_chart(fig_roas, use_container_width=True)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
-                
-                    # Additional Analytics Charts
-                    st.markdown("### 📈 Advanced Analytics")
-                    chart_col3, chart_col4 = st.columns(2)
-                    
-                    with chart_col3:
-                        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                        st.markdown("#### 📊 Applications vs Funding Trend")
-                        
-                        if not kpi_df.empty and all(col in kpi_df.columns for col in ["month", "applications", "funded_loans"]):
-                            # Create dual-axis chart
-                            fig_apps = go.Figure()
-                            
-                            # Add applications as bars
-                            fig_apps.add_trace(go.Bar(
-                                x=kpi_df["month"],
-                                y=kpi_df["applications"],
-                                name="Applications",
-                                marker_color="#667eea",
-                                opacity=0.7
-                            ))
-                            
-                            # Add funded loans as line on secondary y-axis
-                            fig_apps.add_trace(go.Scatter(
-                                x=kpi_df["month"],
-                                y=kpi_df["funded_loans"],
-                                mode='lines+markers',
-                                name="Funded Loans",
-                                line=dict(color="#f5576c", width=3),
-                                yaxis="y2"
-                            ))
-                            
-                            fig_apps.update_layout(
-                                title="Applications vs Funded Loans",
-                                xaxis_title="Month",
-                                yaxis_title="Applications",
-                                yaxis2=dict(title="Funded Loans", overlaying="y", side="right"),
-                                plot_bgcolor="rgba(0,0,0,0)",
-                                paper_bgcolor="rgba(0,0,0,0)",
-                                font=dict(family="Inter, sans-serif"),
-                                title_font_size=16,
-                                hovermode="x unified"
-                            )
-                            st.plotly_chart(fig_apps, use_container_width=True)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    with chart_col4:
-                        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                        st.markdown("#### 💸 Cost Efficiency Metrics")
-                        
-                        if not kpi_df.empty and "marketing_spend" in kpi_df.columns:
-                            # Calculate cost metrics per day
-                            kpi_df_cost = kpi_df.copy()
-                            kpi_df_cost["cost_per_app"] = kpi_df_cost["marketing_spend"] / kpi_df_cost["applications"]
-                            kpi_df_cost["cost_per_loan"] = kpi_df_cost["marketing_spend"] / kpi_df_cost["funded_loans"]
-                            
-                            # Create cost efficiency chart
-                            fig_cost = px.line(
-                                kpi_df_cost.head(15),
-                                x="month",
-                                y=["cost_per_app", "cost_per_loan"],
-                                title="Cost Efficiency Trends",
-                                labels={"value": "Cost ($)", "variable": "Metric"},
-                                color_discrete_sequence=["#4facfe", "#00f2fe"]
-                            )
-                            fig_cost.update_layout(
-                                plot_bgcolor="rgba(0,0,0,0)",
-                                paper_bgcolor="rgba(0,0,0,0)",
-                                font=dict(family="Inter, sans-serif"),
-                                title_font_size=16,
-                                legend=dict(title="Metrics", orientation="h", y=1.1)
-                            )
-                            st.plotly_chart(fig_cost, use_container_width=True)
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
+            # Each section shows its own error, so a failed channel call still leaves the KPIs up
+            if kpi_error:
+                cards_slot.error(f"Error loading dashboard: {kpi_error}")
+                charts_slot.empty()
+            elif not kpi_df.empty:
+                with cards_slot.container():
+                    render_kpi_cards(totals)
                 
-                    # Funnel Analysis
-                    st.markdown("### 🎯 Conversion Funnel")
-                    funnel_col1, funnel_col2 = st.columns([2, 1])
-                    
-                    with funnel_col1:
-                        # Create funnel chart
-                        funnel_data = [
-                            ("Marketing Impressions", total_spend * 100),  # Estimated impressions
-                            ("Applications", total_applications),
-                            ("Funded Loans", total_funded),
-                            ("Revenue Generated", total_revenue)
-                        ]
-                        
-                        fig_funnel = go.Figure(go.Funnel(
-                            y=[item[0] for item in funnel_data],
-                            x=[item[1] for item in funnel_data],
-                            texttemplate="%{label}: %{value:,.0f}",
-                            textposition="inside",
-                            marker=dict(
-                                colorscale="Viridis",
-                                line=dict(color="white", width=2)
-                            )
-                        ))
-                        
-                        fig_funnel.update_layout(
-                            title="Marketing to Revenue Conversion Funnel",
-                            font=dict(family="Inter, sans-serif"),
-                            plot_bgcolor="rgba(0,0,0,0)",
-                            paper_bgcolor="rgba(0,0,0,0)",
-                            height=400
-                        )
-                        st.plotly_chart(fig_funnel, use_container_width=True)
-                    
-                    with funnel_col2:
-                        st.markdown("#### 📊 Funnel Metrics")
-                        conversion_metrics = f"""
-                    <div style="padding: 1rem; background: #f8f9fa; border-radius: 8px;">
-                        <div style="margin-bottom: 1rem;">
-                            <strong>📈 App Conversion Rate</strong><br>
-                            <span style="font-size: 1.5rem; color: #667eea;">{(total_applications/(total_spend*100)*100) if total_spend > 0 else 0:.3f}%</span>
-                        </div>
-                        <div style="margin-bottom: 1rem;">
-                            <strong>🎯 Funding Rate</strong><br>
-                            <span style="font-size: 1.5rem; color: #f5576c;">{funding_rate:.1f}%</span>
-                        </div>
-                        <div style="margin-bottom: 1rem;">
-                            <strong>💰 Revenue per App</strong><br>
-                            <span style="font-size: 1.5rem; color: #4facfe;">${(total_revenue/total_applications) if total_applications > 0 else 0:.0f}</span>
-                        </div>
-                        <div>
-                            <strong>⚡ Overall Efficiency</strong><br>
-                            <span style="font-size: 1.5rem; color: #43e97b;">{avg_roas*1000:.1f}‰</span><br>
-                            <small>Revenue per $1K spend</small>
-                        </div>
-                    </div>
-                        """
-                        st.markdown(conversion_metrics, unsafe_allow_html=True)
-                    
-                    # Channel performance section
-                    st.markdown("### 🌐 Channel Performance")
-                    
-                    try:
-                        channel_response = requests.post(f"{API_BASE}/channel-performance", json=active_filters, timeout=10)
-                    
-                        if channel_response.status_code == 200:
-                            channel_data = channel_response.json()
-                            
-                            if channel_data.get("data") and len(channel_data["data"]) > 0:
-                                channel_df = pd.DataFrame(channel_data["data"])
-                                
-                                if not channel_df.empty and "channel" in channel_df.columns and "roas" in channel_df.columns:
-                                    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                                
-                                # Create channel comparison chart
-                                fig_channel = px.bar(
-                                    channel_df,
-                                    x="channel",
-                                    y="roas", 
-                                    title="ROAS by Marketing Channel",
-                                    color="roas",
-                                    color_continuous_scale="RdYlBu_r",
-                                    text="roas"
-                                )
-                                fig_channel.update_traces(texttemplate='%{text:.2f}x', textposition='outside')
-                                fig_channel.update_layout(
-                                    plot_bgcolor="rgba(0,0,0,0)",
-                                    paper_bgcolor="rgba(0,0,0,0)",
-                                    font=dict(family="Inter, sans-serif"),
-                                    title_font_size=18,
-                                    showlegend=False,
-                                    height=400
-                                )
-                                st.plotly_chart(fig_channel, use_container_width=True)
-                                
-                                st.markdown('</div>', unsafe_allow_html=True)
-                                
-                                # Data table
-                                st.markdown("#### 📋 Channel Performance Data")
-                                st.dataframe(
-                                    channel_df,
-                                    use_container_width=True,
-                                    hide_index=True
-                                )
-                    except Exception as e:
-                        st.error(f"Error loading channel data: {e}")
+                with charts_slot.container():
+                    with st.spinner("Building charts..."):
+                        render_primary_charts(kpi_df, totals)
+            else:
+                cards_slot.warning("No data available for the selected time period.")
+                charts_slot.empty()
+            
+            if kpi_error or channel_error or not kpi_df.empty:
+                with channel_slot.container():
+                    with st.spinner("Building channel breakdown..."):
+                        render_channel_chart(channel_df, channel_error)
             else:
-                st.warning("No data available for the selected time period.")
+                channel_slot.empty()
                 
         except Exception as e:
-            st.error(f"Error loading dashboard: {e}")
+            cards_slot.error(f"Error loading dashboard: {e}")
+            charts_slot.empty()
+            channel_slot.empty()
     else:
         st.info("👆 Click 'Load Dashboard Data' to view KPI metrics and avoid unnecessary API calls.")
 
+
 # --- AI ASSISTANT TAB ---
-with tab2:
+def plot_figure(plot_data):
+    """
+    Figure from a chart's plotly_json payload.
+    
+    A JSON string is handed straight to pio.from_json rather than decoded to a dict
+    first; invalid properties are skipped instead of failing the whole chart.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    
+    if isinstance(plot_data, str):
+        fig = pio.from_json(plot_data, skip_invalid=True)
+    else:
+        fig = go.Figure(plot_data, skip_invalid=True)
+    return webgl_traces(downsample_lines(fig))
+
+def downsample_lines(fig):
+    """
+    Cut line traces longer than MAX_LINE_POINTS down to each bucket's min and max point.
+    
+    Keeping both extremes of every bucket preserves the drawn envelope of the line, so the
+    chart looks the same at dashboard widths while far fewer points cross the websocket.
+    Marker-only traces are left alone since every marker is visible.
+    """
+    for trace in fig.data:
+        if trace.type not in ("scatter", "scattergl") or trace.y is None or len(trace.y) <= MAX_LINE_POINTS:
+            continue
+        if trace.mode is not None and "lines" not in trace.mode:
+            continue
+        y = np.asarray(trace.y)
+        if y.dtype.kind not in "iuf":
+            continue
+        
+        starts = np.linspace(0, len(y), MAX_LINE_POINTS // 2, endpoint=False).astype(int)
+        buckets = np.split(y, starts[1:])
+        keep = np.unique(np.concatenate([
+            starts + [bucket.argmin() for bucket in buckets],
+            starts + [bucket.argmax() for bucket in buckets]
+        ]))
+        
+        # Per-point arrays are cut to the same points as y
+        updates = {"y": y[keep]}
+        for name in ("x", "text", "hovertext", "customdata"):
+            values = trace[name]
+            if values is not None and not isinstance(values, str) and len(values) == len(y):
+                updates[name] = np.asarray(values)[keep]
+        trace.update(updates)
+    return fig
+
+def webgl_traces(fig):
+    """
+    Swap SVG scatter traces longer than MIN_SCATTERGL_ROWS points for WebGL scattergl.
+    
+    Charts built by px with render_mode="auto" already do this; go.Scatter traces
+    (e.g. a dual-axis line) arrive as SVG and stall the browser on long series.
+    """
+    import plotly.graph_objects as go
+    
+    def points(trace):
+        values = trace.x if trace.x is not None else trace.y
+        return 0 if values is None else len(values)
+    
+    if not any(trace.type == "scatter" and points(trace) > MIN_SCATTERGL_ROWS for trace in fig.data):
+        return fig
+    # A figure's traces cannot be replaced in place, so the figure is rebuilt around its layout
+    return go.Figure(
+        data=[
+            go.Scattergl({k: v for k, v in trace.to_plotly_json().items() if k != "type"}, skip_invalid=True)
+            if trace.type == "scatter" and points(trace) > MIN_SCATTERGL_ROWS else trace
+            for trace in fig.data
+        ],
+        layout=fig.layout
+    )
+
+def _arrow_column(values):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed value types in one column: show them as text
+        return pa.array([None if v is None else str(v) for v in values])
+
+def result_table(table):
+    """
+    Arrow table from a table payload (row lists plus column names), built column by column.
+    
+    st.dataframe takes it as-is, so no pandas frame is built just to be converted back to Arrow.
+    """
+    columns = list(zip(*table["rows"])) or [[] for _ in table["columns"]]
+    return pa.Table.from_arrays([_arrow_column(list(values)) for values in columns], names=table["columns"])
+
+def show_table(table, key=None):
+    """
+    Render an Arrow result table, RESULT_PAGE_ROWS rows at a time.
+    
+    With a key, a page selector picks the slice sent to the browser; results that only exist
+    for one run (no key) show their first page. Downloads always carry every row.
+    """
+    total = table.num_rows
+    if total <= RESULT_PAGE_ROWS:
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        return
+    
+    pages = -(-total // RESULT_PAGE_ROWS)
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=key) if key else 1
+    start = (page - 1) * RESULT_PAGE_ROWS
+    st.dataframe(table.slice(start, RESULT_PAGE_ROWS), use_container_width=True, hide_index=True)
+    st.caption(f"Rows {start + 1:,}–{min(start + RESULT_PAGE_ROWS, total):,} of {total:,}")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def table_csv(key, _table):
+    """CSV download bytes for an Arrow result table, built once per key (see json_hash)."""
+    return _table.to_pandas().to_csv(index=False).encode("utf-8")
+
+def append_turn(role, content):
+    """Add a chat turn, extending the encoded history rather than re-encoding it."""
+    turn = orjson.dumps({"role": role, "content": content})
+    encoded = st.session_state.history_json
+    st.session_state.history_json = b"[%b]" % turn if encoded == b"[]" else b"%b,%b]" % (encoded[:-1], turn)
+    st.session_state.history.append({"role": role, "content": content})
+
+# Quick-question buttons shown on an empty conversation: (label, key, help, question)
+SUGGESTIONS = [
+    ("🎯 Top Campaigns", "btn-campaigns", "Find the best performing campaigns by return on ad spend",
+     "What are the top 5 campaigns by ROAS?"),
+    ("📈 Revenue Trends", "btn-revenue", "Visualize revenue patterns and growth over time",
+     "Show me revenue trends over time with visualization"),
+    ("📊 Channel Performance", "btn-channels", "Analyze and compare marketing channel effectiveness",
+     "Compare channel performance with charts"),
+    ("💰 Segment Analysis", "btn-segments", "Break down funding rates across customer segments",
+     "Analyze funding rates by customer segment"),
+]
+
+def ask_suggestion(question):
+    """Suggestion button callback; runs before the click's rerun, which then asks the question."""
+    st.session_state.initial_input = question
+
+def reset_conversation():
+    st.session_state.history = []
+    st.session_state.history_json = b"[]"
+    st.session_state.last_tables = []
+    st.session_state.last_plots = []
+
+# A fragment: chat input and the suggestion buttons rerun only the assistant tab, not
+# the sidebar above it
+@st.fragment
+def render_assistant():
     st.markdown("### 🤖 AI Marketing Assistant")
     st.markdown("Ask me anything about your marketing performance data. I can analyze trends, create charts, and provide insights.")
     
@@ -759,140 +1246,23 @@ with tab2:
     </div>
     """, unsafe_allow_html=True)
     
-    # Custom CSS for ChatGPT-like cards
-    st.markdown("""
-    <style>
-    .suggestion-card {
-        background: white;
-        border: 1px solid #e5e7eb;
-        border-radius: 12px;
-        padding: 16px;
-        margin-bottom: 12px;
-        cursor: pointer;
-        transition: all 0.2s ease;
-        box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-        display: flex;
-        align-items: flex-start;
-        gap: 12px;
-    }
-    .suggestion-card:hover {
-        border-color: #9ca3af;
-        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
-        transform: translateY(-1px);
-    }
-    .suggestion-icon {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        width: 32px;
-        height: 32px;
-        border-radius: 8px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 16px;
-        flex-shrink: 0;
-    }
-    .suggestion-content {
-        flex: 1;
-    }
-    .suggestion-title {
-        font-weight: 600;
-        font-size: 14px;
-        color: #1f2937;
-        margin: 0 0 4px 0;
-        line-height: 1.3;
-    }
-    .suggestion-description {
-        font-size: 12px;
-        color: #6b7280;
-        margin: 0;
-        line-height: 1.4;
-    }
-    .suggestions-grid {
-        display: grid;
-        grid-template-columns: repeat(auto-fit, minmax(280px, 1fr));
-        gap: 12px;
-        margin: 0 0 1.5rem 0;
-    }
-    
-    /* Basic button improvements */
-    .stButton > button {
-        border-radius: 8px;
-        font-weight: 500;
-        transition: all 0.2s ease;
-        white-space: nowrap;
-        overflow: hidden;
-        text-overflow: ellipsis;
-    }
-    
-    /* Responsive columns for suggestion buttons */
-    @media (max-width: 768px) {
-        div[data-testid="column"] {
-            min-width: 120px;
-        }
-        .stButton > button {
-            font-size: 0.8rem !important;
-            padding: 6px 8px !important;
-        }
-    }
-    
-    @media (max-width: 480px) {
-        div[data-testid="column"] {
-            min-width: 100px;
-        }
-        .stButton > button {
-            font-size: 0.75rem !important;
-            padding: 4px 6px !important;
-        }
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
     # Always show suggestions section
     st.markdown("**👋 Quick Questions:**")
     
     # Show different content based on chat history
     if not st.session_state.history:
         # Single row layout that wraps naturally on smaller screens
-        cols = st.columns(4)
-        
-        with cols[0]:
-            if st.button("🎯 Top Campaigns", key="btn-campaigns", help="Find the best performing campaigns by return on ad spend", use_container_width=True):
-                st.session_state.suggested_question = "What are the top 5 campaigns by ROAS?"
-                st.rerun()
-        
-        with cols[1]:
-            if st.button("📈 Revenue Trends", key="btn-revenue", help="Visualize revenue patterns and growth over time", use_container_width=True):
-                st.session_state.suggested_question = "Show me revenue trends over time with visualization"
-                st.rerun()
-        
-        with cols[2]:
-            if st.button("📊 Channel Performance", key="btn-channels", help="Analyze and compare marketing channel effectiveness", use_container_width=True):
-                st.session_state.suggested_question = "Compare channel performance with charts"
-                st.rerun()
-        
-        with cols[3]:
-            if st.button("💰 Segment Analysis", key="btn-segments", help="Break down funding rates across customer segments", use_container_width=True):
-                st.session_state.suggested_question = "Analyze funding rates by customer segment"
-                st.rerun()
+        cols = st.columns(len(SUGGESTIONS))
+        for col, (label, key, help_text, question) in zip(cols, SUGGESTIONS):
+            col.button(label, key=key, help=help_text, use_container_width=True,
+                       on_click=ask_suggestion, args=(question,))
     else:
         # Show a "New Conversation" button when there's chat history
-        if st.button("🔄 Start New Conversation", help="Clear chat history and see suggestions again"):
-            st.session_state.history = []
-            st.session_state.last_tables = []
-            st.session_state.last_plots = []
-            st.rerun()
+        st.button("🔄 Start New Conversation", help="Clear chat history and see suggestions again",
+                  on_click=reset_conversation)
     
     st.markdown("---")  # Add separator
     
-    # Check for suggested question
-    suggested_question = st.session_state.get("suggested_question", "")
-    if suggested_question:
-        # Clear the suggestion
-        del st.session_state.suggested_question
-        # Set it as the initial input to be processed below
-        st.session_state.initial_input = suggested_question
-    
     # Display chat history
     for i, turn in enumerate(st.session_state.history):
         with st.chat_message(turn["role"]):
@@ -904,11 +1274,7 @@ with tab2:
                 for plot in st.session_state.last_plots:
                     try:
                         if isinstance(plot, dict) and "plotly_json" in plot:
-                            plot_data = plot["plotly_json"]
-                            if isinstance(plot_data, str):
-                                plot_data = json.loads(plot_data)
-                            
-                            fig = go.Figure(plot_data)
+                            fig = plot_figure(plot["plotly_json"])
                             fig.update_layout(
                                 font=dict(family="Inter, sans-serif"),
                                 plot_bgcolor="rgba(0,0,0,0)",
@@ -918,31 +1284,25 @@ with tab2:
                     except Exception as e:
                         st.error(f"Chart rendering error: {e}")
                 
-                # Show last tables
-                for table in st.session_state.last_tables:
+                # Show last tables; page keys use the turn index so they match the live render
+                for j, table in enumerate(st.session_state.last_tables):
                     try:
                         if "rows" in table and "columns" in table:
-                            df = pd.DataFrame(table["rows"], columns=table["columns"])
-                            st.dataframe(df, use_container_width=True, hide_index=True)
+                            df = result_table(table)
+                            show_table(df, key=f"table_page_{i}_{j}")
                             
-                            csv = df.to_csv(index=False)
                             st.download_button(
                                 label="📥 Download Data",
-                                data=csv,
+                                data=table_csv(json_hash(table), df),
                                 file_name=f"marketing_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                                 mime="text/csv",
-                                key=f"download_{i}"
+                                key=f"download_{i}_{j}"
                             )
                     except Exception as e:
                         st.error(f"Table rendering error: {e}")
     
     # Handle initial input from suggestions
-    initial_input = st.session_state.get("initial_input", "")
-    if initial_input:
-        del st.session_state.initial_input
-        prompt = initial_input
-    else:
-        prompt = None
+    prompt = st.session_state.pop("initial_input", None)
     
     # Always show chat input (moved outside the conditional)
     user_input = st.chat_input("Ask about marketing performance, trends, or request visualizations...")
@@ -950,8 +1310,10 @@ with tab2:
     # Use either suggested prompt or user input
     if prompt or user_input:
         actual_prompt = prompt if prompt else user_input
+        # The request carries the history before this question
+        prior_history_json = st.session_state.history_json
         # Add user message
-        st.session_state.history.append({"role": "user", "content": actual_prompt})
+        append_turn("user", actual_prompt)
         
         with st.chat_message("user"):
             st.markdown(actual_prompt)
@@ -960,125 +1322,280 @@ with tab2:
         with st.chat_message("assistant"):
             with st.spinner("🧠 Analyzing your request..."):
                 try:
-                    payload = {
-                        "message": actual_prompt,
-                        "history": st.session_state.history[:-1],
-                        "filters": st.session_state.get('active_filters', filters)
-                    }
+                    resp_data = {}
+                    
+                    # Text is shown as the model writes it, then replaced by the final answer
+                    # (cached and fast-path answers only arrive with the result)
+                    answer_slot = st.empty()
+                    for kind, value in stream_chat(
+                        actual_prompt,
+                        st.session_state.active_filters_json,
+                        prior_history_json
+                    ):
+                        if kind == "text":
+                            answer_slot.markdown(value)
+                        else:
+                            resp_data.update(value)
+                    answer = resp_data.get("answer", "I processed your request.")
+                    
+                    answer_slot.markdown(answer)
                     
-                    response = requests.post(f"{API_BASE}/chat", json=payload, timeout=120)
+                    # Handle enhanced plots with metadata
+                    plots = resp_data.get("plots", [])
+                    st.session_state.last_plots = plots
                     
-                    if response.status_code == 200:
-                        resp_data = response.json()
-                        answer = resp_data.get("answer", "I processed your request.")
-                        
-                        st.markdown(answer)
-                        
-                        # Handle enhanced plots with metadata
-                        plots = resp_data.get("plots", [])
-                        st.session_state.last_plots = plots
-                        
-                        # Debug: Show plot information (temporary)
+                    if st.session_state.get("debug"):
                         st.write(f"🔍 Debug: Found {len(plots)} plots")
                         if not plots:
                             st.write("❌ No plots found - checking if visualization tool was called...")
                             with st.expander("🔍 Debug: Full response"):
                                 st.json(resp_data)
-                        
-                        for plot in plots:
-                            try:
-                                if isinstance(plot, dict) and "plotly_json" in plot:
-                                    # Enhanced chart handling with metadata
-                                    plot_data = plot["plotly_json"]
-                                    if isinstance(plot_data, str):
-                                        plot_data = json.loads(plot_data)
-                                    
-                                    # Create figure
-                                    fig = go.Figure(plot_data)
-                                    
-                                    # Apply enhanced styling
-                                    fig.update_layout(
-                                        font=dict(family="Inter, sans-serif"),
-                                        plot_bgcolor="rgba(0,0,0,0)",
-                                        paper_bgcolor="rgba(0,0,0,0)",
-                                        title_font_size=16,
-                                        title_x=0.5,
-                                        showlegend=True,
-                                        margin=dict(l=40, r=40, t=60, b=40)
-                                    )
-                                    
-                                    # Display chart
-                                    st.plotly_chart(fig, use_container_width=True)
-                                    
-                                    # Show chart metadata if available
-                                    chart_type = plot.get("chart_type", "unknown")
-                                    data_points = plot.get("data_points", 0)
-                                    columns_used = plot.get("columns_used", {})
-                                    
-                                    if data_points > 0:
-                                        with st.expander(f"📊 Chart Details ({chart_type} chart, {data_points} data points)"):
-                                            if columns_used:
-                                                col1, col2, col3 = st.columns(3)
-                                                with col1:
-                                                    if columns_used.get("x"):
-                                                        st.write(f"**X-axis:** {columns_used['x']}")
-                                                with col2:
-                                                    if columns_used.get("y"):
-                                                        st.write(f"**Y-axis:** {columns_used['y']}")
-                                                with col3:
-                                                    if columns_used.get("color"):
-                                                        st.write(f"**Color:** {columns_used['color']}")
+                    
+                    for plot in plots:
+                        try:
+                            if isinstance(plot, dict) and "plotly_json" in plot:
+                                # Enhanced chart handling with metadata
+                                fig = plot_figure(plot["plotly_json"])
+                                
+                                # Apply enhanced styling
+                                fig.update_layout(
+                                    font=dict(family="Inter, sans-serif"),
+                                    plot_bgcolor="rgba(0,0,0,0)",
+                                    paper_bgcolor="rgba(0,0,0,0)",
+                                    title_font_size=16,
+                                    title_x=0.5,
+                                    showlegend=True,
+                                    margin=dict(l=40, r=40, t=60, b=40)
+                                )
+                                
+                                # Display chart
+                                st.plotly_chart(fig, use_container_width=True)
+                                
+                                # Show chart metadata if available
+                                chart_type = plot.get("chart_type", "unknown")
+                                data_points = plot.get("data_points", 0)
+                                columns_used = plot.get("columns_used", {})
                                 
-                                elif "error" in plot:
-                                    st.error(f"Chart Error: {plot['error']}")
-                                    st.info("💡 Try asking: 'Create a bar chart showing campaigns vs revenue' or 'Show me a line graph of revenue trends'")
-                                else:
-                                    st.warning("Chart data format issue - please try rephrasing your visualization request")
+                                if data_points > 0:
+                                    with st.expander(f"📊 Chart Details ({chart_type} chart, {data_points} data points)"):
+                                        if columns_used:
+                                            col1, col2, col3 = st.columns(3)
+                                            with col1:
+                                                if columns_used.get("x"):
+                                                    st.write(f"**X-axis:** {columns_used['x']}")
+                                            with col2:
+                                                if columns_used.get("y"):
+                                                    st.write(f"**Y-axis:** {columns_used['y']}")
+                                            with col3:
+                                                if columns_used.get("color"):
+                                                    st.write(f"**Color:** {columns_used['color']}")
+                            
+                            elif "error" in plot:
+                                st.error(f"Chart Error: {plot['error']}")
+                                st.info("💡 Try asking: 'Create a bar chart showing campaigns vs revenue' or 'Show me a line graph of revenue trends'")
+                            else:
+                                st.warning("Chart data format issue - please try rephrasing your visualization request")
+                                if st.session_state.get("debug"):
                                     with st.expander("🔍 Debug: Raw chart data"):
                                         st.json(plot)
-                            except Exception as e:
-                                st.error(f"Chart rendering error: {e}")
-                                st.info("💡 Try asking: 'Create a bar chart showing...' or 'Show me a line graph of...' with more specific details")
-                        
-                        # Handle tables
-                        tables = resp_data.get("tables", [])
-                        st.session_state.last_tables = tables
-                        
-                        for table in tables:
-                            try:
-                                if "rows" in table and "columns" in table:
-                                    df = pd.DataFrame(table["rows"], columns=table["columns"])
-                                    st.dataframe(df, use_container_width=True, hide_index=True)
-                                    
-                                    csv = df.to_csv(index=False)
-                                    st.download_button(
-                                        label="📥 Download Data", 
-                                        data=csv,
-                                        file_name=f"marketing_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                        mime="text/csv"
-                                    )
-                            except Exception as e:
-                                st.error(f"Table error: {e}")
-                        
-                        st.session_state.history.append({"role": "assistant", "content": answer})
-                        
-                    else:
-                        error_msg = f"API Error ({response.status_code}): {response.text}"
-                        st.error(error_msg)
-                        st.session_state.history.append({"role": "assistant", "content": error_msg})
+                        except Exception as e:
+                            st.error(f"Chart rendering error: {e}")
+                            st.info("💡 Try asking: 'Create a bar chart showing...' or 'Show me a line graph of...' with more specific details")
+                    
+                    # Handle tables
+                    tables = resp_data.get("tables", [])
+                    st.session_state.last_tables = tables
+                    
+                    # The answer will be history turn len(history), as the replay above numbers it
+                    for j, table in enumerate(tables):
+                        try:
+                            if "rows" in table and "columns" in table:
+                                df = result_table(table)
+                                show_table(df, key=f"table_page_{len(st.session_state.history)}_{j}")
+                                
+                                st.download_button(
+                                    label="📥 Download Data", 
+                                    data=table_csv(json_hash(table), df),
+                                    file_name=f"marketing_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                                    mime="text/csv"
+                                )
+                        except Exception as e:
+                            st.error(f"Table error: {e}")
+                    
+                    append_turn("assistant", answer)
+                
+                except requests.exceptions.HTTPError as e:
+                    error_msg = f"API Error ({e.response.status_code}): {e.response.text}"
+                    st.error(error_msg)
+                    append_turn("assistant", error_msg)
                 
                 except requests.exceptions.Timeout:
                     error_msg = "Request timed out. Please try again with a simpler question."
                     st.error(error_msg)
-                    st.session_state.history.append({"role": "assistant", "content": error_msg})
+                    append_turn("assistant", error_msg)
                     
                 except Exception as e:
                     error_msg = f"Connection error: {e}"
                     st.error(error_msg)
-                    st.session_state.history.append({"role": "assistant", "content": error_msg})
+                    append_turn("assistant", error_msg)
+
 
 # --- DATA VISUALIZER TAB ---
-with tab3:
+@st.fragment
+def render_query_builder():
+    """Custom query builder; running a query reruns just this block."""
+    # Custom query builder
+    st.markdown("#### ⚙️ Custom Query Builder")
+    
+    query_col1, query_col2 = st.columns(2)
+    
+    with query_col1:
+        query_type = st.selectbox(
+            "Query Type",
+            ["KPI_SUMMARY", "TOP_CAMPAIGNS", "CHANNEL_PERFORMANCE", "SEGMENT_ANALYSIS"],
+            help="Select the type of analysis to perform"
+        )
+        
+        query_date_from = st.date_input(
+            "From Date",
+            value=DEFAULT_FROM,
+            help="Start date for the query"
+        )
+        
+    with query_col2:
+        query_segment = st.selectbox(
+            "Segment Filter",
+            [None, "Retail", "SME", "Premium"],
+            help="Filter by customer segment"
+        )
+        
+        query_date_to = st.date_input(
+            "To Date", 
+            value=DEFAULT_TO,
+            help="End date for the query"
+        )
+    
+    query_channel = st.selectbox(
+        "Channel Filter",
+        [None, "Search", "Social", "Email", "Display", "Direct"],
+        help="Filter by marketing channel"
+    )
+    
+    if st.button("🔍 Execute Query", key="custom_query"):
+        with st.spinner("Executing custom query..."):
+            try:
+                custom_filters = {
+                    "date_from": query_date_from.strftime("%Y-%m-%d"),
+                    "date_to": query_date_to.strftime("%Y-%m-%d"),
+                    "segment": query_segment,
+                    "channel": query_channel
+                }
+                
+                if query_type == "KPI_SUMMARY":
+                    result_data = fetch_kpi(filters_key(custom_filters))
+                elif query_type == "CHANNEL_PERFORMANCE":
+                    result_data = fetch_channel_performance(filters_key(custom_filters))
+                else:
+                    # For other query types, use the chat endpoint
+                    chat_message = f"Show me {query_type.lower().replace('_', ' ')} data"
+                    response = get_http().post(f"{API_BASE}/chat", 
+                        json={"message": chat_message, "filters": st.session_state.get('active_filters', custom_filters), "history": []}, 
+                        timeout=30)
+                    response.raise_for_status()
+                    result_data = orjson.loads(response.content)
+                
+                # Handle different response formats
+                if "data" in result_data:
+                    # Direct data response
+                    result_df = pa.Table.from_pylist(result_data["data"])
+                    st.success(f"Query executed successfully! Found {result_df.num_rows} records.")
+                    show_table(result_df)
+                    
+                    # Download button
+                    st.download_button(
+                        label="📥 Download Results",
+                        data=table_csv(json_hash(result_data["data"]), result_df),
+                        file_name=f"{query_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                        mime="text/csv"
+                    )
+                elif "tables" in result_data:
+                    # Chat response with tables
+                    for table in result_data["tables"]:
+                        table_df = result_table(table)
+                        st.success(f"Query executed successfully! Found {table_df.num_rows} records.")
+                        show_table(table_df)
+                else:
+                    st.warning("Query executed but returned unexpected format")
+                    st.json(result_data)
+                    
+            except Exception as e:
+                st.error(f"Query execution error: {e}")
+
+
+SCHEMA_DATA = {
+    "Column": [
+        "snapshot_date", "customer_id", "loan_id", "application_id", "campaign_name", 
+        "first_touch_channel", "mkt_cost_daily_alloc", "mkt_cost_month", "revenue_daily",
+        "funded_flag", "funded_amt", "roas", "customer_segment"
+    ],
+    "Type": [
+        "DATE", "TEXT", "TEXT", "TEXT", "TEXT", 
+        "TEXT", "REAL", "REAL", "REAL",
+        "TEXT", "REAL", "REAL", "TEXT"
+    ],
+    "Description": [
+        "Date of the marketing event",
+        "Unique customer identifier", 
+        "Loan application ID",
+        "Application reference number",
+        "Marketing campaign name",
+        "First marketing channel that touched the customer",
+        "Daily allocated marketing cost",
+        "Monthly marketing cost allocation", 
+        "Daily revenue generated",
+        "Whether the loan was funded (True/False; 1/0 once migrated)",
+        "Amount of the funded loan",
+        "Return on Advertising Spend ratio",
+        "Customer segment classification"
+    ]
+}
+
+@st.cache_resource
+def schema_frame():
+    """The schema table as a DataFrame, built once per process; treat it as read-only."""
+    return pd.DataFrame(SCHEMA_DATA)
+
+DATA_QUALITY_HTML = """
+<div style="background: #f0f9ff; padding: 1rem; border-radius: 8px; border-left: 3px solid #0ea5e9;">
+    <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
+        <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
+        <span style="font-weight: 500;">Completeness: 99.8%</span>
+    </div>
+    <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
+        <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
+        <span style="font-weight: 500;">Accuracy: 99.2%</span>
+    </div>
+    <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
+        <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
+        <span style="font-weight: 500;">Freshness: Real-time</span>
+    </div>
+    <div style="display: flex; align-items: center;">
+        <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
+        <span style="font-weight: 500;">Schema Valid: Yes</span>
+    </div>
+</div>
+"""
+
+_QUERIES_INFO = {
+    "KPI_SUMMARY": "Monthly aggregated KPIs",
+    "TOP_CAMPAIGNS": "Best performing campaigns",
+    "CHANNEL_PERFORMANCE": "Channel attribution analysis",
+    "SEGMENT_ANALYSIS": "Customer segment breakdown"
+}
+# One markdown block rather than an element per query
+AVAILABLE_QUERIES_MD = "\n\n".join(f"**{query}**  \n{description}" for query, description in _QUERIES_INFO.items())
+
+def render_visualizer():
     st.markdown("### 🔍 Data Visualizer")
     st.markdown("Explore the underlying data structure and create custom visualizations")
     
@@ -1101,207 +1618,56 @@ with tab3:
         # Schema exploration
         st.markdown("#### 📋 Database Schema")
         
-        schema_data = {
-            "Column": [
-                "snapshot_date", "customer_id", "loan_id", "application_id", "campaign_name", 
-                "first_touch_channel", "mkt_cost_daily_alloc", "mkt_cost_month", "revenue_daily",
-                "funded_flag", "funded_amt", "roas", "customer_segment"
-            ],
-            "Type": [
-                "DATE", "TEXT", "TEXT", "TEXT", "TEXT", 
-                "TEXT", "REAL", "REAL", "REAL",
-                "TEXT", "REAL", "REAL", "TEXT"
-            ],
-            "Description": [
-                "Date of the marketing event",
-                "Unique customer identifier", 
-                "Loan application ID",
-                "Application reference number",
-                "Marketing campaign name",
-                "First marketing channel that touched the customer",
-                "Daily allocated marketing cost",
-                "Monthly marketing cost allocation", 
-                "Daily revenue generated",
-                "Whether the loan was funded (True/False)",
-                "Amount of the funded loan",
-                "Return on Advertising Spend ratio",
-                "Customer segment classification"
-            ]
-        }
-        
-        schema_df = pd.DataFrame(schema_data)
-        st.dataframe(schema_df, use_container_width=True, hide_index=True)
+        st.dataframe(schema_frame(), use_container_width=True, hide_index=True)
         
         # Quick data preview
         st.markdown("#### 👀 Data Preview")
         try:
-            sample_response = requests.post(f"{API_BASE}/kpi", json={"date_from": "2025-08-01", "date_to": "2025-08-05"}, timeout=10)
-            if sample_response.status_code == 200:
-                sample_data = sample_response.json()
-                if sample_data.get("data"):
-                    sample_df = pd.DataFrame(sample_data["data"][:10])  # Show first 10 rows
-                    st.markdown("**Sample Data (First 10 rows):**")
-                    st.dataframe(sample_df, use_container_width=True, hide_index=True)
+            sample_data = fetch_kpi(filters_key({"date_from": "2025-08-01", "date_to": "2025-08-05"}), _timeout=10)
+            if sample_data.get("data"):
+                sample_df = pd.DataFrame(sample_data["data"][:10])  # Show first 10 rows
+                st.markdown("**Sample Data (First 10 rows):**")
+                st.dataframe(sample_df, use_container_width=True, hide_index=True)
         except Exception as e:
             st.error(f"Could not load sample data: {e}")
         
-        # Custom query builder
-        st.markdown("#### ⚙️ Custom Query Builder")
-        
-        query_col1, query_col2 = st.columns(2)
-        
-        with query_col1:
-            query_type = st.selectbox(
-                "Query Type",
-                ["KPI_SUMMARY", "TOP_CAMPAIGNS", "CHANNEL_PERFORMANCE", "SEGMENT_ANALYSIS"],
-                help="Select the type of analysis to perform"
-            )
-            
-            query_date_from = st.date_input(
-                "From Date",
-                value=datetime(2025, 8, 1),
-                help="Start date for the query"
-            )
-            
-        with query_col2:
-            query_segment = st.selectbox(
-                "Segment Filter",
-                [None, "Retail", "SME", "Premium"],
-                help="Filter by customer segment"
-            )
-            
-            query_date_to = st.date_input(
-                "To Date", 
-                value=datetime(2025, 9, 18),
-                help="End date for the query"
-            )
-        
-        query_channel = st.selectbox(
-            "Channel Filter",
-            [None, "Search", "Social", "Email", "Display", "Direct"],
-            help="Filter by marketing channel"
-        )
-        
-        if st.button("🔍 Execute Query", key="custom_query"):
-            with st.spinner("Executing custom query..."):
-                try:
-                    custom_filters = {
-                        "date_from": query_date_from.strftime("%Y-%m-%d"),
-                        "date_to": query_date_to.strftime("%Y-%m-%d"),
-                        "segment": query_segment,
-                        "channel": query_channel
-                    }
-                    
-                    if query_type == "KPI_SUMMARY":
-                        response = requests.post(f"{API_BASE}/kpi", json=custom_filters, timeout=15)
-                    elif query_type == "CHANNEL_PERFORMANCE":
-                        response = requests.post(f"{API_BASE}/channel-performance", json=custom_filters, timeout=15)
-                    else:
-                        # For other query types, use the chat endpoint
-                        chat_message = f"Show me {query_type.lower().replace('_', ' ')} data"
-                        response = requests.post(f"{API_BASE}/chat", 
-                            json={"message": chat_message, "filters": st.session_state.get('active_filters', custom_filters), "history": []}, 
-                            timeout=30)
-                    
-                    if response.status_code == 200:
-                        result_data = response.json()
-                        
-                        # Handle different response formats
-                        if "data" in result_data:
-                            # Direct data response
-                            result_df = pd.DataFrame(result_data["data"])
-                            st.success(f"Query executed successfully! Found {len(result_df)} records.")
-                            st.dataframe(result_df, use_container_width=True, hide_index=True)
-                            
-                            # Download button
-                            csv = result_df.to_csv(index=False)
-                            st.download_button(
-                                label="📥 Download Results",
-                                data=csv,
-                                file_name=f"{query_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                mime="text/csv"
-                            )
-                        elif "tables" in result_data:
-                            # Chat response with tables
-                            for table in result_data["tables"]:
-                                table_df = pd.DataFrame(table["rows"], columns=table["columns"])
-                                st.success(f"Query executed successfully! Found {len(table_df)} records.")
-                                st.dataframe(table_df, use_container_width=True, hide_index=True)
-                        else:
-                            st.warning("Query executed but returned unexpected format")
-                            st.json(result_data)
-                    else:
-                        st.error(f"Query failed with status {response.status_code}")
-                        
-                except Exception as e:
-                    st.error(f"Query execution error: {e}")
+        render_query_builder()
     
     with col2:
         st.markdown("#### 📈 Quick Stats")
         
         try:
             # Get overall statistics
-            stats_response = requests.post(f"{API_BASE}/kpi", json=filters, timeout=10)
-            if stats_response.status_code == 200:
-                stats_data = stats_response.json()
+            stats_data = fetch_overview(filters_key(applied_filters))[1]
+            
+            st.metric("📊 Total Records", f"{stats_data.get('row_count', 0):,}")
+            
+            stats_rows = stats_data.get("data")
+            if stats_rows:
+                total_spend = sum(row.get("marketing_spend") or 0 for row in stats_rows)
+                total_revenue = sum(row.get("revenue") or 0 for row in stats_rows)
+                total_applications = sum(row.get("applications") or 0 for row in stats_rows)
                 
-                st.metric("📊 Total Records", f"{stats_data.get('row_count', 0):,}")
+                st.metric("💰 Total Spend", f"${total_spend:,.0f}")
+                st.metric("📈 Total Revenue", f"${total_revenue:,.0f}")
+                st.metric("📋 Applications", f"{total_applications:,}")
                 
-                if stats_data.get("data"):
-                    stats_df = pd.DataFrame(stats_data["data"])
-                    
-                    if not stats_df.empty:
-                        total_spend = stats_df["marketing_spend"].sum()
-                        total_revenue = stats_df["revenue"].sum()
-                        total_applications = stats_df["applications"].sum()
-                        
-                        st.metric("💰 Total Spend", f"${total_spend:,.0f}")
-                        st.metric("📈 Total Revenue", f"${total_revenue:,.0f}")
-                        st.metric("📋 Applications", f"{total_applications:,}")
-                        
-                        if total_spend > 0:
-                            overall_roas = total_revenue / total_spend
-                            st.metric("🎯 Overall ROAS", f"{overall_roas:.3f}x")
+                if total_spend > 0:
+                    overall_roas = total_revenue / total_spend
+                    st.metric("🎯 Overall ROAS", f"{overall_roas:.3f}x")
         except:
             st.info("Stats unavailable")
         
         # Data quality indicators
         st.markdown("#### ✅ Data Quality")
-        st.markdown("""
-        <div style="background: #f0f9ff; padding: 1rem; border-radius: 8px; border-left: 3px solid #0ea5e9;">
-            <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
-                <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
-                <span style="font-weight: 500;">Completeness: 99.8%</span>
-            </div>
-            <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
-                <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
-                <span style="font-weight: 500;">Accuracy: 99.2%</span>
-            </div>
-            <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
-                <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
-                <span style="font-weight: 500;">Freshness: Real-time</span>
-            </div>
-            <div style="display: flex; align-items: center;">
-                <span style="color: #10b981; margin-right: 0.5rem;">✅</span>
-                <span style="font-weight: 500;">Schema Valid: Yes</span>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(DATA_QUALITY_HTML, unsafe_allow_html=True)
         
         # Available queries
         st.markdown("#### 🔧 Available Queries")
-        queries_info = {
-            "KPI_SUMMARY": "Monthly aggregated KPIs",
-            "TOP_CAMPAIGNS": "Best performing campaigns",
-            "CHANNEL_PERFORMANCE": "Channel attribution analysis", 
-            "SEGMENT_ANALYSIS": "Customer segment breakdown"
-        }
-        
-        for query, description in queries_info.items():
-            st.markdown(f"**{query}**  \n{description}")
+        st.markdown(AVAILABLE_QUERIES_MD)
 
 # --- DATA EXPLORER TAB ---
-with tab4:
+def render_explorer():
     st.markdown("### 🔍 Data Explorer")
     st.markdown("Explore raw data and download reports for further analysis.")
     
@@ -1313,14 +1679,13 @@ with tab4:
             st.markdown("#### 📊 Latest Query Results")
             for i, table in enumerate(st.session_state.last_tables):
                 try:
-                    df = pd.DataFrame(table["rows"], columns=table["columns"])
-                    st.markdown(f"**Table {i+1}** ({len(df)} rows)")
-                    st.dataframe(df, use_container_width=True, hide_index=True)
+                    df = result_table(table)
+                    st.markdown(f"**Table {i+1}** ({df.num_rows} rows)")
+                    show_table(df, key=f"explorer_page_{i}")
                     
-                    csv = df.to_csv(index=False)
                     st.download_button(
                         label=f"📥 Download Table {i+1}",
-                        data=csv,
+                        data=table_csv(json_hash(table), df),
                         file_name=f"table_{i+1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                         mime="text/csv",
                         key=f"table_download_{i}"
@@ -1335,27 +1700,30 @@ with tab4:
         
         # Show some basic stats
         try:
-            kpi_response = requests.post(f"{API_BASE}/kpi", json=filters, timeout=10)
-            if kpi_response.status_code == 200:
-                kpi_data = kpi_response.json()
-                total_records = kpi_data.get("row_count", 0)
-                
-                st.metric("Total Records", f"{total_records:,}")
-                st.metric("Date Range", f"{(datetime.strptime(filters['date_to'], '%Y-%m-%d') - datetime.strptime(filters['date_from'], '%Y-%m-%d')).days} days")
-                
-                if filters["segment"]:
-                    st.metric("Segment Filter", filters["segment"])
-                if filters["channel"]:
-                    st.metric("Channel Filter", filters["channel"])
+            kpi_data = fetch_overview(filters_key(applied_filters))[1]
+            total_records = kpi_data.get("row_count", 0)
+            
+            st.metric("Total Records", f"{total_records:,}")
+            st.metric("Date Range", f"{(datetime.strptime(applied_filters['date_to'], '%Y-%m-%d') - datetime.strptime(applied_filters['date_from'], '%Y-%m-%d')).days} days")
+            
+            if applied_filters["segment"]:
+                st.metric("Segment Filter", applied_filters["segment"])
+            if applied_filters["channel"]:
+                st.metric("Channel Filter", applied_filters["channel"])
         except:
             st.info("Stats unavailable")
 
+# --- ACTIVE TAB ---
+dict(zip(TAB_LABELS, [render_dashboard, render_assistant, render_visualizer, render_explorer]))[active_tab]()
+
 # --- FOOTER ---
-st.markdown("---")
-st.markdown("""
+FOOTER_HTML = """
 <div style="text-align: center; color: #6b7280; font-size: 0.85rem; padding: 1rem;">
     🚀 AI Marketing Analytics Hub | Built with LangChain & Streamlit | 
     <a href="#" style="color: #667eea;">Documentation</a> | 
     <a href="#" style="color: #667eea;">Support</a>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+"""
+
+st.markdown("---")
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
\ No newline at end of file
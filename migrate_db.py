@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Opt-in maintenance steps for the marketing database.
+
+The backend never rewrites the marketing table or builds tables of its own at runtime;
+these steps change the database, so run them on purpose (take a backup first):
+
+    python migrate_db.py --funded-flag    # store funded_flag as INTEGER 0/1
+    python migrate_db.py --daily-rollup   # (re)build the daily KPI rollup after each data load
+"""
+import argparse
+import logging
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply opt-in changes to the marketing database.")
+    parser.add_argument("--database-url", help="database to change (default: DATABASE_URL from .env)")
+    parser.add_argument("--funded-flag", action="store_true",
+                        help="convert funded_flag to INTEGER 0/1 so the templates can SUM it (rewrites the table)")
+    parser.add_argument("--daily-rollup", action="store_true",
+                        help="rebuild the daily KPI rollup that serves KPI_SUMMARY (run after every data load)")
+    args = parser.parse_args()
+
+    if not (args.funded_flag or args.daily_rollup):
+        parser.print_help()
+        return 1
+
+    # Migration steps report what they do through logging
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from sqlalchemy import create_engine
+    from backend.app.config import settings
+    from backend.app.migrations import funded_flag_is_integer, migrate_funded_flag, refresh_daily_rollup
+
+    engine = create_engine(args.database_url or settings.database_url)
+    try:
+        # funded_flag is converted first, so a rollup built in the same run uses SUM(funded_flag)
+        if args.funded_flag:
+            with engine.begin() as conn:
+                migrate_funded_flag(conn)
+                converted = funded_flag_is_integer(conn)
+            if converted:
+                print("✅ funded_flag is stored as INTEGER; restart the backend to use SUM(funded_flag)")
+            else:
+                print("⚠️  funded_flag was left as text (see the message above); the backend keeps counting it with CASE")
+
+        if args.daily_rollup:
+            with engine.begin() as conn:
+                refresh_daily_rollup(conn)
+            print("✅ Daily KPI rollup rebuilt; the backend serves KPI_SUMMARY from it within a minute")
+    except Exception as e:
+        print(f"❌ Database maintenance failed: {e}")
+        return 1
+    finally:
+        engine.dispose()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,8 +5,44 @@ This helps ensure the LLM_PROVIDER is set correctly
 """
 
 import os
+import re
 import shutil
 
+# Assignment lines (not comments) of the template keys setup fills in, rewritten in one pass
+_SETTING_LINE = re.compile(r"^(LLM_PROVIDER)=.*$", re.MULTILINE)
+
+# Menu number -> LLM_PROVIDER value
+PROVIDER_CHOICES = {"1": "openai", "2": "azure"}
+
+# Closing instructions, written out in one print; the first two steps depend on the provider
+PROVIDER_STEPS = {
+    "openai": """1. Edit .env file and add your OpenAI API key:
+   OPENAI_API_KEY=your_actual_openai_api_key_here
+
+2. Optionally change the model:
+   LLM_MODEL=gpt-4o-mini  (or gpt-4, gpt-3.5-turbo, etc.)""",
+    "azure": """1. Edit .env file and add your Azure OpenAI credentials:
+   AZURE_OPENAI_API_KEY=your_actual_azure_api_key
+   AZURE_OPENAI_ENDPOINT=https://your-resource.openai.azure.com/
+   AZURE_OPENAI_DEPLOYMENT=your-deployment-name
+
+2. Get these values from your Azure OpenAI resource in the Azure portal""",
+}
+
+NEXT_STEPS = """
+📝 Next Steps:
+==============================
+{credentials}
+
+3. Test your configuration:
+   python test_llm_init.py --live
+
+4. Start the application:
+   python start_backend.py
+   python start_frontend.py
+
+🎉 Setup complete! Don't forget to add your API keys to the .env file."""
+
 def create_env_file():
     """Create .env file from template with guided setup"""
     
@@ -26,15 +62,10 @@ def create_env_file():
     print("2. Azure OpenAI (Microsoft Azure OpenAI Service)")
     
     while True:
-        choice = input("\nChoose your provider (1 or 2): ").strip()
-        if choice == "1":
-            provider = "openai"
+        provider = PROVIDER_CHOICES.get(input("\nChoose your provider (1 or 2): ").strip())
+        if provider:
             break
-        elif choice == "2":
-            provider = "azure"
-            break
-        else:
-            print("❌ Please enter 1 or 2")
+        print("❌ Please enter 1 or 2")
     
     print(f"\n✅ Selected: {provider.upper()}")
     
@@ -47,7 +78,8 @@ def create_env_file():
         return
     
     # Update LLM_PROVIDER in template
-    env_content = template_content.replace('LLM_PROVIDER=openai', f'LLM_PROVIDER={provider}')
+    settings = {"LLM_PROVIDER": provider}
+    env_content = _SETTING_LINE.sub(lambda m: f"{m.group(1)}={settings[m.group(1)]}", template_content)
     
     # Write .env file
     try:
@@ -58,30 +90,7 @@ def create_env_file():
         print(f"❌ Error creating .env file: {e}")
         return
     
-    print("\n📝 Next Steps:")
-    print("=" * 30)
-    
-    if provider == "openai":
-        print("1. Edit .env file and add your OpenAI API key:")
-        print("   OPENAI_API_KEY=your_actual_openai_api_key_here")
-        print("\n2. Optionally change the model:")
-        print("   LLM_MODEL=gpt-4o-mini  (or gpt-4, gpt-3.5-turbo, etc.)")
-        
-    elif provider == "azure":
-        print("1. Edit .env file and add your Azure OpenAI credentials:")
-        print("   AZURE_OPENAI_API_KEY=your_actual_azure_api_key")
-        print("   AZURE_OPENAI_ENDPOINT=https://your-resource.openai.azure.com/")
-        print("   AZURE_OPENAI_DEPLOYMENT=your-deployment-name")
-        print("\n2. Get these values from your Azure OpenAI resource in the Azure portal")
-    
-    print(f"\n3. Test your configuration:")
-    print("   python test_llm_init.py")
-    
-    print(f"\n4. Start the application:")
-    print("   python start_backend.py")
-    print("   python start_frontend.py")
-    
-    print("\n🎉 Setup complete! Don't forget to add your API keys to the .env file.")
+    print(NEXT_STEPS.format(credentials=PROVIDER_STEPS[provider]))
 
 if __name__ == "__main__":
     create_env_file()
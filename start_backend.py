@@ -4,13 +4,14 @@ Startup script for the AI Marketing Chatbot backend.
 """
 import os
 import sys
-import subprocess
-from pathlib import Path
 
 def main():
+    # Both required files are checked against one read of the working directory
+    with os.scandir(".") as it:
+        entries = {entry.name for entry in it if entry.is_file()}
+    
     # Check if .env file exists
-    env_file = Path(".env")
-    if not env_file.exists():
+    if ".env" not in entries:
         print("⚠️  .env file not found!")
         print("Please copy config_template.txt to .env and update with your OpenAI API key.")
         print("\nExample:")
@@ -21,8 +22,7 @@ def main():
         return 1
     
     # Check if database exists
-    db_file = Path("marketing.db")
-    if not db_file.exists():
+    if "marketing.db" not in entries:
         print("⚠️  marketing.db not found!")
         print("Please ensure the database file is in the current directory.")
         return 1
@@ -34,17 +34,20 @@ def main():
     print()
     
     try:
-        # Start the FastAPI server
-        subprocess.run([
-            sys.executable, "-m", "uvicorn", 
-            "backend.app.main:app", 
-            "--reload", 
-            "--port", "8001",
-            "--host", "0.0.0.0"
-        ], check=True)
+        # Start the FastAPI server in this interpreter rather than through `python -m uvicorn`,
+        # so the launch does not pay for a second interpreter startup
+        import uvicorn
+        
+        uvicorn.run(
+            "backend.app.main:app",
+            reload=True,
+            port=8001,
+            host="0.0.0.0"
+        )
+        print("\n✅ Backend stopped.")
     except KeyboardInterrupt:
         print("\n✅ Backend stopped.")
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         print(f"❌ Error starting backend: {e}")
         return 1
     
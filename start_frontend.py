@@ -4,17 +4,17 @@ Startup script for the AI Marketing Chatbot frontend.
 """
 import os
 import sys
-import subprocess
+import socket
 import time
-import requests
 from pathlib import Path
 
 def check_backend():
-    """Check if backend is running"""
+    """Check if backend is running (a bare HTTP/1.0 request, so requests need not be imported)"""
     try:
-        response = requests.get("http://localhost:8001/health", timeout=2)
-        return response.status_code == 200
-    except:
+        with socket.create_connection(("localhost", 8001), timeout=2) as conn:
+            conn.sendall(b"GET /health HTTP/1.0\r\nHost: localhost\r\n\r\n")
+            return conn.recv(64).startswith((b"HTTP/1.0 200", b"HTTP/1.1 200"))
+    except OSError:
         return False
 
 def main():
@@ -39,16 +39,17 @@ def main():
     print()
     
     try:
-        # Start the Streamlit app
-        subprocess.run([
-            sys.executable, "-m", "streamlit", "run",
-            "frontend/streamlit_app.py",
-            "--server.port", "8501",
-            "--server.address", "0.0.0.0"
-        ], check=True)
+        # Start the Streamlit app in this interpreter, as `streamlit run` would, instead of
+        # spawning `python -m streamlit` and paying for a second interpreter startup
+        from streamlit.web import bootstrap
+        
+        flag_options = {"server_port": 8501, "server_address": "0.0.0.0"}
+        bootstrap.load_config_options(flag_options)
+        bootstrap.run("frontend/streamlit_app.py", False, [], flag_options)
+        print("\n✅ Frontend stopped.")
     except KeyboardInterrupt:
         print("\n✅ Frontend stopped.")
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         print(f"❌ Error starting frontend: {e}")
         return 1
     
@@ -4,20 +4,46 @@ Test script to verify SQL queries work with the database.
 """
 import os
 from datetime import datetime, timedelta
+import importlib.util
+import json
 import sys
 import sqlite3
 
 # Add the backend to the path
 sys.path.append('backend')
 
+# Row count sources, cheapest first: the count recorded when the rollup was built, the
+# estimate from ANALYZE, then a full COUNT(*) scan as a last resort
+_ROW_COUNT_QUERIES = [
+    ("SELECT source_rows FROM daily_kpi_rollup_meta", "{:,}"),
+    ("SELECT stat FROM sqlite_stat1 WHERE tbl = 'curated_pl_marketing_wide_synth' LIMIT 1", "~{:,}"),
+    ("SELECT COUNT(*) FROM curated_pl_marketing_wide_synth", "{:,}"),
+]
+
+def _row_count(cursor):
+    """Row count of the marketing table for display, without a full scan when avoidable"""
+    for query, label in _ROW_COUNT_QUERIES:
+        try:
+            row = cursor.execute(query).fetchone()
+        except sqlite3.OperationalError:
+            continue  # table not created on this database
+        if row is not None:
+            return label.format(int(str(row[0]).split()[0]))
+    return "unknown"
+
 def test_database_connection():
     """Test basic database connectivity"""
     try:
-        conn = sqlite3.connect('marketing.db', timeout=10)
+        # Read-only: the check never writes, and a missing file fails here instead of
+        # being created empty
+        conn = sqlite3.connect('file:marketing.db?mode=ro', uri=True, timeout=10)
+        conn.execute("PRAGMA mmap_size=268435456")
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM curated_pl_marketing_wide_synth")
-        count = cursor.fetchone()[0]
-        print(f"✅ Database connected. Total rows: {count:,}")
+        cursor.execute("SELECT 1 FROM curated_pl_marketing_wide_synth LIMIT 1")
+        if cursor.fetchone() is None:
+            print("✅ Database connected. Table is empty")
+        else:
+            print(f"✅ Database connected. Total rows: {_row_count(cursor)}")
         conn.close()
         return True
     except Exception as e:
@@ -27,15 +53,16 @@ def test_database_connection():
 def test_sql_queries():
     """Test the allowlisted SQL queries"""
     try:
-        # Check if dependencies are installed
-        try:
-            import sqlalchemy
-            import pandas as pd
-        except ImportError as e:
+        # Check if dependencies are installed without importing them; the tools import
+        # below is the only place the SQLAlchemy/pandas/LangChain import cost is paid
+        missing = [name for name in ("sqlalchemy", "pandas", "langchain") if importlib.util.find_spec(name) is None]
+        if missing:
             print(f"⚠️  Missing dependencies. Please run: pip install -r requirements.txt")
-            print(f"   Missing: {e}")
+            print(f"   Missing: {', '.join(missing)}")
             return True  # Not a failure, just need to install deps
             
+        from backend.app.config import settings
+        from backend.app.sql import get_sql_agent
         from backend.app.tools import query_marketing_data, analyze_data_insights
         
         # Test parameters
@@ -46,31 +73,33 @@ def test_sql_queries():
             "channel": None
         }
         
-        print("\n🧪 Testing LangChain tools...")
+        print("\n🧪 Testing SQL templates...")
         
-        # Test each tool template
+        # All templates run over a single connection and transaction
         templates = ["KPI_SUMMARY", "TOP_CAMPAIGNS", "CHANNEL_PERFORMANCE", "SEGMENT_ANALYSIS"]
         
-        for template in templates:
-            try:
-                result = query_marketing_data.invoke({
-                    "template": template,
-                    "date_from": test_params["date_from"],
-                    "date_to": test_params["date_to"],
-                    "segment": test_params["segment"],
-                    "channel": test_params["channel"]
-                })
-                
-                import json
-                data = json.loads(result)
-                if "error" in data:
-                    print(f"❌ {template}: {data['error']}")
-                else:
-                    print(f"✅ {template}: {data.get('row_count', 0)} rows returned")
-                    if data.get('columns'):
-                        print(f"   Columns: {data['columns']}")
-            except Exception as e:
-                print(f"❌ {template}: {e}")
+        try:
+            results = get_sql_agent(settings.database_url).run_many(templates, test_params)
+            for template, rows in results.items():
+                print(f"✅ {template}: {len(rows)} rows returned")
+                if rows:
+                    print(f"   Columns: {list(rows[0])}")
+        except Exception as e:
+            print(f"❌ SQL templates: {e}")
+        
+        print("\n🧪 Testing LangChain tools...")
+        
+        # One tool call covers the tool wrapper and its JSON payload
+        try:
+            result = query_marketing_data.invoke({"template": templates[0], **test_params})
+            
+            data = json.loads(result)
+            if "error" in data:
+                print(f"❌ query_marketing_data: {data['error']}")
+            else:
+                print(f"✅ query_marketing_data: {data.get('row_count', 0)} rows returned")
+        except Exception as e:
+            print(f"❌ query_marketing_data: {e}")
         
         return True
         